@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Farm2Fork.settings')
 
 application = get_wsgi_application()
+
+# Build the autocomplete index before the first request; each worker starts
+# its own sync thread on its first lookup, as a preloading master's threads
+# do not survive the fork
+from django.db import connection  # noqa: E402
+from shop.autocomplete import suggestions  # noqa: E402
+
+suggestions.start()
+# Workers forked from a preloading master must not share its connection
+connection.close()
@@ -3,7 +3,7 @@ from django.contrib import admin
 # Register your models here.
 
 from django.contrib import admin
-from .models import Seller
+from .models import Seller, SellerOrder
 
 @admin.register(Seller)
 class SellerAdmin(admin.ModelAdmin):
@@ -17,3 +17,13 @@ class SellerAdmin(admin.ModelAdmin):
             'fields': ('user', 'shop_name', 'shop_logo', 'bio', 'joined_at'),
         }),
     )
+
+
+@admin.register(SellerOrder)
+class SellerOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_number', 'seller', 'user', 'subtotal', 'item_count', 'status', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['seller', 'user']
+    search_fields = ['=order_number', 'seller__shop_name']
+    # Status changes go through shop.order_status so they are logged and rolled up
+    readonly_fields = ['order', 'seller', 'user', 'order_number', 'subtotal', 'item_count', 'status', 'created_at', 'updated_at']
@@ -18,6 +18,9 @@ class SellerLoginForm(AuthenticationForm):
     password = forms.CharField(label="Password", strip=False, widget=forms.PasswordInput)
 
 class SellerProductForm(forms.ModelForm):
+    # Opening stock only; Product.stock is not editable once it is tracked
+    stock = forms.IntegerField(min_value=0, required=False)
+
     class Meta:
         model = Product
         fields = ['title', 'regular_price', 'discounted_price', 'descriptions', 'category', 'product_image', 'tags']
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+BATCH_SIZE = 2000
+
+
+def split_orders(apps, schema_editor):
+    """One SellerOrder per (existing order, seller), with the order's current status"""
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    SellerOrder = apps.get_model('multivendor', 'SellerOrder')
+    last_id = 0
+    while True:
+        orders = {
+            row['id']: row for row in
+            Order.objects.filter(id__gt=last_id).order_by('id')
+            .values('id', 'user_id', 'order_number', 'status', 'created_at')[:BATCH_SIZE]
+        }
+        if not orders:
+            break
+        shares = (
+            OrderItem.objects.filter(order_id__in=list(orders), product__seller__isnull=False).order_by()
+            .values('order_id', 'product__seller').annotate(subtotal=Sum('subtotal'), item_count=Sum('quantity'))
+        )
+        SellerOrder.objects.bulk_create([
+            SellerOrder(
+                order_id=share['order_id'], seller_id=share['product__seller'],
+                user_id=orders[share['order_id']]['user_id'],
+                order_number=orders[share['order_id']]['order_number'],
+                subtotal=share['subtotal'], item_count=share['item_count'],
+                status=orders[share['order_id']]['status'], created_at=orders[share['order_id']]['created_at'],
+            )
+            for share in shares
+        ])
+        last_id = max(orders)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multivendor', '0001_initial'),
+        ('shop', '0010_order_status_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_number', models.CharField(max_length=20)),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], default='PENDING', max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='seller_orders', to='shop.order')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='multivendor.seller')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['seller', 'status', '-created_at'], name='sellerorder_seller_status_idx'), models.Index(fields=['seller', '-created_at'], name='sellerorder_seller_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'seller'), name='sellerorder_order_seller_uniq')],
+            },
+        ),
+        migrations.RunPython(split_orders, migrations.RunPython.noop),
+    ]
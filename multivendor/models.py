@@ -5,13 +5,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-ORDER_STATUS = (
-    ('PENDING', 'Pending'),
-    ('PROCESSING', 'Processing'),
-    ('ON_THE_WAY', 'On the Way'),
-    ('DELIVERED', 'Delivered'),
-    ('CANCELLED', 'Cancelled'),
-)
+# One set of statuses for both apps; transitions live in shop.order_status
+from shop.models import ORDER_STATUS  # noqa: F401
 
 class Seller(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='seller_account')
@@ -24,9 +19,48 @@ class Seller(models.Model):
         return self.shop_name
 
     def total_sales(self):
-        from shop.models import Order
-        return sum(order.total for order in self.orders.filter(status='DELIVERED'))
+        return self.orders.filter(status='DELIVERED').aggregate(total=models.Sum('subtotal'))['total'] or 0
 
     def order_count(self):
-        from shop.models import Order
         return self.orders.count()
+
+
+class SellerOrder(models.Model):
+    """One seller's share of an Order, created at checkout
+
+    Each seller moves its own status (shop.order_status); the parent
+    order's status is rolled up from its seller orders. Order number,
+    buyer and date are copied so seller pages never join shop_order.
+    """
+    # No database FK: shop_order is partitioned on PostgreSQL. Kept when the
+    # order is archived, so seller history and earnings do not change.
+    order = models.ForeignKey(
+        'shop.Order', on_delete=models.DO_NOTHING, related_name='seller_orders', db_constraint=False,
+    )
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='orders')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_orders')
+    order_number = models.CharField(max_length=20)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=ORDER_STATUS, default='PENDING')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Seller order list, dashboard counts and earnings
+            models.Index(fields=['seller', 'status', '-created_at'], name='sellerorder_seller_status_idx'),
+            models.Index(fields=['seller', '-created_at'], name='sellerorder_seller_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'seller'], name='sellerorder_order_seller_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_number} ({self.seller})"
+
+    def next_statuses(self):
+        """(value, label) pairs this seller order may move to next"""
+        from shop.order_status import TRANSITIONS
+        return [(value, label) for value, label in ORDER_STATUS if value in TRANSITIONS.get(self.status, ())]
@@ -1,3 +1,134 @@
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from shop.models import Order, OrderItem, Product
+from shop.order_status import record_created, transition, transition_seller_order
+from shop.tests import QueryBudgetMixin
+from .models import Seller
+
+
+class SellerQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'multivendor.urls'
+    budgets = {
+        'seller_register': 0,
+        'seller_login': 0,
+        'seller_logout': 1,
+        'seller_dashboard': 10,
+        'seller_add_product': 5,
+        'seller_orders': 5,
+        'seller_profile': 4,
+        'seller_all_products': 5,
+        'seller_product_questions': 8,
+        'seller_answer_question': 7,
+    }
+
+    def requests_for(self, data):
+        seller = data['seller']
+        return {
+            'seller_register': ('get', reverse('multivendor:seller_register'), None, None),
+            'seller_login': ('get', reverse('multivendor:seller_login'), None, None),
+            'seller_logout': ('get', reverse('multivendor:seller_logout'), None, seller),
+            'seller_dashboard': ('get', reverse('multivendor:seller_dashboard'), None, seller),
+            'seller_add_product': ('get', reverse('multivendor:seller_add_product'), None, seller),
+            'seller_orders': ('get', reverse('multivendor:seller_orders'), None, seller),
+            'seller_profile': ('get', reverse('multivendor:seller_profile'), None, seller),
+            'seller_all_products': ('get', reverse('multivendor:seller_all_products'), None, seller),
+            'seller_product_questions': ('get', reverse('multivendor:seller_product_questions'), None, seller),
+            'seller_answer_question': ('get', reverse(
+                'multivendor:seller_answer_question', args=[data['question'].pk]
+            ), None, seller),
+        }
+
+
+class SellerOrderStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller_user = User.objects.create_user('farmer', password='pw12345xx')
+        seller = Seller.objects.create(user=cls.seller_user, shop_name='Green Farm')
+        buyer = User.objects.create_user('shopper', password='pw12345xx')
+        product = Product.objects.create(
+            seller=seller, title='Mango', regular_price=100, discounted_price=80,
+            descriptions='Sweet', category='F', product_image='product_image/test.jpg',
+        )
+        cls.order = Order.objects.create(
+            user=buyer, order_number='ORDSELLER001', first_name='A', last_name='B',
+            email='a@example.com', phone='01700000000', address='Road 1', city='Dhaka',
+            country='Bangladesh', postcode='1207', payment_method='COD', subtotal=80, total=80,
+        )
+        OrderItem.objects.create(order=cls.order, product=product, quantity=1, price=80, subtotal=80)
+        other = Seller.objects.create(
+            user=User.objects.create_user('grower', password='pw12345xx'), shop_name='Blue Farm',
+        )
+        OrderItem.objects.create(
+            order=cls.order, quantity=2, price=50, subtotal=100, product=Product.objects.create(
+                seller=other, title='Rice', regular_price=60, discounted_price=50,
+                descriptions='Aromatic', category='V', product_image='product_image/test.jpg',
+            ),
+        )
+        record_created(cls.order, actor=buyer)
+
+    def setUp(self):
+        self.client.force_login(self.seller_user)
+        self.url = reverse('multivendor:seller_orders')
+
+    def test_checkout_split_per_seller(self):
+        shares = {so.seller.shop_name: so for so in self.order.seller_orders.select_related('seller')}
+        self.assertEqual(set(shares), {'Green Farm', 'Blue Farm'})
+        self.assertEqual(shares['Green Farm'].subtotal, 80)
+        self.assertEqual((shares['Blue Farm'].subtotal, shares['Blue Farm'].item_count), (100, 2))
+        self.assertEqual(self.order.status_events.count(), 3)
+
+    def test_seller_pages_do_not_join_orders(self):
+        for name in ('seller_orders', 'seller_dashboard'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'multivendor:{name}'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([q['sql'] for q in queries if '"shop_order"' in q['sql']], name)
+        self.assertEqual(response.context['earnings'], 0)
+        self.assertEqual(response.context['order_count'], 1)
+
+    def test_status_update_is_validated_and_logged(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '<option value="SHIPPED">Shipped</option>', html=True)
+        self.assertNotContains(response, '<option value="DELIVERED">Delivered</option>', html=True)
+
+        seller_order = self.order.seller_orders.get(seller__shop_name='Green Farm')
+        self.client.post(self.url, {'order_id': seller_order.pk, 'status': 'ON_THE_WAY'})
+        self.client.post(self.url, {'order_id': seller_order.pk, 'status': 'PENDING'})
+        seller_order.refresh_from_db()
+        self.assertEqual(seller_order.status, 'SHIPPED')
+        events = self.order.status_events.exclude(from_status='')
+        self.assertEqual(
+            list(events.values_list('seller__shop_name', 'from_status', 'to_status', 'source')),
+            [('Green Farm', 'PENDING', 'SHIPPED', 'seller'), (None, 'PENDING', 'PROCESSING', 'rollup')],
+        )
+
+    def test_parent_order_rolls_up_from_sellers(self):
+        green = self.order.seller_orders.get(seller__shop_name='Green Farm')
+        blue = self.order.seller_orders.get(seller__shop_name='Blue Farm')
+        transition_seller_order(green, 'SHIPPED')
+        transition_seller_order(green, 'DELIVERED')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PROCESSING')
+        transition_seller_order(blue, 'CANCELLED')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'DELIVERED')
+        self.assertEqual(self.seller_user.seller_account.total_sales(), 80)
+        # PROCESSING -> DELIVERED is not one step: the parent passes through SHIPPED
+        self.assertEqual(
+            list(self.order.status_events.filter(seller=None).values_list('to_status', flat=True)),
+            ['PENDING', 'PROCESSING', 'SHIPPED', 'DELIVERED'],
+        )
+
+    def test_order_transition_moves_seller_orders(self):
+        blue = self.order.seller_orders.get(seller__shop_name='Blue Farm')
+        transition_seller_order(blue, 'SHIPPED')
+        self.order.refresh_from_db()
+        transition(self.order, 'CANCELLED')
+        self.assertEqual(
+            dict(self.order.seller_orders.values_list('seller__shop_name', 'status')),
+            {'Green Farm': 'CANCELLED', 'Blue Farm': 'SHIPPED'},
+        )
@@ -2,12 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Seller
+from .models import Seller, SellerOrder
 from .forms import SellerRegisterForm, SellerLoginForm, SellerProductForm, SellerProfileForm
-from shop.models import Product, OrderItem, Order, ProductQuestion
+from shop.models import Product, ProductQuestion
+from shop.order_status import InvalidTransition, transition_seller_order
 from django.contrib.auth.decorators import login_required
+from django.db.models import Sum
 from django.utils import timezone
 
+
+def seller_order_queryset(seller):
+    """The seller's own part of each order (see shop.order_status.record_created)"""
+    return SellerOrder.objects.filter(seller=seller)
+
+
 def seller_register(request):
     if request.method == 'POST':
         form = SellerRegisterForm(request.POST, request.FILES)
@@ -52,11 +60,9 @@ def seller_logout(request):
 def seller_dashboard(request):
     seller = get_object_or_404(Seller, user=request.user)
     products = Product.objects.filter(seller=seller)
-    product_ids = products.values_list('id', flat=True)
-    order_items = OrderItem.objects.filter(product_id__in=product_ids)
-    orders = set(oi.order for oi in order_items)
-    earnings = sum(o.total for o in orders if hasattr(o, 'total') and getattr(o, 'status', None) == 'DELIVERED')
-    order_count = len(orders)
+    orders = seller_order_queryset(seller)
+    earnings = orders.filter(status='DELIVERED').aggregate(total=Sum('subtotal'))['total'] or 0
+    order_count = orders.count()
     return render(request, 'multivendor/seller_dashboard.html', {
         'seller': seller,
         'products': products,
@@ -73,6 +79,7 @@ def seller_add_product(request):
         if form.is_valid():
             product = form.save(commit=False)
             product.seller = seller
+            product.stock = form.cleaned_data['stock']
             product.save()
             form.save_m2m()
             messages.success(request, "Product added successfully.")
@@ -81,18 +88,6 @@ def seller_add_product(request):
         form = SellerProductForm()
     return render(request, 'multivendor/seller_add_product.html', {'form': form})
 
-@login_required
-def seller_orders(request):
-    seller = get_object_or_404(Seller, user=request.user)
-    products = Product.objects.filter(seller=seller)
-    product_ids = products.values_list('id', flat=True)
-    order_items = OrderItem.objects.filter(product_id__in=product_ids)
-    orders = set(oi.order for oi in order_items)
-    return render(request, 'multivendor/seller_orders.html', {
-        'orders': orders
-    })
-
-
 @login_required
 def seller_profile(request):
     seller = get_object_or_404(Seller, user=request.user)
@@ -110,26 +105,25 @@ def seller_profile(request):
 @login_required
 def seller_orders(request):
     seller = get_object_or_404(Seller, user=request.user)
-    products = Product.objects.filter(seller=seller)
-    product_ids = products.values_list('id', flat=True)
-    order_items = OrderItem.objects.filter(product_id__in=product_ids)
-    orders = list(set(oi.order for oi in order_items))
+    orders = seller_order_queryset(seller).select_related('user')
 
     if request.method == "POST":
         order_id = request.POST.get("order_id")
         new_status = request.POST.get("status")
-        # FIX: use .filter().distinct().first() not get_object_or_404
-        order = Order.objects.filter(id=order_id, items__product__seller=seller).distinct().first()
+        order = seller_order_queryset(seller).filter(id=order_id).first()
         if not order:
             messages.error(request, "Order not found.")
             return redirect('multivendor:seller_orders')
 
-        if new_status in ["PENDING", "ON_THE_WAY", "DELIVERED", "CANCELLED"]:
-            order.status = new_status
-            order.save()
-            messages.success(request, f"Order status updated to {new_status}.")
-        else:
+        if new_status == order.status:
+            messages.info(request, f"Order is already {order.get_status_display()}.")
+            return redirect('multivendor:seller_orders')
+        try:
+            transition_seller_order(order, new_status, actor=request.user)
+        except InvalidTransition:
             messages.error(request, "Invalid status selected.")
+        else:
+            messages.success(request, f"Order status updated to {order.get_status_display()}.")
         return redirect('multivendor:seller_orders')
 
     return render(request, 'multivendor/seller_orders.html', {
@@ -149,7 +143,7 @@ def seller_all_products(request):
 @login_required
 def seller_product_questions(request):
     seller = get_object_or_404(Seller, user=request.user)
-    questions = ProductQuestion.objects.filter(product__seller=seller)
+    questions = ProductQuestion.objects.filter(product__seller=seller).select_related('product', 'user')
     unanswered_questions = questions.filter(is_answered=False)
     answered_questions = questions.filter(is_answered=True)
     context = {
@@ -1,11 +1,41 @@
+import json
+
+from django import forms
 from django.contrib import admin
-from .models import Product, Tag, Cart, CartItem, UserProfile, Order, OrderItem, ProductQuestion
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import (
+    ORDER_STATUS, Product, Tag, Cart, CartItem, UserProfile, Order, OrderItem, ProductQuestion, ArchivedOrder,
+    OrderStatusEvent, EventCheckpoint, PriceCampaign,
+)
+from . import campaigns, inventory
+from .order_status import TRANSITIONS, allowed, bulk_transition, record_created, transition
+
+class ProductAdminForm(forms.ModelForm):
+    restock = forms.IntegerField(
+        min_value=1, required=False, help_text='Units delivered; added to the current stock',
+    )
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['id', 'title', 'category', 'regular_price', 'discounted_price']
+    form = ProductAdminForm
+    list_display = ['id', 'title', 'category', 'regular_price', 'discounted_price', 'stock']
     list_filter = ['category', 'tags']
     search_fields = ['title', 'descriptions']
+    readonly_fields = ['stock']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Stock only moves through shop.inventory, never through save()
+        if form.cleaned_data.get('restock'):
+            inventory.restock({obj.pk: form.cleaned_data['restock']})
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -21,13 +51,106 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['product', 'quantity', 'price', 'subtotal']
 
+def estimated_count(queryset):
+    """Planner row estimate for a queryset on PostgreSQL, else None
+
+    Unfiltered: pg_class.reltuples of the table and its partitions.
+    Filtered: the row estimate of the top plan node.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT SUM(GREATEST(c.reltuples, 0)) FROM pg_class c
+                WHERE c.oid = to_regclass(%s)
+                   OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+                """,
+                [queryset.model._meta.db_table] * 2,
+            )
+            return int(cursor.fetchone()[0] or 0)
+    plan = queryset.order_by().explain(format='json')
+    return int(json.loads(plan)[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Exact counts for small results, planner estimates past `exact_limit`"""
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < self.exact_limit:
+            return super().count
+        return estimate
+
+
+def status_action(status, label):
+    def action(modeladmin, request, queryset):
+        # Batched UPDATEs plus event INSERTs, also for "select all" across every page
+        moved = bulk_transition(queryset, status, actor=request.user, source='admin')
+        message = f"{moved} order(s) marked as {label.lower()}."
+        if not moved:
+            message += f" None of the selected orders can move to {label.lower()}."
+        modeladmin.message_user(request, message)
+    action.__name__ = f'mark_{status.lower()}'
+    action.short_description = f'Mark selected orders as {label.lower()}'
+    return action
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        current = self.instance.status
+        if self.instance.pk and status != current and not allowed(current, status):
+            raise forms.ValidationError(
+                f"An order cannot go from {self.instance.get_status_display()} to {dict(ORDER_STATUS)[status]}."
+            )
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ['order_number', 'user', 'email', 'total', 'status', 'payment_method', 'created_at']
-    list_filter = ['status', 'payment_method', 'shipping_method', 'created_at']
-    search_fields = ['order_number', 'user__username', 'email', 'phone']
+    list_filter = ['status', 'payment_method', 'shipping_method']
+    list_select_related = ['user']
+    # Drill down on the indexed created_at instead of a created_at list filter
+    date_hierarchy = 'created_at'
+    # Prefix match on order_number uses its varchar_pattern_ops index; username is unique-indexed
+    search_fields = ['order_number__startswith', 'user__username__exact']
+    search_help_text = 'Order number prefix (case-sensitive) or exact username'
     readonly_fields = ['order_number', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
+    actions = [
+        status_action(status, label) for status, label in ORDER_STATUS
+        if any(status in targets for targets in TRANSITIONS.values())
+    ]
+    # No COUNT(*) over the whole table, and no per-filter counts
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    paginator = EstimatedCountPaginator
+
+    def save_model(self, request, obj, form, change):
+        status = obj.status
+        if change and 'status' in form.changed_data:
+            # Save the other fields first; the status change goes through the event log
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if status != obj.status:
+            transition(obj, status, actor=request.user, source='admin')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            # Items are saved by now, so the order can be split per seller
+            record_created(form.instance, actor=request.user, source='admin')
     
     fieldsets = (
         ('Order Information', {
@@ -47,4 +170,62 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_number', 'user', 'total', 'status', 'created_at', 'archived_at', 'archive_file']
+    list_filter = ['status']
+    search_fields = ['=order_number', 'user__username']
+    readonly_fields = ['order_number', 'user', 'status', 'total', 'created_at', 'archived_at', 'data', 'archive_file']
+
+@admin.register(OrderStatusEvent)
+class OrderStatusEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order_number', 'from_status', 'to_status', 'actor', 'source', 'created_at']
+    list_filter = ['to_status', 'source']
+    list_select_related = ['actor']
+    search_fields = ['=order_number']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    # Append-only: readable in the admin, never edited there
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(EventCheckpoint)
+class EventCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'position', 'updated_at']
+
+@admin.register(PriceCampaign)
+class PriceCampaignAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'value', 'category', 'tag', 'seller', 'starts_at', 'ends_at', 'status', 'product_count']
+    list_filter = ['status', 'kind']
+    list_select_related = ['tag', 'seller']
+    readonly_fields = ['status', 'product_count', 'applied_at', 'ended_at', 'created_at']
+    actions = ['apply_now', 'roll_back']
+
+    @admin.action(description='Apply selected campaigns now')
+    def apply_now(self, request, queryset):
+        for campaign in queryset:
+            try:
+                repriced = campaigns.apply(campaign)
+            except campaigns.CampaignError as e:
+                self.message_user(request, str(e), level='warning')
+            else:
+                self.message_user(request, f"{campaign}: {repriced} product(s) repriced.")
+
+    @admin.action(description='Roll back selected campaigns')
+    def roll_back(self, request, queryset):
+        for campaign in queryset:
+            try:
+                restored = campaigns.rollback(campaign)
+            except campaigns.CampaignError as e:
+                self.message_user(request, str(e), level='warning')
+            else:
+                self.message_user(request, f"{campaign}: {restored} price(s) restored.")
+
 admin.site.register(ProductQuestion)
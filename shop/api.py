@@ -0,0 +1,256 @@
+# shop/api.py
+"""Read-only JSON catalog API
+
+    GET /api/products/?fields=id,title,discounted_price&category=F&status=organic&cursor=...
+    GET /api/products/<id>/?fields=...
+    GET /api/tags/
+    GET /api/autocomplete/?q=bott&limit=8
+
+Rows come straight from values() and are never turned into model
+instances. Ratings, tags and image URLs are added per page only when asked
+for in `fields`, with one query each. Listings take the shop page's
+filters (shop.filters) plus `category` (code or slug), `sort` (newest,
+price, -price) and `limit`, and page with an opaque `cursor` (keyset
+pagination, so deep pages cost the same as the first). Responses are
+gzipped and carry ETags from the catalog clock, so a revalidation costs one
+query. Autocomplete answers from the in-process index (shop.autocomplete)
+without touching the database.
+"""
+import base64
+import json
+from urllib.parse import urlencode
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_safe
+
+from . import autocomplete as suggest, cards, catalog_version
+from .filters import filter_products
+from .models import CATEGORY_CHOICES, Product, Tag
+from .views import CATEGORY_SLUGS
+
+
+# Field name: values() lookup. No stock: shop.inventory changes it without
+# moving the catalog clock or Product.version, so the ETags would go stale
+COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'descriptions': 'descriptions',
+    'regular_price': 'regular_price',
+    'discounted_price': 'discounted_price',
+    'category': 'category',
+    'image': 'product_image',
+    'seller_id': 'seller_id',
+    'seller': 'seller__shop_name',
+    'version': 'version',
+}
+COMPUTED = ('category_name', 'rating', 'review_count', 'tags')
+DEFAULT_FIELDS = ('id', 'title', 'regular_price', 'discounted_price', 'category', 'image', 'rating', 'review_count')
+# sort: (order_by, cursor column, descending)
+SORTS = {
+    'newest': (('-id',), None, True),
+    'price': (('discounted_price', 'id'), 'discounted_price', False),
+    '-price': (('-discounted_price', '-id'), 'discounted_price', True),
+}
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Suggestions may lag a catalog change by this long in browser caches
+SUGGEST_MAX_AGE = 60
+CATEGORY_NAMES = dict(CATEGORY_CHOICES)
+IMAGE_STORAGE = Product._meta.get_field('product_image').storage
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _fields(request):
+    names = [name for name in request.GET.get('fields', '').split(',') if name] or list(DEFAULT_FIELDS)
+    unknown = [name for name in names if name not in COLUMNS and name not in COMPUTED]
+    if unknown:
+        raise BadRequest(f"Unknown field(s): {', '.join(unknown)}")
+    return names
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort):
+    """(cursor column value, id) from a cursor made for `sort`"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest('Invalid cursor')
+    if not isinstance(values, list) or len(values) != 2:
+        raise BadRequest('Invalid cursor')
+    value, pk = values
+    # A price for the price sorts, nothing for newest; type() also rules out booleans
+    expected = (int, float) if SORTS[sort][1] else (type(None),)
+    if type(pk) is not int or type(value) not in expected:
+        raise BadRequest('Invalid cursor')
+    return value, pk
+
+
+def _after(products, sort, cursor):
+    _, column, descending = SORTS[sort]
+    value, pk = _decode_cursor(cursor, sort)
+    if column is None:
+        return products.filter(id__lt=pk)
+    past = 'lt' if descending else 'gt'
+    return products.filter(Q(**{f'{column}__{past}': value}) | Q(**{column: value, f'id__{past}': pk}))
+
+
+def serialize(rows, names):
+    """Rows (dicts of values() lookups) to API dicts with just `names`"""
+    ids = [row['id'] for row in rows]
+    rated = cards.ratings(ids) if 'rating' in names or 'review_count' in names else {}
+    tags = cards.tag_names(ids) if 'tags' in names else {}
+    items = []
+    for row in rows:
+        item = {}
+        for name in names:
+            if name == 'image':
+                item[name] = IMAGE_STORAGE.url(row['product_image']) if row['product_image'] else None
+            elif name in COLUMNS:
+                item[name] = row[COLUMNS[name]]
+            elif name == 'category_name':
+                item[name] = CATEGORY_NAMES.get(row['category'], '')
+            elif name == 'rating':
+                avg = rated.get(row['id'], {}).get('avg')
+                item[name] = round(avg, 1) if avg else 0
+            elif name == 'review_count':
+                item[name] = rated.get(row['id'], {}).get('count', 0)
+            elif name == 'tags':
+                item[name] = tags[row['id']]
+        items.append(item)
+    return items
+
+
+def _limit(request, default, maximum):
+    try:
+        limit = min(int(request.GET.get('limit', default)), maximum)
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    if limit < 1:
+        raise BadRequest('limit must be positive')
+    return limit
+
+
+def _suggestion_url(kind, pk, name):
+    if kind == 'product':
+        return reverse('product_detail', args=[pk])
+    params = {'status': name} if kind == 'tag' else {'seller': pk}
+    return f"{reverse('shop')}?{urlencode(params)}"
+
+
+def _lookups(names, *always):
+    lookups = {COLUMNS[name] for name in names if name in COLUMNS}
+    lookups.update(always)
+    if 'category_name' in names:
+        lookups.add('category')
+    return list(lookups)
+
+
+def _catalog_etag(request, *args, **kwargs):
+    return f'W/"{catalog_version.current_for(request)[0]}"'
+
+
+def _catalog_modified(request, *args, **kwargs):
+    return catalog_version.current_for(request)[1]
+
+
+def _product_validators(request, pk):
+    """(version, modified_at) of one product, or None if it does not exist"""
+    if not hasattr(request, '_product_version'):
+        request._product_version = Product.objects.filter(pk=pk).values_list('version', 'modified_at').first()
+    return request._product_version
+
+
+def _product_etag(request, pk):
+    validators = _product_validators(request, pk)
+    return validators and f'W/"p{validators[0]}"'
+
+
+def _product_modified(request, pk):
+    validators = _product_validators(request, pk)
+    return validators and validators[1]
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_modified)
+def products(request):
+    try:
+        names = _fields(request)
+        sort = request.GET.get('sort') or 'newest'
+        if sort not in SORTS:
+            raise BadRequest(f"sort must be one of: {', '.join(SORTS)}")
+        limit = _limit(request, DEFAULT_LIMIT, MAX_LIMIT)
+
+        queryset = filter_products(Product.objects.all(), request.GET)
+        category = request.GET.get('category')
+        if category:
+            queryset = queryset.filter(category=CATEGORY_SLUGS.get(category, category))
+        cursor = request.GET.get('cursor')
+        if cursor:
+            queryset = _after(queryset, sort, cursor)
+    except BadRequest as e:
+        return _error(str(e))
+
+    order_by, column, _ = SORTS[sort]
+    rows = list(queryset.order_by(*order_by).values(*_lookups(names, 'id', column or 'id'))[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        params = request.GET.copy()
+        params['cursor'] = _encode_cursor([last[column] if column else None, last['id']])
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({'results': serialize(rows, names), 'next': next_url}, encoder=DjangoJSONEncoder)
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=_product_etag, last_modified_func=_product_modified)
+def product(request, pk):
+    try:
+        names = _fields(request)
+    except BadRequest as e:
+        return _error(str(e))
+    rows = list(Product.objects.filter(pk=pk).values(*_lookups(names, 'id')))
+    if not rows:
+        return _error('Not found', status=404)
+    return JsonResponse(serialize(rows, names)[0], encoder=DjangoJSONEncoder)
+
+
+@require_safe
+@gzip_page
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_modified)
+def tags(request):
+    rows = Tag.objects.annotate(product_count=Count('product')).order_by('name').values('id', 'name', 'product_count')
+    return JsonResponse({'results': list(rows)}, encoder=DjangoJSONEncoder)
+
+
+@require_safe
+@gzip_page
+def autocomplete(request):
+    try:
+        limit = _limit(request, 8, suggest.MAX_LIMIT)
+    except BadRequest as e:
+        return _error(str(e))
+    results = [
+        {'kind': kind, 'id': pk, 'name': name, 'url': _suggestion_url(kind, pk, name)}
+        for kind, pk, name in suggest.suggestions.lookup(request.GET.get('q', ''), limit)
+    ]
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, public=True, max_age=SUGGEST_MAX_AGE)
+    return response
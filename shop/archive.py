@@ -0,0 +1,123 @@
+# shop/archive.py
+from collections import defaultdict
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import ArchivedOrder, Order, OrderItem, Product
+
+
+# Orders in these states never change again and may be archived
+CLOSED_STATUSES = ('DELIVERED', 'CANCELLED')
+
+
+def archive_path(created_at):
+    return f'orders-{created_at:%Y-%m}.jsonl.gz'
+
+
+def serialize(order, items):
+    record = {
+        'order': {field.attname: field.value_from_object(order) for field in Order._meta.concrete_fields},
+        'items': [
+            {
+                'product_id': item.product_id,
+                # Enough of the product to render order_detail if it is later deleted
+                'title': item.product.title,
+                'product_image': item.product.product_image.name,
+                'quantity': item.quantity,
+                'price': item.price,
+                'subtotal': item.subtotal,
+            }
+            for item in items
+        ],
+    }
+    return json.loads(json.dumps(record, cls=DjangoJSONEncoder))
+
+
+def archive_batch(orders, to='table'):
+    """Move `orders` (and their items) into ArchivedOrder; returns the count
+
+    Call inside a transaction. With to='jsonl' the records are appended to
+    monthly gzip files in ORDER_ARCHIVE_DIR and only an index row is kept.
+    """
+    items = defaultdict(list)
+    for item in OrderItem.objects.filter(order__in=orders).select_related('product'):
+        items[item.order_id].append(item)
+
+    rows, files = [], defaultdict(list)
+    for order in orders:
+        record = serialize(order, items[order.id])
+        row = ArchivedOrder(
+            order_number=order.order_number, user_id=order.user_id, status=order.status,
+            total=order.total, created_at=order.created_at,
+        )
+        if to == 'jsonl':
+            row.archive_file = archive_path(order.created_at)
+            files[row.archive_file].append(record)
+        else:
+            row.data = record
+        rows.append(row)
+
+    ArchivedOrder.objects.bulk_create(rows)
+    # Cascades to the items and clears ProductReview.order
+    Order.objects.filter(id__in=[order.id for order in orders]).delete()
+
+    # Last, so a batch that fails to move writes nothing. Only a failed commit
+    # leaves records behind, which the retried batch writes again; closed
+    # orders do not change, so load_record() reading the first copy is right.
+    if files:
+        os.makedirs(settings.ORDER_ARCHIVE_DIR, exist_ok=True)
+        for name, records in files.items():
+            # gzip members can be appended; readers see one continuous stream
+            with gzip.open(os.path.join(settings.ORDER_ARCHIVE_DIR, name), 'at') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+    return len(rows)
+
+
+def archive_orders(before, batch_size=500, to='table'):
+    """Archive closed orders created before `before`, one transaction per batch"""
+    pending = Order.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=before).order_by('created_at', 'id')
+    while True:
+        with transaction.atomic():
+            batch = list(pending.select_for_update(skip_locked=True)[:batch_size])
+            if not batch:
+                return
+            moved = archive_batch(batch, to)
+        yield moved
+
+
+def load_record(archived):
+    if archived.data is not None:
+        return archived.data
+    path = os.path.join(settings.ORDER_ARCHIVE_DIR, archived.archive_file)
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            if archived.order_number in line:
+                record = json.loads(line)
+                if record['order']['order_number'] == archived.order_number:
+                    return record
+    raise ArchivedOrder.DoesNotExist(f'{archived.order_number} missing from {path}')
+
+
+def restore(archived):
+    """Unsaved (order, items) instances for rendering an archived order"""
+    record = load_record(archived)
+    order = Order(**{
+        field.attname: field.to_python(record['order'][field.attname])
+        for field in Order._meta.concrete_fields if field.attname in record['order']
+    })
+    items = [
+        OrderItem(
+            order=order,
+            product=Product(id=item['product_id'], title=item['title'], product_image=item['product_image']),
+            quantity=item['quantity'],
+            price=OrderItem._meta.get_field('price').to_python(item['price']),
+            subtotal=OrderItem._meta.get_field('subtotal').to_python(item['subtotal']),
+        )
+        for item in record['items']
+    ]
+    return order, items
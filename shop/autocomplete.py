@@ -0,0 +1,268 @@
+# shop/autocomplete.py
+"""Search-as-you-type suggestions from an in-process prefix index
+
+Product titles, tag names and seller shop names are kept in one sorted
+list of (key, kind, id). An entry gets a key starting at each of its words
+("bottle gourd leep", "gourd leep", "leep"), so "gou" finds
+"Bottle_gourd_Leep". A lookup bisects for the range of keys that start with
+the query and returns the best entries in it by popularity: units sold for
+a product, and the units sold of their products for tags and sellers.
+Prefixes matching more than SCAN_LIMIT keys ("p" when half the catalog is
+"Potato ...") keep their best entries precomputed, so a lookup never looks
+at more than SCAN_LIMIT keys and never queries the database.
+
+Each process builds its own index: wsgi.py calls `suggestions.start()`,
+otherwise the first lookup builds it. shop.signals applies this process's
+Product, Tag and Seller saves and deletes once they commit. Other processes'
+writes move the catalog clock's names_version, which a sync thread polls
+every AUTOCOMPLETE_SYNC_SECONDS to rebuild in the background; lookups keep
+answering from the old index meanwhile. Reviews, questions and price changes
+do not move it. Popularity is as of the last build.
+
+After start(), the first lookup in each process starts that process's sync
+thread: a server that preloads the app forks its workers from a master
+that called start(), and threads do not survive fork().
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+import heapq
+import logging
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from multivendor.models import Seller
+
+from . import catalog_version
+from .models import OrderItem, Product, Tag
+
+logger = logging.getLogger(__name__)
+
+KINDS = {Product: 'product', Tag: 'tag', Seller: 'seller'}
+# Longer queries are matched on their first KEY_LENGTH characters
+KEY_LENGTH = 48
+MAX_LIMIT = 10
+SCAN_LIMIT = 256
+WORD = re.compile(r'[^\W_]+')
+# Sorts after every character a key can contain
+_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces ("Bottle_gourd  Leep" -> "bottle gourd leep")"""
+    return ' '.join(WORD.findall(text.casefold()))[:KEY_LENGTH]
+
+
+def keys(name):
+    words = WORD.findall(name.casefold())
+    return {' '.join(words[i:])[:KEY_LENGTH] for i in range(len(words))}
+
+
+class PrefixIndex:
+    """Sorted keys plus the best MAX_LIMIT entries of every broad prefix
+
+    Entries are (kind, id) pairs with a name and a popularity score. Not
+    thread-safe; Suggestions serialises access.
+    """
+    def __init__(self, entries=()):
+        # (kind, id): (score, name)
+        self.entries = {}
+        self.keys = []
+        # prefix: best entries, for prefixes with more than SCAN_LIMIT keys
+        self.top = {}
+        for entry, name, score in entries:
+            self.entries[entry] = (score, name)
+            self.keys.extend((key, *entry) for key in keys(name))
+        self.keys.sort()
+        self._precompute()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rank(self, entry):
+        score, name = self.entries[entry]
+        return -score, name.casefold(), entry
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.keys) if hi is None else hi
+        return bisect_left(self.keys, (prefix,), lo, hi), bisect_left(self.keys, (prefix + _END,), lo, hi)
+
+    def _best(self, lo, hi):
+        return heapq.nsmallest(MAX_LIMIT, {(kind, pk) for _, kind, pk in self.keys[lo:hi]}, key=self._rank)
+
+    def _precompute(self):
+        """Fill `top` for every prefix with more than SCAN_LIMIT keys"""
+        self.top = {}
+        stack = [('', 0, len(self.keys))]
+        while stack:
+            prefix, lo, hi = stack.pop()
+            if prefix:
+                self.top[prefix] = self._best(lo, hi)
+            depth = len(prefix)
+            i = lo
+            while i < hi:
+                key = self.keys[i][0]
+                if len(key) <= depth:
+                    i += 1
+                    continue
+                child = key[:depth + 1]
+                j = bisect_left(self.keys, (child + _END,), i, hi)
+                if j - i > SCAN_LIMIT:
+                    stack.append((child, i, j))
+                i = j
+
+    def lookup(self, query, limit=MAX_LIMIT):
+        """Best (kind, id, name) for `query`, a normalized prefix"""
+        if not query:
+            return []
+        top = self.top.get(query)
+        if top is None:
+            lo, hi = self._range(query)
+            top = self._best(lo, hi)
+            if hi - lo > SCAN_LIMIT:
+                # Grew past SCAN_LIMIT since the last build
+                self.top[query] = top
+        return [(*entry, self.entries[entry][1]) for entry in top[:limit]]
+
+    def put(self, entry, name):
+        """Add or rename an entry; it keeps its score, a new one starts at 0"""
+        old = self.entries.get(entry)
+        if old and old[1] == name:
+            return
+        score = old[0] if old else 0
+        old_keys = keys(old[1]) if old else set()
+        new_keys = keys(name)
+        for key in old_keys - new_keys:
+            del self.keys[bisect_left(self.keys, (key, *entry))]
+        for key in new_keys - old_keys:
+            insort(self.keys, (key, *entry))
+        self.entries[entry] = (score, name)
+        self._retop(entry, old_keys | new_keys, new_keys)
+
+    def remove(self, entry):
+        old = self.entries.get(entry)
+        if old is None:
+            return
+        old_keys = keys(old[1])
+        for key in old_keys:
+            del self.keys[bisect_left(self.keys, (key, *entry))]
+        self._retop(entry, old_keys, set())
+        del self.entries[entry]
+
+    def _retop(self, entry, touched, current):
+        """Update the precomputed prefixes of `touched` keys after `entry` changed"""
+        prefixes = {key[:i] for key in touched for i in range(1, len(key) + 1)} & self.top.keys()
+        for prefix in prefixes:
+            old = self.top[prefix]
+            top = [e for e in old if e != entry]
+            if any(key.startswith(prefix) for key in current):
+                top.append(entry)
+                top.sort(key=self._rank)
+                top = top[:MAX_LIMIT]
+            elif len(top) < len(old) and len(old) == MAX_LIMIT:
+                # Dropped out of a full list; the next best may be anywhere in the range
+                self.top[prefix] = self._best(*self._range(prefix))
+                continue
+            self.top[prefix] = top
+
+
+def load():
+    """A PrefixIndex of the whole catalog, in five queries"""
+    sold = dict(
+        OrderItem.objects.order_by().values('product_id').annotate(units=Sum('quantity'))
+        .values_list('product_id', 'units')
+    )
+    seller_sold, tag_sold = defaultdict(int), defaultdict(int)
+    entries = []
+    for pk, title, seller_id in Product.objects.values_list('id', 'title', 'seller_id').iterator(chunk_size=5000):
+        units = sold.get(pk, 0)
+        entries.append((('product', pk), title, units))
+        if seller_id is not None:
+            seller_sold[seller_id] += units
+    for product_id, tag_id in Product.tags.through.objects.values_list('product_id', 'tag_id').iterator(chunk_size=5000):
+        tag_sold[tag_id] += sold.get(product_id, 0)
+    entries.extend((('tag', pk), name, tag_sold[pk]) for pk, name in Tag.objects.values_list('id', 'name'))
+    entries.extend((('seller', pk), name, seller_sold[pk]) for pk, name in Seller.objects.values_list('id', 'shop_name'))
+    return PrefixIndex(entries)
+
+
+class Suggestions:
+    """The process's PrefixIndex, its lock and its catalog-clock sync"""
+    def __init__(self):
+        self.index = None
+        # CatalogClock.names_version the index reflects
+        self.version = None
+        self.lock = threading.Lock()
+        self.building = threading.Lock()
+        # Whether start() asked for a sync thread, and the process running it
+        self.syncing = False
+        self.sync_pid = None
+
+    def rebuild(self):
+        # Read the clock first: a write landing during the load moves it past
+        # this version, and the next sync picks it up
+        version = catalog_version.names()
+        index = load()
+        with self.lock:
+            self.index, self.version = index, version
+        return index
+
+    def lookup(self, query, limit=MAX_LIMIT):
+        if self.syncing and self.sync_pid != os.getpid():
+            self._start_sync()
+        if self.index is None:
+            with self.building:
+                if self.index is None:
+                    self.rebuild()
+        query = normalize(query)
+        with self.lock:
+            return self.index.lookup(query, limit)
+
+    def start(self):
+        """Build now; lookups then keep in sync with other processes' writes (wsgi.py)"""
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Could not build the autocomplete index; the first lookup will')
+        self.syncing = bool(settings.AUTOCOMPLETE_SYNC_SECONDS)
+
+    def _start_sync(self):
+        """Start this process's sync thread, once per process"""
+        with self.building:
+            if self.sync_pid == os.getpid():
+                return
+            threading.Thread(target=self._sync, name='autocomplete-sync', daemon=True).start()
+            self.sync_pid = os.getpid()
+
+    def _sync(self):
+        stop = threading.Event()
+        while not stop.wait(settings.AUTOCOMPLETE_SYNC_SECONDS):
+            try:
+                if catalog_version.names() != self.version:
+                    self.rebuild()
+            except Exception:
+                logger.exception('Autocomplete sync failed')
+            finally:
+                connection.close()
+
+    def _apply(self, change, *args):
+        def run():
+            with self.lock:
+                if self.index is not None:
+                    getattr(self.index, change)(*args)
+        transaction.on_commit(run)
+
+    def saved(self, instance):
+        kind = KINDS[type(instance)]
+        name = instance.shop_name if kind == 'seller' else instance.title if kind == 'product' else instance.name
+        self._apply('put', (kind, instance.pk), name)
+
+    def deleted(self, instance):
+        self._apply('remove', (KINDS[type(instance)], instance.pk))
+
+
+suggestions = Suggestions()
@@ -0,0 +1,178 @@
+# shop/campaigns.py
+"""Apply and roll back PriceCampaigns in bulk
+
+Prices of the whole selection are read with one values_list query into
+NumPy arrays, the new sale prices are computed vectorised, and only the
+products whose price actually drops are written, in chunked bulk_update
+calls. Every change is kept as a CampaignPrice row so rollback can restore
+the previous price. Caches hear about it once per campaign, through
+signals.catalog_changed, after the transaction commits.
+
+The selection's rows are locked while its prices are read, so an edit
+landing meanwhile waits instead of being overwritten. Products another
+active campaign holds are left out: the previous price recorded for them
+would be that campaign's sale price, and ending the two in turn would not
+restore the price from before either.
+"""
+import numpy as np
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CampaignPrice, PriceCampaign, Product
+from .signals import catalog_changed
+
+
+CHUNK_SIZE = 1000
+
+
+class CampaignError(Exception):
+    pass
+
+
+def selection(campaign):
+    products = Product.objects.all()
+    if campaign.category:
+        products = products.filter(category=campaign.category)
+    if campaign.tag_id:
+        products = products.filter(tags=campaign.tag_id)
+    if campaign.seller_id:
+        products = products.filter(seller=campaign.seller_id)
+    return products
+
+
+def sale_prices(campaign, regular):
+    """Campaign price for each regular price (NumPy array in, array out)"""
+    if campaign.kind == 'PERCENT':
+        prices = regular * (1 - float(campaign.value) / 100)
+    elif campaign.kind == 'FIXED':
+        prices = regular - float(campaign.value)
+    elif campaign.kind == 'TIERED':
+        tiers = sorted((float(low), float(pct)) for low, pct in campaign.tiers)
+        lows = np.array([low for low, _ in tiers])
+        percents = np.array([0.0] + [pct for _, pct in tiers])
+        # Index 0 is "below the first tier": no discount
+        prices = regular * (1 - percents[np.searchsorted(lows, regular, side='right')] / 100)
+    else:
+        raise CampaignError(f"Unknown campaign kind {campaign.kind!r}")
+    return np.round(np.maximum(prices, 0), 2)
+
+
+def _write(ids, prices, chunk_size):
+    for start in range(0, len(ids), chunk_size):
+        Product.objects.bulk_update(
+            [
+                Product(id=pk, discounted_price=price)
+                for pk, price in zip(ids[start:start + chunk_size].tolist(), prices[start:start + chunk_size].tolist())
+            ],
+            ['discounted_price'],
+        )
+
+
+def _changed(product_ids):
+    ids = list(product_ids)
+    if ids:
+        transaction.on_commit(lambda: catalog_changed.send(sender=PriceCampaign, product_ids=ids, names=False))
+
+
+def _locked(campaign, *statuses):
+    locked = PriceCampaign.objects.select_for_update().get(pk=campaign.pk)
+    if locked.status not in statuses:
+        raise CampaignError(f"{locked} is {locked.get_status_display().lower()}")
+    return locked
+
+
+def _held(products):
+    """Ids of `products` whose price an active campaign has replaced"""
+    return list(
+        CampaignPrice.objects.filter(campaign__status='ACTIVE', product__in=products)
+        .values_list('product_id', flat=True)
+    )
+
+
+def apply(campaign, chunk_size=CHUNK_SIZE):
+    """Put a scheduled campaign's prices live; returns the number of products repriced"""
+    with transaction.atomic():
+        campaign = _locked(campaign, 'SCHEDULED')
+        products = selection(campaign)
+        rows = list(
+            products.order_by('id').select_for_update(of=('self',))
+            .values_list('id', 'regular_price', 'discounted_price')
+        )
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        prices = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 2)
+        regular, current = prices[:, 0], prices[:, 1]
+        # Read after the lock, so a campaign that applied meanwhile is seen
+        held = np.isin(ids, np.array(_held(products), dtype=np.int64))
+
+        new = np.minimum(sale_prices(campaign, regular), current)
+        drops = (new < current) & ~held
+        ids, current, new = ids[drops], current[drops], new[drops]
+
+        _write(ids, new, chunk_size)
+        for start in range(0, len(ids), chunk_size):
+            CampaignPrice.objects.bulk_create([
+                CampaignPrice(campaign=campaign, product_id=pk, previous_price=before, campaign_price=after)
+                for pk, before, after in zip(
+                    ids[start:start + chunk_size].tolist(),
+                    current[start:start + chunk_size].tolist(),
+                    new[start:start + chunk_size].tolist(),
+                )
+            ])
+        campaign.status, campaign.applied_at, campaign.product_count = 'ACTIVE', timezone.now(), len(ids)
+        campaign.save(update_fields=['status', 'applied_at', 'product_count'])
+        _changed(ids.tolist())
+    return len(ids)
+
+
+def rollback(campaign, status='ROLLED_BACK', chunk_size=CHUNK_SIZE):
+    """Restore the prices an active campaign replaced; returns the number restored
+
+    A product whose price was changed again after the campaign applied
+    keeps that newer price.
+    """
+    with transaction.atomic():
+        campaign = _locked(campaign, 'ACTIVE')
+        rows = list(campaign.prices.order_by('product_id').values_list('product_id', 'previous_price', 'campaign_price'))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        prices = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 2)
+        current = dict(
+            Product.objects.filter(id__in=ids.tolist()).order_by('id').select_for_update()
+            .values_list('id', 'discounted_price')
+        )
+        # Deleted products read as NaN and never match
+        now_prices = np.array([current.get(pk, np.nan) for pk in ids.tolist()], dtype=np.float64)
+        untouched = np.isclose(now_prices, prices[:, 1])
+        ids, previous = ids[untouched], prices[:, 0][untouched]
+
+        _write(ids, previous, chunk_size)
+        campaign.status, campaign.ended_at = status, timezone.now()
+        campaign.save(update_fields=['status', 'ended_at'])
+        _changed(ids.tolist())
+    return len(ids)
+
+
+def run_due(now=None):
+    """Apply campaigns that have started and end those past ends_at
+
+    Returns (applied, ended) campaign counts. A campaign another runner got
+    to first fails the status check in apply/rollback and is skipped.
+    """
+    now = now or timezone.now()
+    applied = ended = 0
+    due = PriceCampaign.objects.filter(status='SCHEDULED', starts_at__lte=now).exclude(ends_at__lte=now)
+    for campaign in due.order_by('starts_at'):
+        try:
+            apply(campaign)
+            applied += 1
+        except CampaignError:
+            pass
+    for campaign in PriceCampaign.objects.filter(status='ACTIVE', ends_at__lte=now).order_by('ends_at'):
+        try:
+            rollback(campaign, status='ENDED')
+            ended += 1
+        except CampaignError:
+            pass
+    # Never started before their window closed
+    PriceCampaign.objects.filter(status='SCHEDULED', ends_at__lte=now).update(status='ENDED', ended_at=now)
+    return applied, ended
@@ -0,0 +1,83 @@
+# shop/cards.py
+"""Rendered product cards, cached per product
+
+A card's key is derived from everything it shows: the product's own
+fields (price, title, image name, ...) are hashed into it, and whatever
+lives in other tables (tags, the rating aggregate) is covered by
+Product.version, which the catalog clock (shop.catalog_version) moves when
+those change. Any change therefore lands on a new key and stale cards
+simply age out; nothing is ever deleted from the cache.
+
+A list looks all of its cards up with one get_many. Only the misses are
+rendered, with their ratings and tags fetched in one query each, and stored
+with one set_many.
+"""
+from collections import defaultdict
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Avg, Count
+from django.template.loader import render_to_string
+
+from .models import Product, ProductReview
+
+
+TEMPLATES = {
+    'card': 'shop/includes/product-card.html',
+    'compact': 'shop/includes/product-card-compact.html',
+}
+# Bump when the card templates change, so deploys do not serve old markup
+MARKUP_VERSION = 1
+TIMEOUT = 24 * 60 * 60
+
+
+def key(product, variant='card'):
+    fields = (
+        product.title, product.descriptions, product.category, product.regular_price,
+        product.discounted_price, product.product_image.name, product.version,
+    )
+    digest = hashlib.md5(repr(fields).encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'card:{MARKUP_VERSION}:{variant}:{product.pk}:{digest}'
+
+
+def ratings(ids):
+    """{product id: {'avg': ..., 'count': ...}} for products with reviews"""
+    return {
+        row['product_id']: row for row in
+        ProductReview.objects.filter(product_id__in=ids).order_by()
+        .values('product_id').annotate(avg=Avg('rating'), count=Count('id'))
+    }
+
+
+def tag_names(ids):
+    """{product id: [tag names]}, missing products map to []"""
+    tags = defaultdict(list)
+    rows = Product.tags.through.objects.filter(product_id__in=ids).order_by('tag__name')
+    for product_id, name in rows.values_list('product_id', 'tag__name'):
+        tags[product_id].append(name)
+    return tags
+
+
+def render_many(products, variant='card'):
+    """Card HTML for each product, in order"""
+    products = list(products)
+    if not products:
+        return []
+    keys = [key(product, variant) for product in products]
+    cards = cache.get_many(keys)
+    missing = [(k, product) for k, product in zip(keys, products) if k not in cards]
+    if missing:
+        ids = [product.pk for _, product in missing]
+        rated, tags = ratings(ids), tag_names(ids)
+        rendered = {}
+        for k, product in missing:
+            rating = rated.get(product.pk, {})
+            rendered[k] = render_to_string(TEMPLATES[variant], {
+                'product': product,
+                'rating': round(rating.get('avg') or 0, 1),
+                'review_count': rating.get('count', 0),
+                'tags': tags[product.pk],
+            })
+        cache.set_many(rendered, TIMEOUT)
+        cards.update(rendered)
+    return [cards[k] for k in keys]
@@ -0,0 +1,90 @@
+# shop/cart.py
+from .models import Product
+
+
+SESSION_CART_KEY = 'cart'
+
+
+class SessionCartItem:
+    """Cart line for a guest cart, shaped like CartItem for the templates"""
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    def subtotal(self):
+        """Calculate subtotal for this cart line"""
+        return self.quantity * self.product.discounted_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.title}"
+
+
+class SessionCart:
+    """Guest cart kept in the session as {product id: quantity}"""
+    def __init__(self, request):
+        self.session = request.session
+        self.data = self.session.get(SESSION_CART_KEY, {})
+
+    def save(self):
+        if self.data:
+            self.session[SESSION_CART_KEY] = self.data
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+        self.session.modified = True
+
+    def add(self, product_id, quantity=1):
+        """Add `quantity` units (at least 1) of a product"""
+        key = str(product_id)
+        self.data[key] = self.data.get(key, 0) + max(1, quantity)
+        self.save()
+        return self.data[key]
+
+    def update(self, product_id, action):
+        """Increase or decrease quantity, never below 1"""
+        key = str(product_id)
+        if key not in self.data:
+            return None
+        if action == 'increase':
+            self.data[key] += 1
+        elif action == 'decrease' and self.data[key] > 1:
+            self.data[key] -= 1
+        self.save()
+        return self.data[key]
+
+    def remove(self, product_id):
+        if self.data.pop(str(product_id), None) is not None:
+            self.save()
+
+    def clear(self):
+        self.data = {}
+        self.save()
+
+    def quantities(self):
+        """Return {product id (int): quantity}"""
+        return {int(pk): qty for pk, qty in self.data.items()}
+
+    def count(self):
+        """Total number of units in the cart, no DB access"""
+        return sum(self.data.values())
+
+    def items(self):
+        """Cart lines priced with a single in_bulk query"""
+        quantities = self.quantities()
+        if not quantities:
+            return []
+        products = Product.objects.in_bulk(list(quantities))
+        # Products deleted since they were added are dropped silently
+        return [
+            SessionCartItem(products[pk], qty)
+            for pk, qty in quantities.items() if pk in products
+        ]
+
+    def total(self, items=None):
+        """Calculate total cart value"""
+        if items is None:
+            items = self.items()
+        return sum(item.subtotal() for item in items)
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,131 @@
+# shop/catalog_version.py
+"""Monotonic catalog version, for HTTP validators and cache keys
+
+Every catalog write (shop.signals: products, tags, reviews, questions and
+catalog_changed) advances the single CatalogClock row and stamps the
+products it touched with the new version, so Product.version only ever
+grows and never exceeds the global one. Writes that may change a product
+title, tag name or seller shop name also advance names_version, which
+in-process name indexes (shop.autocomplete) follow instead, and writes
+that may change what the price facets count advance prices_version.
+
+Home, listings and product detail answer conditional GETs from the clock
+alone via `conditional`: one small query instead of the whole view. Only
+anonymous visitors get validators; logged-in pages also show carts, orders
+and review eligibility, which the clock does not follow. The product detail
+page lists featured and related products as well, so it follows the global
+version too. Per-product versions key the product cards.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, QuerySet
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import CatalogClock, Product
+
+
+def tick(products=None, names=False, prices=False):
+    """Advance the clock; stamp `products` (ids or a queryset) with the new version
+
+    `names`: the write may have renamed, added or removed a product, tag or seller.
+    `prices`: it may have changed a price, category or tag link, or added or removed a product.
+    """
+    now = timezone.now()
+    moved = {'version': F('version') + 1, 'changed_at': now}
+    if names:
+        moved['names_version'] = F('names_version') + 1
+    if prices:
+        moved['prices_version'] = F('prices_version') + 1
+    with transaction.atomic():
+        if not CatalogClock.objects.filter(pk=1).update(**moved):
+            try:
+                with transaction.atomic():
+                    CatalogClock.objects.create(
+                        pk=1, version=1, changed_at=now, names_version=int(names), prices_version=int(prices),
+                    )
+            except IntegrityError:
+                # Created concurrently
+                CatalogClock.objects.filter(pk=1).update(**moved)
+        version = CatalogClock.objects.values_list('version', flat=True).get(pk=1)
+        if products is not None:
+            if not isinstance(products, QuerySet):
+                products = Product.objects.filter(pk__in=list(products))
+            products.update(version=version, modified_at=now)
+    return version
+
+
+def _read(*fields):
+    row = CatalogClock.objects.filter(pk=1).values_list(*fields).first()
+    return row or (0, None, 0)[:len(fields)]
+
+
+def current():
+    """(version, changed_at) of the whole catalog"""
+    return _read('version', 'changed_at')
+
+
+def names():
+    """names_version of the catalog"""
+    return _read('names_version')[0]
+
+
+def prices():
+    """prices_version of the catalog"""
+    return _read('prices_version')[0]
+
+
+def _read_for(request):
+    """(version, changed_at, prices_version), read once per request"""
+    if not hasattr(request, '_catalog_version'):
+        request._catalog_version = _read('version', 'changed_at', 'prices_version')
+    return request._catalog_version
+
+
+def current_for(request):
+    """current(), read once per request (condition asks for ETag and Last-Modified separately)"""
+    return _read_for(request)[:2]
+
+
+def prices_for(request):
+    """prices(), from the same read as current_for()"""
+    return _read_for(request)[2]
+
+
+def _validators(request):
+    """(etag, last_modified) for an anonymous request, (None, None) otherwise"""
+    if not hasattr(request, '_catalog_validators'):
+        validators = (None, None)
+        if not request.user.is_authenticated and 'messages' not in request.COOKIES:
+            version, changed_at = current_for(request)
+            if not request.COOKIES:
+                # No cart and no CSRF secret yet: every cookieless client (a CDN)
+                # gets the same page, whose token is minted fresh for each render,
+                # so the version alone validates it. Last-Modified cannot tell
+                # cookie holders apart, so only these clients get it
+                validators = (f'W/"{version}"', changed_at)
+            else:
+                # The page embeds the guest cart (signed-cookie session) and a CSRF
+                # token; taking the token now fixes the secret a missing CSRF
+                # cookie will get
+                get_token(request)
+                state = f"{request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')}|{request.META['CSRF_COOKIE']}"
+                digest = hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()[:12]
+                # Weak, as every render masks the CSRF token differently
+                validators = (f'W/"{version}-{digest}"', None)
+        request._catalog_validators = validators
+    return request._catalog_validators
+
+
+def etag(request, *args, **kwargs):
+    return _validators(request)[0]
+
+
+def last_modified(request, *args, **kwargs):
+    return _validators(request)[1]
+
+
+conditional = condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,60 @@
+# shop/checks.py
+import os
+
+from django.conf import settings
+from django.core.checks import Info, Tags, Warning, register
+
+
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+def compression_savings(root):
+    """(files, original bytes, bytes saved) for files with .gz/.br siblings
+
+    Savings count the smallest variant, which is what a client accepting
+    both encodings receives.
+    """
+    files = original = saved = 0
+    for dirpath, _, filenames in os.walk(root):
+        names = set(filenames)
+        for name in filenames:
+            if name.endswith(COMPRESSED_SUFFIXES):
+                continue
+            variants = [name + suffix for suffix in COMPRESSED_SUFFIXES if name + suffix in names]
+            if not variants:
+                continue
+            size = os.path.getsize(os.path.join(dirpath, name))
+            smallest = min(os.path.getsize(os.path.join(dirpath, v)) for v in variants)
+            files += 1
+            original += size
+            saved += size - smallest
+    return files, original, saved
+
+
+@register(Tags.staticfiles)
+def check_static_compression(app_configs, **kwargs):
+    """Report what collectstatic precompression saves on the wire"""
+    manifest = os.path.join(settings.STATIC_ROOT, 'staticfiles.json')
+    if not os.path.exists(manifest):
+        return []
+    files, original, saved = compression_savings(settings.STATIC_ROOT)
+    if not original:
+        return []
+    return [Info(
+        f'Static files: {files} precompressed, {saved / 1024:.0f} KiB saved of '
+        f'{original / 1024:.0f} KiB ({saved / original:.0%}).',
+        id='shop.I001',
+    )]
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_static_manifest(app_configs, **kwargs):
+    manifest = os.path.join(settings.STATIC_ROOT, 'staticfiles.json')
+    if os.path.exists(manifest):
+        return []
+    return [Warning(
+        'STATIC_ROOT has no staticfiles.json, so static files are served '
+        'without content hashes, precompression or long-lived caching.',
+        hint='Run `manage.py collectstatic` as part of the deploy.',
+        id='shop.W001',
+    )]
@@ -1,4 +1,5 @@
 from .models import Cart
+from .cart import SessionCart
 
 def cart_item_count(request):
     count = 0
@@ -8,4 +9,6 @@ def cart_item_count(request):
             count = sum(item.quantity for item in cart.items.all())
         except:
             pass  # No cart or some error, keep count 0
+    elif hasattr(request, 'session'):
+        count = SessionCart(request).count()
     return {'cart_item_count': count}
@@ -0,0 +1,90 @@
+# shop/db_routers.py
+from contextvars import ContextVar
+from itertools import count
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Models served from replicas; everything else stays on the primary
+CATALOG_MODELS = {
+    'shop.product',
+    'shop.product_tags',
+    'shop.tag',
+    'shop.productreview',
+    'shop.productquestion',
+}
+PIN_COOKIE = 'use_primary'
+
+
+class PinState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('replica_pin_state', default=None)
+_counter = count()
+
+
+def pin_to_primary():
+    """Read catalog data from the primary for the rest of this request and the pin window"""
+    state = _state.get()
+    if state is None:
+        state = PinState()
+        _state.set(state)
+    state.pinned = True
+    state.wrote = True
+
+
+class CatalogReplicaRouter:
+    """Send catalog reads to replicas, round-robin
+
+    Reads stay on the primary inside transaction.atomic() blocks and while
+    the current user is pinned after writing catalog data themselves.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in CATALOG_MODELS:
+            return None
+        state = _state.get()
+        if (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replicas[next(_counter) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Keep a user on the primary for REPLICA_PIN_SECONDS after their own catalog write"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = PinState(pinned=request.COOKIES.get(PIN_COOKIE) == '1')
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
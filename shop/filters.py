@@ -0,0 +1,58 @@
+# shop/filters.py
+import math
+
+from django.db.models import Q
+
+from .models import Product
+
+# Prices are shown with two decimals
+CENT = 0.01
+
+
+def filter_products(products, params):
+    """The shop page's price, tag ("status"), seller and search filters, from a QueryDict
+
+    `price` is an upper bound in whole taka (the sidebar slider);
+    `min_price` and `max_price` bound a range, both inclusive. `max_price`
+    takes in its whole cent, so a max of 49.99 keeps a stored 49.995 as
+    shown, and stops where the next price band (shop.price_facets) starts.
+
+    Tags are matched through a subquery rather than a join, so there are no
+    duplicate rows to remove with DISTINCT.
+    """
+    price = params.get('price')
+    if price:
+        try:
+            products = products.filter(discounted_price__lte=int(price))
+        except (ValueError, TypeError):
+            pass
+    for param in ('min_price', 'max_price'):
+        try:
+            bound = float(params.get(param) or 'nan')
+        except ValueError:
+            continue
+        if not math.isfinite(bound):
+            continue
+        if param == 'min_price':
+            products = products.filter(discounted_price__gte=bound)
+        else:
+            products = products.filter(discounted_price__lt=round(bound + CENT, 2))
+
+    status_list = params.getlist('status')
+    if status_list:
+        q = Q()
+        for status in status_list:
+            q |= Q(tag__name__iexact=status)
+        products = products.filter(pk__in=Product.tags.through.objects.filter(q).values('product_id'))
+
+    seller = params.get('seller')
+    if seller:
+        try:
+            products = products.filter(seller_id=int(seller))
+        except (ValueError, TypeError):
+            pass
+
+    search = params.get('search')
+    if search:
+        products = products.filter(Q(title__icontains=search) | Q(descriptions__icontains=search))
+    return products
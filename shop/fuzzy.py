@@ -0,0 +1,254 @@
+# shop/fuzzy.py
+"""Typo-tolerant product search
+
+search(query) ranks products whose titles are close to the query rather
+than containing it, so "bitrot" finds "Bitroot" and "botle gourd" finds
+"Bottle_gourd_Leep".
+
+On PostgreSQL with pg_trgm installed this is the word similarity operator
+(`title %> query`) over the product_title_trgm_idx GIN index from migration
+0016, ranked by word_similarity(). Elsewhere (SQLite, or PostgreSQL without
+the extension) TrigramIndex does the same in process: every title word is
+split into trigrams the way pg_trgm does, each query word is matched against
+the vocabulary by Jaccard similarity of the trigram sets, and a product
+scores the sum over query words of its best matching word. The index is
+built on the first search and brought up to date from Product.version
+(shop.catalog_version) whenever the catalog clock has moved, so it costs
+each search one small query.
+
+Given a filtered queryset, search() ranks only the products in it, so a
+category or price filter never leaves the best matches outside the top
+LIMIT. The in-process index checks its ranking against the queryset in
+chunks of FILTER_CHUNK ids until it has enough.
+
+did_you_mean() rewrites a query's unknown words into the closest words of
+the titles found.
+"""
+from collections import Counter, defaultdict
+import heapq
+import re
+import threading
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, When
+
+from . import catalog_version
+from .models import Product
+
+INDEX_NAME = 'product_title_trgm_idx'
+LIMIT = 100
+FILTER_CHUNK = 500
+# Least Jaccard similarity of trigram sets for a word to count as a match
+THRESHOLD = 0.3
+# pg_trgm.word_similarity_threshold for the operator (pg_trgm's default is 0.6)
+WORD_SIMILARITY = 0.45
+WORD = re.compile(r'[^\W_]+')
+LETTER = re.compile(r'[^\W\d_]')
+
+# database alias: whether pg_trgm is installed there
+_trigram_enabled = {}
+
+
+def trigrams(word):
+    """pg_trgm's trigrams of one lowercase word: padded with two spaces in front, one behind"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def words(text):
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+def install_trigram_index(connection):
+    """Create pg_trgm and the title index if the server has the extension; returns whether it did"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON shop_product USING gin (title gin_trgm_ops)'
+        )
+    return True
+
+
+def trigram_enabled(using):
+    if using not in _trigram_enabled:
+        connection = connections[using]
+        enabled = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                enabled = cursor.fetchone() is not None
+        _trigram_enabled[using] = enabled
+    return _trigram_enabled[using]
+
+
+class TrigramIndex:
+    """Title words by trigram and products by word, for one process"""
+    def __init__(self):
+        self.version = None
+        # product id: words of its title
+        self.titles = {}
+        # word: product ids
+        self.products = defaultdict(set)
+        # trigram: words containing it; word: its trigrams. Only words with a
+        # letter are matched fuzzily, so "123" never finds "124"
+        self.grams = defaultdict(set)
+        self.word_grams = {}
+        self.lock = threading.Lock()
+
+    def add(self, pk, title):
+        self.remove(pk)
+        title_words = set(words(title))
+        self.titles[pk] = title_words
+        for word in title_words:
+            if not self.products[word] and LETTER.search(word):
+                self.word_grams[word] = trigrams(word)
+                for gram in self.word_grams[word]:
+                    self.grams[gram].add(word)
+            self.products[word].add(pk)
+
+    def remove(self, pk):
+        for word in self.titles.pop(pk, ()):
+            self.products[word].discard(pk)
+            if not self.products[word]:
+                del self.products[word]
+                for gram in self.word_grams.pop(word, ()):
+                    self.grams[gram].discard(word)
+                    if not self.grams[gram]:
+                        del self.grams[gram]
+
+    def similar(self, word):
+        """[(vocabulary word, similarity)] for one query word, best first"""
+        if not LETTER.search(word):
+            return [(word, 1.0)] if word in self.products else []
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        matches = []
+        for candidate, common in shared.items():
+            similarity = common / (len(grams) + len(self.word_grams[candidate]) - common)
+            if similarity >= THRESHOLD:
+                matches.append((candidate, similarity))
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def search(self, query, limit=LIMIT):
+        """[(product id, score)], best first; every match if `limit` is None"""
+        scores = defaultdict(float)
+        for word in dict.fromkeys(words(query)):
+            best = {}
+            for candidate, similarity in self.similar(word):
+                for pk in self.products[candidate]:
+                    best.setdefault(pk, similarity)
+            for pk, similarity in best.items():
+                scores[pk] += similarity
+        rank = lambda item: (-item[1], item[0])
+        if limit is None:
+            return sorted(scores.items(), key=rank)
+        return heapq.nsmallest(limit, scores.items(), key=rank)
+
+    def sync(self, using):
+        """Catch up with the catalog clock; one query when nothing changed"""
+        version = catalog_version.current()[0]
+        if version == self.version:
+            return
+        products = Product.objects.using(using)
+        if self.version is None:
+            changed = products.values_list('id', 'title').iterator(chunk_size=5000)
+        else:
+            changed = products.filter(version__gt=self.version).values_list('id', 'title')
+        for pk, title in changed:
+            self.add(pk, title)
+        if products.count() != len(self.titles):
+            # Deleted, or created without moving the clock (bulk_create)
+            ids = set(products.values_list('id', flat=True))
+            for pk in self.titles.keys() - ids:
+                self.remove(pk)
+            for pk, title in products.filter(id__in=ids - self.titles.keys()).values_list('id', 'title'):
+                self.add(pk, title)
+        self.version = version
+
+
+index = TrigramIndex()
+
+
+def _within(ranked, products, limit):
+    """The first `limit` of `ranked` that are in `products`, checked FILTER_CHUNK ids at a time"""
+    found = []
+    for start in range(0, len(ranked), FILTER_CHUNK):
+        chunk = ranked[start:start + FILTER_CHUNK]
+        allowed = set(products.filter(id__in=[pk for pk, _ in chunk]).values_list('id', flat=True))
+        found.extend(item for item in chunk if item[0] in allowed)
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def search(query, limit=LIMIT, products=None):
+    """[(product id, similarity)] of products whose titles are close to `query`, best first
+
+    `products`: a Product queryset to rank within (default: the whole catalog).
+    """
+    if not words(query):
+        return []
+    using = router.db_for_read(Product)
+    if trigram_enabled(using):
+        # The threshold is local to this transaction, so it never stays on a
+        # pooled connection for whoever uses it next
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(WORD_SIMILARITY)],
+                )
+            return list(
+                (Product.objects.all() if products is None else products).using(using).order_by()
+                .filter(TrigramWordSimilar(F('title'), query))
+                .annotate(similarity=TrigramWordSimilarity(query, 'title'))
+                .order_by('-similarity', 'id')
+                .values_list('id', 'similarity')[:limit]
+            )
+    with index.lock:
+        index.sync(using)
+        ranked = index.search(query, limit if products is None else None)
+    return ranked if products is None else _within(ranked, products, limit)
+
+
+def did_you_mean(query, titles):
+    """`query` with each word no title contains replaced by the closest title word, or None"""
+    vocabulary = {}
+    for title in titles:
+        for word in WORD.findall(title):
+            vocabulary.setdefault(word.casefold(), word)
+    corrected, changed = [], False
+    for word in WORD.findall(query):
+        key = word.casefold()
+        if key not in vocabulary and LETTER.search(key) and vocabulary:
+            grams = trigrams(key)
+            best = max(vocabulary, key=lambda candidate: jaccard(grams, trigrams(candidate)))
+            if jaccard(grams, trigrams(best)) >= THRESHOLD:
+                corrected.append(vocabulary[best])
+                changed = True
+                continue
+        corrected.append(word)
+    return ' '.join(corrected) if changed else None
+
+
+def search_products(products, query, limit=LIMIT):
+    """(`products` narrowed to fuzzy matches of `query` in rank order, did-you-mean text or None)"""
+    ids = [pk for pk, _ in search(query, limit, products)]
+    if not ids:
+        return products.none(), None
+    ranked = products.filter(id__in=ids).order_by(
+        Case(*(When(id=pk, then=rank) for rank, pk in enumerate(ids)), output_field=IntegerField())
+    )
+    titles = ranked.values_list('title', flat=True)[:5]
+    return ranked, did_you_mean(query, titles)
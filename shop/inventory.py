@@ -0,0 +1,163 @@
+# shop/inventory.py
+"""Product stock without read-modify-write races
+
+Stock only moves through one conditional UPDATE per call, covering every
+cart line at once:
+
+    UPDATE shop_product SET stock = stock - CASE id WHEN 1 THEN 2 ... END
+    WHERE id IN (1, ...) AND (stock IS NULL OR stock >= CASE id WHEN 1 THEN 2 ... END)
+
+If fewer rows match than there are lines, some line is short and the
+whole change is rolled back. A NULL stock (not tracked) always matches and
+stays NULL. Concurrent checkouts of one product queue on its row lock and
+re-check the WHERE clause once the previous one commits, so stock can run
+out but never below zero.
+
+Checkout reserves its lines for STOCK_RESERVATION_MINUTES (reserve), then
+turns the reservation into the order (commit). `manage.py
+release_reservations` hands expired reservations back to stock. New
+deliveries are added with restock(); Product.save() never writes stock.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, shortages):
+        # [(product, units available)]
+        self.shortages = shortages
+        names = ', '.join(f"{product.title} (only {available} left)" for product, available in shortages)
+        super().__init__(f"Not enough stock: {names}" if names else "Not enough stock")
+
+
+def _per_product(lines):
+    return Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in lines.items()], output_field=IntegerField())
+
+
+def shortages(lines):
+    """[(product, available)] for lines that the current stock cannot cover"""
+    products = Product.objects.filter(pk__in=lines, stock__isnull=False).only('id', 'title', 'stock')
+    return [(product, product.stock) for product in products if product.stock < lines[product.pk]]
+
+
+def take(lines):
+    """Remove {product id: quantity} from stock in one UPDATE; raises OutOfStock"""
+    lines = {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+    if not lines:
+        return
+    with transaction.atomic():
+        per_product = _per_product(lines)
+        updated = (
+            Product.objects.filter(pk__in=lines)
+            .filter(Q(stock__isnull=True) | Q(stock__gte=per_product))
+            .update(stock=F('stock') - per_product)
+        )
+        if updated != len(lines):
+            transaction.set_rollback(True)
+    if updated != len(lines):
+        raise OutOfStock(shortages(lines))
+
+
+def give_back(lines):
+    """Return {product id: quantity} to stock in one UPDATE"""
+    lines = {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+    if lines:
+        Product.objects.filter(pk__in=lines).update(stock=F('stock') + _per_product(lines))
+
+
+def restock(lines):
+    """Add {product id: quantity} to stock in one UPDATE; untracked stock starts at the quantity"""
+    lines = {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+    if lines:
+        Product.objects.filter(pk__in=lines).update(stock=Coalesce(F('stock'), 0) + _per_product(lines))
+
+
+def _extend(user, expires_at):
+    """Move the user's reservation to `expires_at`, locking its rows; returns how many there are"""
+    return StockReservation.objects.filter(user=user).update(expires_at=expires_at)
+
+
+def _held(user):
+    return dict(StockReservation.objects.filter(user=user).select_for_update().values_list('product_id', 'quantity'))
+
+
+def _settle(user, lines, held):
+    """Swap the user's reservation `held` for `lines`: take or give back only the difference
+
+    The reservation rows must already be locked, so the sweeper (which
+    skips locked rows) cannot hand the same units back meanwhile.
+    """
+    take({pk: quantity - held.get(pk, 0) for pk, quantity in lines.items()})
+    give_back({pk: quantity - lines.get(pk, 0) for pk, quantity in held.items()})
+    if held:
+        StockReservation.objects.filter(user=user).delete()
+
+
+def reserve(user, lines, minutes=None, attempts=2):
+    """Hold {product id: quantity} for `user`; raises OutOfStock
+
+    Replaces the user's previous reservation. Reserving the same lines
+    again only extends it. Two concurrent calls for one user (two checkout
+    tabs) may both find nothing held; the second to insert hits
+    reservation_user_product_uniq, rolls back and retries against the
+    rows the first one committed.
+    """
+    minutes = minutes if minutes is not None else settings.STOCK_RESERVATION_MINUTES
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+    lines = {pk: quantity for pk, quantity in lines.items() if quantity > 0}
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                # Extending also locks the rows; nothing extended means nothing held
+                held = _held(user) if _extend(user, expires_at) else {}
+                if held == lines:
+                    return
+                _settle(user, lines, held)
+                StockReservation.objects.bulk_create([
+                    StockReservation(product_id=pk, user=user, quantity=quantity, expires_at=expires_at)
+                    for pk, quantity in lines.items()
+                ])
+                return
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+def commit(user, lines):
+    """Stock for an order being placed: the user's reservation, topped up or trimmed to `lines`
+
+    Call inside the transaction that creates the order.
+    """
+    _settle(user, {pk: quantity for pk, quantity in lines.items() if quantity > 0}, _held(user))
+
+
+def release_expired(batch_size=500, now=None):
+    """Hand expired reservations back to stock; returns how many were released
+
+    Each batch is locked with SKIP LOCKED, so several sweepers can run at
+    once and none waits on a checkout that is committing its reservation.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.filter(expires_at__lte=now).order_by('expires_at')
+                .select_for_update(skip_locked=True).values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return released
+            lines = defaultdict(int)
+            for _, product_id, quantity in batch:
+                lines[product_id] += quantity
+            give_back(lines)
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in batch]).delete()
+        released += len(batch)
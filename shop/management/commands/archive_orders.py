@@ -0,0 +1,47 @@
+# shop/management/commands/archive_orders.py
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from shop import partitions
+from shop.archive import CLOSED_STATUSES, archive_orders
+from shop.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Move closed orders older than N months into ArchivedOrder (or gzipped JSONL); '
+        'order_detail keeps finding them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help='Keep orders from the last N whole months')
+        parser.add_argument('--to', choices=['table', 'jsonl'], default='table')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months must be at least 1')
+        # A month boundary, so archived months leave whole partitions empty
+        month = partitions.add_months(partitions.month_start(timezone.now()), -options['months'])
+        before = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+        if options['dry_run']:
+            count = Order.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=before).count()
+            self.stdout.write(f'{count} closed orders created before {before:%Y-%m-%d} would be archived.')
+            return
+
+        total = 0
+        for moved in archive_orders(before, options['batch_size'], options['to']):
+            total += moved
+            self.stdout.write(f'\rArchived {total}', ending='')
+        self.stdout.write('')
+
+        if partitions.is_partitioned(connection):
+            with transaction.atomic():
+                for name in partitions.drop_empty_partitions(connection, before):
+                    self.stdout.write(f'Dropped empty partition {name}')
+        self.stdout.write(self.style.SUCCESS(f'{total} orders created before {before:%Y-%m-%d} archived.'))
@@ -0,0 +1,118 @@
+# shop/management/commands/bench_fuzzy.py
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from shop import fuzzy
+from shop.management.commands.loadtest import percentile
+from shop.models import Product
+
+
+def misspell(word, rng):
+    """One random deletion, insertion, substitution or transposition"""
+    i = rng.randrange(len(word))
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    edit = rng.choice(['delete', 'insert', 'substitute', 'transpose'] if len(word) > 1 else ['insert', 'substitute'])
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'insert':
+        return word[:i] + rng.choice(letters) + word[i:]
+    if edit == 'substitute':
+        return word[:i] + rng.choice(letters.replace(word[i], '')) + word[i + 1:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+class Command(BaseCommand):
+    help = (
+        'Search for misspelled product titles and report recall and latency of fuzzy search '
+        '(shop.fuzzy) against the icontains search as JSON. Run on a seeded catalog, '
+        'e.g. `seed_load_data --products 100000`'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--top', type=int, default=10, help='Results that count for recall')
+        parser.add_argument('--min-length', type=int, default=4, help='Only misspell words at least this long')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = Product.objects.count()
+        if not count:
+            raise CommandError('No products; run seed_load_data first.')
+        queries = self.queries(rng, options['queries'], options['min_length'])
+        if not queries:
+            raise CommandError(f"No title has a word of {options['min_length']}+ letters.")
+
+        started = time.perf_counter()
+        fuzzy.search('warm up')
+        warmup = time.perf_counter() - started
+
+        top = options['top']
+        using = router.db_for_read(Product)
+        results = {
+            'database': connections[using].vendor,
+            'backend': 'pg_trgm' if fuzzy.trigram_enabled(using) else 'in-process trigrams',
+            'products': count,
+            'queries': len(queries),
+            'top': top,
+            # First search builds the in-process index
+            'warmup_s': round(warmup, 2),
+            'fuzzy': self.run(queries, top, lambda q: [pk for pk, _ in fuzzy.search(q, top)]),
+            'icontains': self.run(queries, top, lambda q: list(
+                Product.objects.filter(title__icontains=q).order_by('id').values_list('id', flat=True)[:top]
+            )),
+        }
+        results['fuzzy']['did_you_mean'] = self.did_you_mean(queries, top)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def queries(self, rng, n, min_length):
+        """[(misspelled query, original word, the rest of the query)]"""
+        ids = list(Product.objects.values_list('id', flat=True))
+        titles = dict(Product.objects.filter(id__in=rng.sample(ids, min(n * 2, len(ids)))).values_list('id', 'title'))
+        queries = []
+        for title in titles.values():
+            words = fuzzy.words(title)
+            long = [i for i, word in enumerate(words) if len(word) >= min_length and word.isalpha()]
+            if not long:
+                continue
+            i = rng.choice(long)
+            # The misspelled word plus at most one more word of the title
+            rest = [word for j, word in enumerate(words) if j != i][:1]
+            queries.append((' '.join([misspell(words[i], rng), *rest]), words[i], rest))
+            if len(queries) == n:
+                break
+        return queries
+
+    def run(self, queries, top, search):
+        """Recall: share of queries with a top result containing the original word and the rest"""
+        latencies, hits = [], 0
+        for query, word, rest in queries:
+            started = time.perf_counter()
+            ids = search(query)
+            latencies.append(time.perf_counter() - started)
+            titles = Product.objects.filter(id__in=ids).values_list('title', flat=True)
+            if any({word, *rest} <= set(fuzzy.words(title)) for title in titles):
+                hits += 1
+        latencies.sort()
+        return {
+            f'recall_at_{top}': round(hits / len(queries), 3),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    def did_you_mean(self, queries, top):
+        """Share of queries whose suggestion restores the original word"""
+        right = 0
+        for query, word, _ in queries:
+            ids = [pk for pk, _ in fuzzy.search(query, top)]
+            # The titles the shop page suggests from
+            titles = Product.objects.filter(id__in=ids[:5]).values_list('title', flat=True)
+            suggestion = fuzzy.did_you_mean(query, titles) or ''
+            right += word in fuzzy.words(suggestion)
+        return round(right / len(queries), 3)
@@ -0,0 +1,81 @@
+# shop/management/commands/bench_order_numbers.py
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from shop.order_numbers import OrderNumberGenerator, legacy_order_number
+
+
+SCHEMES = {
+    'random': lambda: legacy_order_number,
+    'time': lambda: OrderNumberGenerator(node=1),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Insert N order numbers per scheme into a scratch table with the same unique '
+        'index as Order.order_number; report throughput and index size as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--schemes', nargs='+', choices=sorted(SCHEMES), default=['random', 'time'])
+
+    def handle(self, *args, **options):
+        results = {
+            'database': connection.vendor,
+            'rows': options['rows'],
+            'schemes': {name: self.run(name, options['rows'], options['batch_size']) for name in options['schemes']},
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run(self, scheme, rows, batch_size):
+        table = f'bench_order_numbers_{scheme}'
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(f'CREATE TABLE {table} (id integer PRIMARY KEY, order_number varchar(20) NOT NULL)')
+            cursor.execute(f'CREATE UNIQUE INDEX {table}_uniq ON {table} (order_number)')
+
+        generate = SCHEMES[scheme]()
+        timings = []
+        try:
+            for start in range(0, rows, batch_size):
+                batch = [(n, generate()) for n in range(start, min(rows, start + batch_size))]
+                started = time.perf_counter()
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(f'INSERT INTO {table} (id, order_number) VALUES (%s, %s)', batch)
+                timings.append((len(batch), time.perf_counter() - started))
+                self.stderr.write(f'\r{scheme}: {start + len(batch):,}/{rows:,}', ending='')
+            self.stderr.write('')
+            index_bytes = self.index_size(f'{table}_uniq')
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+        total = sum(seconds for _, seconds in timings)
+        tail = timings[-max(1, len(timings) // 10):]
+        return {
+            'seconds': round(total, 2),
+            'rows_per_s': round(rows / total),
+            # Throughput once the index is large: where random keys hurt most
+            'last_10pct_rows_per_s': round(sum(n for n, _ in tail) / sum(s for _, s in tail)),
+            'index_bytes': index_bytes,
+        }
+
+    def index_size(self, index):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_relation_size(%s::regclass)', [index])
+                return cursor.fetchone()[0]
+            if connection.vendor == 'sqlite':
+                try:
+                    cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [index])
+                except Exception:
+                    # SQLite built without the dbstat virtual table
+                    return None
+                return cursor.fetchone()[0]
+        return None
@@ -0,0 +1,126 @@
+# shop/management/commands/bench_stock.py
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from shop import inventory
+from shop.management.commands.loadtest import percentile
+from shop.models import Product, StockReservation
+
+
+USERNAME_PREFIX = 'bench_stock_'
+
+
+def naive(product_id, user):
+    """The race this replaces: read the stock, check it, write it back"""
+    with transaction.atomic():
+        stock = Product.objects.values_list('stock', flat=True).get(pk=product_id)
+        if stock < 1:
+            raise inventory.OutOfStock([])
+        time.sleep(0)  # let other checkouts read the same value, as real request handling would
+        Product.objects.filter(pk=product_id).update(stock=stock - 1)
+
+
+def conditional(product_id, user):
+    with transaction.atomic():
+        inventory.take({product_id: 1})
+
+
+def reserve_commit(product_id, user):
+    """Checkout page (reserve), then placing the order (commit)"""
+    inventory.reserve(user, {product_id: 1})
+    with transaction.atomic():
+        inventory.commit(user, {product_id: 1})
+
+
+STRATEGIES = {'naive': naive, 'conditional': conditional, 'reserve': reserve_commit}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run many simultaneous checkouts of one product with limited stock and report '
+        'throughput, latency and overselling per strategy as JSON (use PostgreSQL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=50, help='Concurrent checkouts (database connections)')
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=sorted(STRATEGIES))
+
+    def handle(self, *args, **options):
+        users = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}', password='!') for i in range(options['checkouts'])
+        ])
+        try:
+            results = {
+                'database': connection.vendor,
+                'checkouts': options['checkouts'],
+                'workers': options['workers'],
+                'stock': options['stock'],
+                'strategies': {
+                    name: self.run(STRATEGIES[name], users, options['stock'], options['workers'])
+                    for name in options['strategies']
+                },
+            }
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run(self, checkout, users, stock, workers):
+        product = Product.objects.create(
+            title='Benchmark hot product', regular_price=1, discounted_price=1,
+            descriptions='', category='F', product_image='', stock=stock,
+        )
+        start = threading.Barrier(min(workers, len(users)))
+        outcomes = []
+
+        def attempt(user):
+            if not start.broken:
+                try:
+                    start.wait(timeout=30)
+                except threading.BrokenBarrierError:
+                    pass
+            started = time.perf_counter()
+            try:
+                checkout(product.pk, user)
+                outcome = 'sold'
+            except inventory.OutOfStock:
+                outcome = 'rejected'
+            except Exception:
+                # e.g. SQLite "database is locked"
+                outcome = 'error'
+            finally:
+                connection.close()
+            outcomes.append((outcome, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(attempt, users))
+            elapsed = time.perf_counter() - started
+            product.refresh_from_db()
+        finally:
+            StockReservation.objects.filter(product=product).delete()
+            product.delete()
+
+        sold = sum(outcome == 'sold' for outcome, _ in outcomes)
+        latencies = sorted(seconds for _, seconds in outcomes)
+        return {
+            'seconds': round(elapsed, 2),
+            'checkouts_per_s': round(len(outcomes) / elapsed),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'sold': sold,
+            'rejected': sum(outcome == 'rejected' for outcome, _ in outcomes),
+            'errors': sum(outcome == 'error' for outcome, _ in outcomes),
+            'final_stock': product.stock,
+            # Units sold beyond the stock there was, and sales the stock column never saw
+            'oversold': max(0, sold - stock),
+            'lost_updates': sold - (stock - product.stock),
+        }
@@ -0,0 +1,23 @@
+# shop/management/commands/create_order_partitions.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from shop import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create monthly shop_order partitions ahead of time (PostgreSQL; run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned(connection):
+            self.stdout.write(f'shop_order is not partitioned on {connection.vendor}; nothing to do.')
+            return
+        with transaction.atomic():
+            created = partitions.ensure_partitions(connection, options['months_ahead'])
+        for name in created:
+            self.stdout.write(self.style.SUCCESS(f'Created {name}'))
+        if not created:
+            self.stdout.write('All partitions already exist.')
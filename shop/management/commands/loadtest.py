@@ -0,0 +1,244 @@
+# shop/management/commands/loadtest.py
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+from shop.management.commands.seed_load_data import USERNAME_PREFIX
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Time each request on its own; flows follow redirects explicitly"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Stats:
+    """Thread-safe latency samples per endpoint"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.samples[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, values in sorted(self.samples.items()):
+            values = sorted(values)
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'rps': round(len(values) / elapsed, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+        total = sum(e['requests'] for e in endpoints.values())
+        return {
+            'requests': total,
+            'errors': sum(e['errors'] for e in endpoints.values()),
+            'rps': round(total / elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+
+class VirtualUser:
+    """One browser: its own cookie jar, CSRF token and RNG"""
+    def __init__(self, base_url, stats, rng, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.rng = rng
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ''
+
+    def request(self, endpoint, path, data=None, ajax=False):
+        headers = {'User-Agent': 'farm2fork-loadtest'}
+        body = None
+        if data is not None:
+            token = self.csrf_token()
+            body = urlencode({'csrfmiddlewaretoken': token, **data}).encode()
+            headers['X-CSRFToken'] = token
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = self.base_url + path
+        if ajax:
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+
+        req = Request(self.base_url + path, data=body, headers=headers)
+        started = time.perf_counter()
+        status, location = 0, None
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            e.read()
+            status, location = e.code, e.headers.get('Location')
+        except (URLError, OSError):
+            status = 0
+        self.stats.record(endpoint, time.perf_counter() - started, 200 <= status < 400)
+        return status, location
+
+    def login(self, login_path, username, password):
+        self.request('login_form', login_path)
+        status, _ = self.request('login_submit', login_path, {'username': username, 'password': password})
+        return status == 302
+
+
+class ShopperFlow:
+    """Browse -> product detail -> add to cart -> checkout"""
+    def __init__(self, product_ids, checkout_rate):
+        self.product_ids = product_ids
+        self.checkout_rate = checkout_rate
+
+    def run(self, vu):
+        rng = vu.rng
+        vu.request('home', '/')
+        vu.request('shop', f'/shop/?page={rng.randint(1, 20)}')
+        for product_id in rng.sample(self.product_ids, k=min(len(self.product_ids), rng.randint(1, 3))):
+            vu.request('product_detail', f'/product-details/{product_id}/')
+            vu.request('ajax_add_to_cart', '/add-to-cart/', {'product_id': product_id, 'quantity': 1}, ajax=True)
+        vu.request('cart', '/cart/')
+        if rng.random() < self.checkout_rate:
+            vu.request('chackout_form', '/chackout/')
+            status, location = vu.request('chackout_submit', '/chackout/', {
+                'first_name': 'Load', 'last_name': 'Test', 'email': 'load@example.com',
+                'phone': '01700000000', 'address': 'Road 1', 'city': 'Dhaka',
+                'country': 'Bangladesh', 'postcode': '1207',
+                'shipping_method': 'FREE', 'payment_method': 'COD',
+            })
+            if status == 302 and location:
+                vu.request('order_confirmation', location)
+
+
+class SellerFlow:
+    """Dashboard -> orders -> product list (read-only, so runs stay comparable)"""
+    def run(self, vu):
+        vu.request('seller_dashboard', '/multivendor/seller/dashboard/')
+        vu.request('seller_orders', '/multivendor/seller/orders/')
+        vu.request('seller_all_products', '/multivendor/seller/all-products/')
+
+
+class Command(BaseCommand):
+    help = 'Drive shopper and seller flows against a running server and report latency percentiles as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--shoppers', type=int, default=20, help='Concurrent shopper virtual users')
+        parser.add_argument('--sellers', type=int, default=2, help='Concurrent seller virtual users')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run after warm-up')
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds of traffic excluded from the report')
+        parser.add_argument('--checkout-rate', type=float, default=0.2, help='Share of shopper iterations that check out')
+        parser.add_argument('--think-time', type=float, default=0.0, help='Pause between iterations (seconds)')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--password', default='load-test', help='Password of the seed_load_data accounts')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Same ordering on every run so results stay comparable between commits
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:5000])
+        shoppers = list(
+            User.objects.filter(username__startswith=f'{USERNAME_PREFIX}user')
+            .order_by('id').values_list('username', flat=True)[:options['shoppers']]
+        )
+        sellers = list(
+            User.objects.filter(username__startswith=f'{USERNAME_PREFIX}seller')
+            .order_by('id').values_list('username', flat=True)[:options['sellers']]
+        )
+        if not product_ids or len(shoppers) < options['shoppers'] or len(sellers) < options['sellers']:
+            raise CommandError('Not enough load data; run `manage.py seed_load_data` first.')
+
+        stats = Stats()
+        warmup_stats = Stats()
+        deadline_warmup = time.monotonic() + options['warmup']
+        deadline = deadline_warmup + options['duration']
+        shopper_flow = ShopperFlow(product_ids, options['checkout_rate'])
+        seller_flow = SellerFlow()
+
+        def worker(username, login_path, flow, vu_seed):
+            vu = VirtualUser(options['base_url'], warmup_stats, random.Random(vu_seed), options['timeout'])
+            if not vu.login(login_path, username, options['password']):
+                self.stderr.write(f'Login failed for {username}')
+                return
+            while time.monotonic() < deadline:
+                vu.stats = warmup_stats if time.monotonic() < deadline_warmup else stats
+                flow.run(vu)
+                if options['think_time']:
+                    time.sleep(options['think_time'])
+
+        threads = [
+            threading.Thread(target=worker, args=(name, '/account/Login/', shopper_flow, rng.random()))
+            for name in shoppers
+        ] + [
+            threading.Thread(target=worker, args=(name, '/multivendor/seller/login/', seller_flow, rng.random()))
+            for name in sellers
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        measured = max(0.001, time.monotonic() - max(started, deadline_warmup))
+
+        report = {
+            'commit': self.git_commit(),
+            'python': platform.python_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'config': {k: options[k] for k in (
+                'base_url', 'shoppers', 'sellers', 'duration', 'warmup', 'checkout_rate', 'think_time', 'seed',
+            )},
+            'elapsed_s': round(measured, 2),
+            **stats.report(measured),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"{report['requests']} requests, {report['rps']} req/s -> {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,37 @@
+# shop/management/commands/prerender_pages.py
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop import catalog_version, prerender
+
+
+class Command(BaseCommand):
+    help = 'Write gzipped HTML snapshots of the anonymous home, info and category pages (run on deploy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Only these paths (default: all of shop.prerender.pages())')
+        parser.add_argument('--clear', action='store_true', help='Delete every snapshot and stop serving them')
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Then keep running and re-render stale snapshots every PRERENDER_WATCH_SECONDS (one per host)',
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            if os.path.isdir(settings.PRERENDER_ROOT):
+                shutil.rmtree(settings.PRERENDER_ROOT)
+            self.stdout.write('Removed all snapshots.')
+            return
+        # Read before rendering: a write landing meanwhile moves the clock past it
+        version = catalog_version.current()[0]
+        paths = options['paths'] or prerender.pages()
+        written = prerender.prerender(paths)
+        for path in paths:
+            self.stdout.write(f"{'wrote ' if path in written else 'FAILED'} {path}")
+        self.stdout.write(f'Pre-rendered {len(written)} of {len(paths)} page(s) into {settings.PRERENDER_ROOT}.')
+        if options['watch']:
+            self.stdout.write(f'Watching for catalog changes every {settings.PRERENDER_WATCH_SECONDS}s.')
+            prerender.watch(settings.PRERENDER_WATCH_SECONDS, version)
@@ -0,0 +1,15 @@
+# shop/management/commands/release_reservations.py
+from django.core.management.base import BaseCommand
+
+from shop import inventory
+
+
+class Command(BaseCommand):
+    help = 'Return expired checkout stock reservations to stock (run every minute from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = inventory.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(f'Released {released} expired reservation(s).')
@@ -0,0 +1,12 @@
+# shop/management/commands/run_campaigns.py
+from django.core.management.base import BaseCommand
+
+from shop import campaigns
+
+
+class Command(BaseCommand):
+    help = 'Start price campaigns that are due and end expired ones (run every minute from cron)'
+
+    def handle(self, *args, **options):
+        applied, ended = campaigns.run_due()
+        self.stdout.write(f'Applied {applied} campaign(s), ended {ended}.')
@@ -0,0 +1,350 @@
+# shop/management/commands/seed_load_data.py
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, models, transaction
+from django.utils import timezone
+
+from multivendor.models import Seller, SellerOrder
+from shop import catalog_version
+from shop.models import (
+    Product, Tag, Cart, CartItem, Order, OrderItem, OrderStatusEvent, ProductReview, ProductQuestion,
+)
+from shop.order_status import record_created_many
+
+
+USERNAME_PREFIX = 'load_'
+PLACEHOLDER_COUNT = 12
+
+PRODUCE = {
+    'F': ['Mango', 'Banana', 'Guava', 'Lychee', 'Jackfruit', 'Papaya', 'Pineapple', 'Orange', 'Apple'],
+    'V': ['Bitroot', 'Bottle gourd', 'Brinjal', 'Carrot', 'Broccoli', 'Potato', 'Spinach', 'Okra', 'Tomato'],
+    'DF': ['Almond', 'Cashew Nut', 'Walnut', 'Raisin', 'Dates', 'Pistachio'],
+    'M': ['Chicken', 'Mutton', 'Beef', 'Duck'],
+    'FH': ['Ilish', 'Rui', 'Katla', 'Pangas', 'Shrimp', 'Tilapia'],
+    'B': ['Brown Bread', 'Bread', 'Bun', 'Paratha'],
+}
+# Rough share of the catalog per category
+CATEGORY_WEIGHTS = {'V': 35, 'F': 25, 'FH': 12, 'M': 10, 'DF': 10, 'B': 8}
+VARIANTS = ['250g', '500g', '1kg', '2kg', '5kg', '1 pc', '6 pcs', '12 pcs']
+TAGS = ['organic', 'fresh', 'local', 'seasonal', 'imported', 'premium', 'bulk', 'halal', 'gluten-free', 'sale']
+STATUS_WEIGHTS = {'DELIVERED': 70, 'PENDING': 8, 'PROCESSING': 7, 'SHIPPED': 8, 'CANCELLED': 7}
+CITIES = ['Dhaka', 'Chattogram', 'Khulna', 'Rajshahi', 'Sylhet', 'Barishal', 'Rangpur', 'Mymensingh']
+PAYMENTS = ['COD', 'COD', 'COD', 'BANK', 'PAYPAL', 'CHECK']
+SHIPPING = {'FREE': 0, 'FLAT': 80, 'LOCAL': 20}
+REVIEW_TEXT = [
+    'Very fresh, will buy again.', 'Good quality for the price.', 'Delivered on time and well packed.',
+    'Not as fresh as expected.', 'Excellent taste, highly recommended!', 'Average quality this time.',
+]
+QUESTION_TEXT = [
+    'Is this product organic?', 'How long does delivery take to Sylhet?', 'Is it available in bulk?',
+    'What is the shelf life?', 'Is the weight before or after cleaning?',
+]
+
+
+def zipf_cum_weights(n, s=1.1):
+    """Cumulative Zipf weights: rank 1 is the most popular"""
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+@contextmanager
+def backdated(*models):
+    """Let bulk_create keep explicit created_at/updated_at values"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# ============================================================
+# ORDER WORKERS (may run in a process pool)
+# ============================================================
+
+_worker = {}
+
+
+def init_order_worker(context):
+    """Per-process state: catalog arrays and popularity weights"""
+    import django
+    django.setup()
+    _worker.clear()
+    _worker.update(context)
+    _worker['product_cw'] = zipf_cum_weights(len(context['product_ids']))
+    _worker['user_cw'] = zipf_cum_weights(len(context['user_ids']), s=0.8)
+
+
+def create_order_chunk(chunk, start, count):
+    """Create orders [start, start + count) with their items, seller orders, first events and reviews"""
+    ctx = _worker
+    rng = random.Random(ctx['seed'] * 1_000_003 + chunk)
+    product_ids, prices = ctx['product_ids'], ctx['prices']
+    user_ids = ctx['user_ids']
+    now = ctx['now']
+    statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+
+    orders, lines = [], []
+    for n in range(start, start + count):
+        picks = set(rng.choices(range(len(product_ids)), cum_weights=ctx['product_cw'], k=rng.randint(1, 5)))
+        items = [(product_ids[p], prices[p], rng.randint(1, 4)) for p in picks]
+        subtotal = round(sum(price * qty for _, price, qty in items), 2)
+        shipping = rng.choice(list(SHIPPING))
+        created = now - timedelta(days=ctx['days'] * rng.random() ** 1.5)
+        orders.append(Order(
+            user_id=rng.choices(user_ids, cum_weights=ctx['user_cw'])[0],
+            order_number=f'LD{n:012d}',
+            first_name='Load', last_name=f'User{n % 1000}',
+            email=f'load{n % 1000}@example.com', phone='01700000000',
+            address=f'House {n % 200}, Road {n % 40}', city=rng.choice(CITIES),
+            country='Bangladesh', postcode=f'{1000 + n % 9000}',
+            shipping_method=shipping, shipping_cost=SHIPPING[shipping],
+            payment_method=rng.choice(PAYMENTS),
+            subtotal=subtotal, total=subtotal + SHIPPING[shipping],
+            status=rng.choices(statuses, weights=status_weights)[0],
+            created_at=created, updated_at=created,
+        ))
+        lines.append(items)
+
+    with backdated(Order, ProductReview), transaction.atomic():
+        orders = Order.objects.bulk_create(orders, batch_size=ctx['batch_size'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order.id, product_id=pid, quantity=qty, price=price, subtotal=round(price * qty, 2))
+            for order, items in zip(orders, lines) for pid, price, qty in items
+        ], batch_size=ctx['batch_size'])
+        # Seller pages read only seller orders, split as at checkout
+        for i in range(0, len(orders), ctx['batch_size']):
+            record_created_many(orders[i:i + ctx['batch_size']], source='seed')
+        ProductReview.objects.bulk_create([
+            ProductReview(
+                product_id=items[0][0], user_id=order.user_id, order_id=order.id,
+                rating=rng.choices([5, 4, 3, 2, 1], weights=[45, 30, 12, 6, 7])[0],
+                review=rng.choice(REVIEW_TEXT),
+                created_at=order.created_at + timedelta(days=rng.randint(2, 14)),
+            )
+            for order, items in zip(orders, lines)
+            if order.status == 'DELIVERED' and rng.random() < ctx['review_rate']
+        ], batch_size=ctx['batch_size'])
+    return len(orders), sum(len(items) for items in lines)
+
+
+class Command(BaseCommand):
+    help = 'Deterministically generate a large synthetic dataset for load and performance testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=50)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--carts', type=float, default=0.3, help='Share of users with a non-empty cart')
+        parser.add_argument('--review-rate', type=float, default=0.25, help='Share of delivered orders reviewed')
+        parser.add_argument('--questions', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=730, help='Spread orders over this many past days')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Orders per worker task')
+        parser.add_argument('--workers', type=int, default=1, help='Processes for order generation')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help=f'Delete previously generated {USERNAME_PREFIX}* data first')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now().replace(microsecond=0)
+        started = time.perf_counter()
+
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            if not options['clear']:
+                raise CommandError('Load data already exists; pass --clear to regenerate it.')
+            self.step('Clearing previous load data', self.clear)
+
+        self.step('Placeholder images', self.create_placeholders)
+        self.step('Tags', self.create_tags)
+        self.step('Sellers', self.create_sellers)
+        self.step('Users', self.create_users)
+        self.step('Products', self.create_products)
+        self.step('Carts', self.create_carts)
+        self.step('Questions', self.create_questions)
+        self.step('Orders, items, seller orders and reviews', self.create_orders)
+        # bulk_create skips shop.signals; move the clock once so running
+        # servers' snapshots, search indexes, facets and ETags follow
+        catalog_version.tick(names=True, prices=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def step(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f'{label}: {result} ({time.perf_counter() - started:.1f}s)')
+
+    def batched_create(self, model, objs):
+        with transaction.atomic():
+            return model.objects.bulk_create(objs, batch_size=self.options['batch_size'])
+
+    def clear(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        # Delete the big tables first so the cascade from auth_user stays cheap
+        OrderItem.objects.filter(order__user__in=users).delete()
+        SellerOrder.objects.filter(user__in=users).delete()
+        # The status log is append-only for real orders; these are generated
+        models.QuerySet(OrderStatusEvent).filter(order_id__in=Order.objects.filter(user__in=users).values('id')).delete()
+        ProductReview.objects.filter(user__in=users).delete()
+        Order.objects.filter(user__in=users).delete()
+        count, _ = users.delete()
+        catalog_version.tick(names=True, prices=True)
+        return f'{count} rows'
+
+    def create_placeholders(self):
+        from PIL import Image, ImageDraw
+
+        folder = os.path.join(settings.MEDIA_ROOT, 'product_image', 'placeholder')
+        os.makedirs(folder, exist_ok=True)
+        rng = random.Random(self.options['seed'])
+        self.images = []
+        for i in range(PLACEHOLDER_COUNT):
+            name = f'product_image/placeholder/placeholder_{i:02d}.jpg'
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                color = tuple(rng.randint(80, 220) for _ in range(3))
+                image = Image.new('RGB', (400, 300), color)
+                ImageDraw.Draw(image).text((20, 20), f'Farm2Fork #{i}', fill=(255, 255, 255))
+                image.save(path, 'JPEG', quality=70)
+            self.images.append(name)
+        return f'{len(self.images)} files'
+
+    def create_tags(self):
+        existing = set(Tag.objects.filter(name__in=TAGS).values_list('name', flat=True))
+        Tag.objects.bulk_create([Tag(name=name) for name in TAGS if name not in existing])
+        self.tag_ids = list(Tag.objects.filter(name__in=TAGS).values_list('id', flat=True))
+        return len(self.tag_ids)
+
+    def create_sellers(self):
+        password = make_password('load-test')
+        users = self.batched_create(User, [
+            User(username=f'{USERNAME_PREFIX}seller{i}', email=f'seller{i}@load.example.com', password=password)
+            for i in range(self.options['sellers'])
+        ])
+        sellers = self.batched_create(Seller, [
+            Seller(user=user, shop_name=f'{USERNAME_PREFIX}{self.rng.choice(CITIES)} Farm {i}', bio='Generated seller')
+            for i, user in enumerate(users)
+        ])
+        self.seller_ids = [seller.id for seller in sellers]
+        return len(sellers)
+
+    def create_users(self):
+        password = make_password('load-test')
+        users = self.batched_create(User, [
+            User(username=f'{USERNAME_PREFIX}user{i}', email=f'user{i}@load.example.com', password=password)
+            for i in range(self.options['users'])
+        ])
+        self.user_ids = [user.id for user in users]
+        return len(users)
+
+    def create_products(self):
+        rng = self.rng
+        categories, weights = zip(*CATEGORY_WEIGHTS.items())
+        seller_cw = zipf_cum_weights(len(self.seller_ids))
+        products = []
+        for i in range(self.options['products']):
+            category = rng.choices(categories, weights=weights)[0]
+            regular = round(rng.lognormvariate(5, 0.8), 2)
+            products.append(Product(
+                seller_id=rng.choices(self.seller_ids, cum_weights=seller_cw)[0],
+                title=f'{rng.choice(PRODUCE[category])} {rng.choice(VARIANTS)} #{i}',
+                regular_price=regular,
+                discounted_price=round(regular * rng.choice([1, 1, 0.95, 0.9, 0.8, 0.7]), 2),
+                descriptions=f'Generated {category} product for load testing.',
+                category=category,
+                product_image=rng.choice(self.images),
+            ))
+        products = self.batched_create(Product, products)
+        self.product_ids = [product.id for product in products]
+        self.prices = [product.discounted_price for product in products]
+
+        through = Product.tags.through
+        self.batched_create(through, [
+            through(product_id=product.id, tag_id=tag_id)
+            for product in products
+            for tag_id in rng.sample(self.tag_ids, rng.choice([0, 1, 1, 2, 3]))
+        ])
+        return len(products)
+
+    def create_carts(self):
+        rng = self.rng
+        owners = rng.sample(self.user_ids, int(len(self.user_ids) * self.options['carts']))
+        carts = self.batched_create(Cart, [Cart(user_id=user_id) for user_id in owners])
+        cw = zipf_cum_weights(len(self.product_ids))
+        items = self.batched_create(CartItem, [
+            CartItem(cart_id=cart.id, product_id=self.product_ids[p], quantity=rng.randint(1, 3))
+            for cart in carts
+            for p in set(rng.choices(range(len(self.product_ids)), cum_weights=cw, k=rng.randint(1, 6)))
+        ])
+        return f'{len(carts)} carts, {len(items)} lines'
+
+    def create_questions(self):
+        rng = self.rng
+        cw = zipf_cum_weights(len(self.product_ids))
+        questions = []
+        for _ in range(self.options['questions']):
+            answered = rng.random() < 0.6
+            created = self.now - timedelta(days=rng.uniform(0, self.options['days']))
+            questions.append(ProductQuestion(
+                product_id=rng.choices(self.product_ids, cum_weights=cw)[0],
+                user_id=rng.choice(self.user_ids),
+                question=rng.choice(QUESTION_TEXT),
+                answer='Yes, thanks for asking.' if answered else None,
+                is_answered=answered,
+                answered_at=created + timedelta(hours=rng.randint(1, 72)) if answered else None,
+                created_at=created,
+            ))
+        with backdated(ProductQuestion):
+            self.batched_create(ProductQuestion, questions)
+        return len(questions)
+
+    def create_orders(self):
+        total, chunk_size = self.options['orders'], self.options['chunk_size']
+        chunks = [(i, start, min(chunk_size, total - start)) for i, start in enumerate(range(0, total, chunk_size))]
+        context = {
+            'seed': self.options['seed'],
+            'product_ids': self.product_ids,
+            'prices': self.prices,
+            'user_ids': self.user_ids,
+            'now': self.now,
+            'days': self.options['days'],
+            'batch_size': self.options['batch_size'],
+            'review_rate': self.options['review_rate'],
+        }
+        workers = self.options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite allows a single writer; generating orders in-process.')
+            workers = 1
+
+        orders = items = 0
+        if workers > 1:
+            # Children must open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(workers, initializer=init_order_worker, initargs=(context,)) as pool:
+                for created, lines in pool.map(create_order_chunk, *zip(*chunks)):
+                    orders, items = orders + created, items + lines
+                    self.stdout.write(f'  {orders}/{total} orders')
+        else:
+            init_order_worker(context)
+            for chunk in chunks:
+                created, lines = create_order_chunk(*chunk)
+                orders, items = orders + created, items + lines
+                self.stdout.write(f'  {orders}/{total} orders')
+        return f'{orders} orders, {items} items'
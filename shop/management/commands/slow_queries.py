@@ -0,0 +1,68 @@
+# shop/management/commands/slow_queries.py
+from collections import Counter, defaultdict
+import glob
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow query log: top statements by total time with their call sites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Log file (defaults to SLOW_QUERY_LOG_FILE, rotated files included)')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        path = options['file'] or settings.SLOW_QUERY_LOG_FILE
+        # Rotated files too, except compressed ones
+        rotated = [name for name in glob.glob(path + '.*') if not name.endswith('.gz')]
+        files = sorted(rotated) + ([path] if os.path.exists(path) else [])
+        if not files:
+            raise CommandError(f'No slow query log at {path}. Set SLOW_QUERY_LOG=1 to enable it.')
+
+        groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql': '', 'call_sites': Counter()})
+        for name in files:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    group = groups[entry['fingerprint']]
+                    group['count'] += 1
+                    group['total_ms'] += entry['duration_ms']
+                    group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+                    group['sql'] = entry['sql']
+                    site = entry.get('call_site')
+                    if site:
+                        group['call_sites'][f"{site['file']}:{site['line']} in {site['function']}"] += 1
+
+        top = sorted(groups.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:options['limit']]
+        summary = [
+            {
+                'fingerprint': key,
+                'count': group['count'],
+                'total_ms': round(group['total_ms'], 1),
+                'mean_ms': round(group['total_ms'] / group['count'], 1),
+                'max_ms': round(group['max_ms'], 1),
+                'call_sites': group['call_sites'].most_common(3),
+                'sql': group['sql'],
+            }
+            for key, group in top
+        ]
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        for rank, row in enumerate(summary, 1):
+            self.stdout.write(self.style.WARNING(
+                f"#{rank} {row['fingerprint']}  total {row['total_ms']}ms  "
+                f"count {row['count']}  mean {row['mean_ms']}ms  max {row['max_ms']}ms"
+            ))
+            for site, count in row['call_sites']:
+                self.stdout.write(f'    {count:>6} x {site}')
+            self.stdout.write(f"    {row['sql'][:300]}\n")
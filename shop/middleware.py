@@ -0,0 +1,244 @@
+# shop/middleware.py
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.module_loading import import_string
+
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+_MISSING = object()
+
+
+class RequestMetrics:
+    """Counters for the request being served"""
+    __slots__ = (
+        'queries', 'db_time', 'template_time', 'template_depth', 'cache_hits', 'cache_misses', 'cache_depth',
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+
+
+def current_metrics():
+    """Metrics of the request in progress, or None outside a request"""
+    return _current.get()
+
+
+# ============================================================
+# HOOKS
+# ============================================================
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return render(self, *args, **kwargs)
+        # Only the outermost render is timed so nested renders are not double counted
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            metrics.template_depth -= 1
+            if metrics.template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+    wrapper._request_metrics = True
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, _MISSING, version)
+        metrics = _current.get()
+        # BaseCache.get_many() calls get() per key; get_many() counts those
+        if metrics is not None and not metrics.cache_depth:
+            if value is _MISSING:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is _MISSING else value
+    wrapper._request_metrics = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        metrics = _current.get()
+        if metrics is None:
+            return get_many(self, keys, version=version)
+        metrics.cache_depth += 1
+        try:
+            values = get_many(self, keys, version=version)
+        finally:
+            metrics.cache_depth -= 1
+        if not metrics.cache_depth:
+            metrics.cache_hits += len(values)
+            metrics.cache_misses += len(keys) - len(values)
+        return values
+    wrapper._request_metrics = True
+    return wrapper
+
+
+def install_hooks():
+    """Patch template rendering and the configured cache backends (idempotent)"""
+    from django.template.backends.django import Template
+
+    if not getattr(Template.render, '_request_metrics', False):
+        Template.render = _timed_render(Template.render)
+    for config in settings.CACHES.values():
+        backend = import_string(config['BACKEND'])
+        if not getattr(backend.get, '_request_metrics', False):
+            backend.get = _counted_get(backend.get)
+        if not getattr(backend.get_many, '_request_metrics', False):
+            backend.get_many = _counted_get_many(backend.get_many)
+
+
+# ============================================================
+# AGGREGATION
+# ============================================================
+
+class ViewStats:
+    __slots__ = ('buckets', 'count', 'duration', 'queries', 'db_time', 'template_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    """Per-process histograms keyed by URL name"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, duration, metrics):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.template_time += metrics.template_time
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render_prometheus(self, prefix='farm2fork'):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                f'# HELP {prefix}_request_duration_seconds Request duration by URL name.',
+                f'# TYPE {prefix}_request_duration_seconds histogram',
+            ]
+            for view, stats in views:
+                cumulative = 0
+                for bound, hits in zip(DURATION_BUCKETS, stats.buckets):
+                    cumulative += hits
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {stats.count}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{view="{view}"}} {stats.duration:.6f}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{view="{view}"}} {stats.count}')
+            counters = (
+                ('db_queries_total', 'Database queries executed.', 'queries', '{}'),
+                ('db_duration_seconds_total', 'Time spent in database queries.', 'db_time', '{:.6f}'),
+                ('template_duration_seconds_total', 'Time spent rendering templates.', 'template_time', '{:.6f}'),
+                ('cache_hits_total', 'Cache lookups that hit.', 'cache_hits', '{}'),
+                ('cache_misses_total', 'Cache lookups that missed.', 'cache_misses', '{}'),
+            )
+            for name, help_text, attr, fmt in counters:
+                lines.append(f'# HELP {prefix}_{name} {help_text}')
+                lines.append(f'# TYPE {prefix}_{name} counter')
+                for view, stats in views:
+                    lines.append(f'{prefix}_{name}{{view="{view}"}} {fmt.format(getattr(stats, attr))}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+
+class RequestMetricsMiddleware:
+    """Time each request, count its queries, template and cache work
+
+    Adds a Server-Timing header and feeds the per-URL-name histograms
+    exposed by the `metrics` view. Disable with REQUEST_METRICS_ENABLED = False.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_hooks()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(db_execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        registry.observe(view, duration, metrics)
+
+        timings = [
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f'tpl;dur={metrics.template_time * 1000:.1f}',
+            f'cache;desc="{metrics.cache_hits} hit / {metrics.cache_misses} miss"',
+            f'total;dur={duration * 1000:.1f}',
+        ]
+        response['Server-Timing'] = ', '.join(timings)
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:10
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Collapse duplicate (cart, product) rows so the unique constraint can be added"""
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(rows=Count('id'), keep=Min('id'), qty=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for dup in duplicates:
+        CartItem.objects.filter(id=dup['keep']).update(quantity=dup['qty'])
+        CartItem.objects.filter(
+            cart_id=dup['cart_id'], product_id=dup['product_id']
+        ).exclude(id=dup['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_productquestion_delete_productmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together={('cart', 'product')},
+        ),
+    ]
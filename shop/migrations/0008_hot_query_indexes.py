@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multivendor', '0001_initial'),
+        ('shop', '0007_cartitem_unique_cart_product'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='order_user_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-id'], name='product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productquestion',
+            index=models.Index(fields=['product', '-created_at'], name='question_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productquestion',
+            index=models.Index(condition=models.Q(('is_answered', False)), fields=['product', '-created_at'], name='question_unanswered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+
+def merge_on_the_way(apps, schema_editor):
+    # multivendor used to store SHIPPED as ON_THE_WAY
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.filter(status='ON_THE_WAY').update(status='SHIPPED')
+
+
+def backfill_events(apps, schema_editor):
+    """One event per existing order: its current status, dated at its creation"""
+    Order = apps.get_model('shop', 'Order')
+    OrderStatusEvent = apps.get_model('shop', 'OrderStatusEvent')
+    last_id = 0
+    while True:
+        rows = list(
+            Order.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'order_number', 'status', 'created_at')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(
+                order_id=pk, order_number=number, from_status='', to_status=status,
+                source='backfill', created_at=created_at,
+            )
+            for pk, number, status, created_at in rows
+        ])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_order_partitioning_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_number', models.CharField(max_length=20)),
+                ('from_status', models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], default='', max_length=20)),
+                ('to_status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('source', models.CharField(blank=True, default='', max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_events', to='shop.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['order', 'id'], name='statusevent_order_idx'), models.Index(fields=['to_status', 'created_at'], name='statusevent_status_created_idx')],
+            },
+        ),
+        migrations.RunPython(merge_on_the_way, migrations.RunPython.noop),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
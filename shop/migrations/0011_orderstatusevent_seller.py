@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multivendor', '0002_sellerorder'),
+        ('shop', '0010_order_status_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderstatusevent',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='multivendor.seller'),
+        ),
+    ]
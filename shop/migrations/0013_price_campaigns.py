@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multivendor', '0002_sellerorder'),
+        ('shop', '0012_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('PERCENT', 'Percentage off'), ('FIXED', 'Fixed amount off'), ('TIERED', 'Percentage off by price tier')], default='PERCENT', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('tiers', models.JSONField(blank=True, default=list)),
+                ('category', models.CharField(blank=True, choices=[('F', 'Fruits'), ('V', 'Vegetable'), ('DF', 'Dryfruits'), ('M', 'Meat'), ('FH', 'Fish'), ('B', 'Bread')], default='', max_length=2)),
+                ('starts_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('ACTIVE', 'Active'), ('ENDED', 'Ended'), ('ROLLED_BACK', 'Rolled back')], default='SCHEDULED', max_length=12)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('seller', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='campaigns', to='multivendor.seller')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.tag')),
+            ],
+            options={
+                'ordering': ['-starts_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CampaignPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_price', models.FloatField()),
+                ('campaign_price', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='shop.pricecampaign')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricecampaign',
+            index=models.Index(fields=['status', 'starts_at'], name='campaign_status_starts_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='campaignprice',
+            constraint=models.UniqueConstraint(fields=('campaign', 'product'), name='campaignprice_campaign_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_price_campaigns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_clock(apps, schema_editor):
+    CatalogClock = apps.get_model('shop', 'CatalogClock')
+    CatalogClock.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_product_card_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogClock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='card_version',
+            new_name='version',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_clock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 20:05
+
+from django.db import migrations
+
+from shop.fuzzy import INDEX_NAME, install_trigram_index
+
+
+def install(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # Servers without the pg_trgm extension fall back to shop.fuzzy's in-process index
+        install_trigram_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_catalog_clock'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
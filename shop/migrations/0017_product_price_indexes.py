@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multivendor', '0002_sellerorder'),
+        ('shop', '0016_product_title_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discounted_price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'discounted_price'], name='product_category_price_idx'),
+        ),
+    ]
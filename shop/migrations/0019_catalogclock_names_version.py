@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_product_stock_not_editable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogclock',
+            name='names_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_catalogclock_names_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogclock',
+            name='prices_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
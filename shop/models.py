@@ -1,8 +1,9 @@
 # shop/models.py
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Avg
+from django.db.models import Avg, F, FloatField, Sum
 
 
 # Category Choices
@@ -44,6 +45,22 @@ ORDER_STATUS = (
 
 
 
+class CatalogClock(models.Model):
+    """Single row: the catalog's monotonic version and when it last moved"""
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    # Moves only with writes that may rename or add a product, tag or seller
+    # (the autocomplete index), not with reviews, questions or price changes
+    names_version = models.PositiveBigIntegerField(default=0)
+    # Moves only with writes that may change a price, category or tag link,
+    # or add or remove a product (shop.price_facets)
+    prices_version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+
 class Tag(models.Model):
     """Tags for products (e.g., organic, fresh, etc.)"""
     name = models.CharField(max_length=50, unique=True)
@@ -63,14 +80,39 @@ class Product(models.Model):
     category = models.CharField(max_length=2)  # your categories
     product_image = models.ImageField(upload_to='product_image/')
     tags = models.ManyToManyField('Tag', blank=True)
+    # Units on hand and not reserved; empty means stock is not tracked.
+    # Set when the product is created, then only changed by UPDATEs in
+    # shop.inventory (restock() for new deliveries); save() leaves it alone.
+    stock = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # CatalogClock version of the last change to the product, its tags,
+    # reviews or questions (shop.catalog_version)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    modified_at = models.DateTimeField(null=True, blank=True, editable=False)
 
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # A full save of an existing product would write back the stock it
+        # was loaded with over checkouts that happened since
+        full = not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+        if full and not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'stock'
+            ]
+        super().save(*args, **kwargs)
+
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            # Category listings and related products, newest first
+            models.Index(fields=['category', '-id'], name='product_category_id_idx'),
+            # Price ranges (shop.filters) and price sorts, whole catalog or one category
+            models.Index(fields=['discounted_price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['category', 'discounted_price'], name='product_category_price_idx'),
+        ]
     
     def average_rating(self):
         """Calculate average rating"""
@@ -94,8 +136,11 @@ class Cart(models.Model):
 
 
     def total(self):
-        """Calculate total cart value"""
-        return sum(item.subtotal() for item in self.items.all())
+        """Calculate total cart value in a single aggregate query"""
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('product__discounted_price'), output_field=FloatField())
+        )['total']
+        return total or 0
 
 
     def __str__(self):
@@ -119,6 +164,114 @@ class CartItem(models.Model):
         return f"{self.quantity} x {self.product.title}"
 
 
+    class Meta:
+        # Lets guest carts be merged with a single upsert at login
+        unique_together = ('cart', 'product')
+
+
+
+class PriceCampaign(models.Model):
+    """A discount over a product selection, applied and rolled back by shop.campaigns
+
+    The selection is every product matching all of category, tag and
+    seller that are set (none set: the whole catalog). The sale price is
+    computed from regular_price and never raises a product's current
+    discounted_price.
+    """
+    KIND_CHOICES = (
+        ('PERCENT', 'Percentage off'),
+        ('FIXED', 'Fixed amount off'),
+        ('TIERED', 'Percentage off by price tier'),
+    )
+    STATUS_CHOICES = (
+        ('SCHEDULED', 'Scheduled'),
+        ('ACTIVE', 'Active'),
+        ('ENDED', 'Ended'),
+        ('ROLLED_BACK', 'Rolled back'),
+    )
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='PERCENT')
+    # Percent for PERCENT, amount for FIXED; unused for TIERED
+    value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # TIERED: [[min regular price, percent], ...], e.g. [[0, 5], [100, 10], [500, 20]]
+    tiers = models.JSONField(default=list, blank=True)
+    category = models.CharField(max_length=2, choices=CATEGORY_CHOICES, blank=True, default='')
+    tag = models.ForeignKey(Tag, on_delete=models.SET_NULL, null=True, blank=True)
+    seller = models.ForeignKey('multivendor.Seller', on_delete=models.CASCADE, null=True, blank=True, related_name='campaigns')
+    # Applied by `manage.py run_campaigns` once due; ends (prices restored) at ends_at
+    starts_at = models.DateTimeField(default=timezone.now)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='SCHEDULED')
+    product_count = models.PositiveIntegerField(default=0)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-starts_at']
+        indexes = [
+            models.Index(fields=['status', 'starts_at'], name='campaign_status_starts_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.kind == 'PERCENT' and not 0 < self.value <= 100:
+            raise ValidationError({'value': 'Enter a percentage between 0 and 100.'})
+        if self.kind == 'FIXED' and self.value <= 0:
+            raise ValidationError({'value': 'Enter an amount above 0.'})
+        if self.kind == 'TIERED':
+            try:
+                valid = bool(self.tiers) and all(0 <= float(low) and 0 < float(pct) <= 100 for low, pct in self.tiers)
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                raise ValidationError({'tiers': 'Enter tiers as [[min regular price, percent], ...].'})
+        if self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': 'The campaign must end after it starts.'})
+
+
+class CampaignPrice(models.Model):
+    """A product's discounted_price before and after a campaign, for rollback"""
+    campaign = models.ForeignKey(PriceCampaign, on_delete=models.CASCADE, related_name='prices')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    previous_price = models.FloatField()
+    campaign_price = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'product'], name='campaignprice_campaign_product_uniq'),
+        ]
+
+
+
+class StockReservation(models.Model):
+    """Units taken from Product.stock for a user's checkout, held until expires_at
+
+    Turned into an order by shop.inventory.commit, or handed back to stock
+    by `manage.py release_reservations` once expired.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Sweeper: oldest expired reservations first
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='reservation_user_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id} until {self.expires_at:%H:%M}"
+
+
 
 class UserProfile(models.Model):
     """Extended user profile with additional information"""
@@ -147,6 +300,8 @@ class UserProfile(models.Model):
 class Order(models.Model):
     """Customer orders"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    # On PostgreSQL, where shop_order is partitioned by created_at, this is
+    # UNIQUE (order_number, created_at) instead (see shop.partitions)
     order_number = models.CharField(max_length=20, unique=True)
     
     # Billing Information
@@ -174,16 +329,28 @@ class Order(models.Model):
     notes = models.TextField(blank=True, default='')
     
     # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set from the order number's issue time by order_numbers.create_order
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            # Customer order history and profile stats
+            models.Index(fields=['user', 'status', '-created_at'], name='order_user_status_created_idx'),
+            # Admin changelist / date_hierarchy
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.order_number}"
+
+    def next_statuses(self):
+        """(value, label) pairs this order may move to next"""
+        from .order_status import TRANSITIONS
+        return [(value, label) for value, label in ORDER_STATUS if value in TRANSITIONS.get(self.status, ())]
     
     def get_shipping_cost(self):
         """Get shipping cost based on shipping method"""
@@ -198,7 +365,8 @@ class Order(models.Model):
 
 class OrderItem(models.Model):
     """Individual items in an order"""
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # No database FK: shop_order is partitioned on PostgreSQL (shop.partitions)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -211,7 +379,97 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = 'Order Item'
         verbose_name_plural = 'Order Items'
+        indexes = [
+            # "Has this user bought this product" checks and seller order lookups
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
+
 
+class ArchivedOrder(models.Model):
+    """Closed order moved out of Order by `manage.py archive_orders`
+
+    The order and its items are kept as JSON in `data`, or as one line of a
+    gzipped JSONL file in ORDER_ARCHIVE_DIR when `archive_file` is set.
+    """
+    order_number = models.CharField(max_length=20, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=ORDER_STATUS)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(null=True, blank=True)
+    archive_file = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archivedorder_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.order_number}"
+
+
+class AppendOnlyQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise TypeError(f"{self.model.__name__} rows cannot be updated")
+
+    def delete(self):
+        raise TypeError(f"{self.model.__name__} rows cannot be deleted")
+
+
+class OrderStatusEvent(models.Model):
+    """One order status change; written by shop.order_status, never modified
+
+    Kept when the order is archived (order_number stays readable), hence
+    DO_NOTHING and no database FK.
+    """
+    order = models.ForeignKey(
+        Order, on_delete=models.DO_NOTHING, related_name='status_events', db_constraint=False, db_index=False,
+    )
+    order_number = models.CharField(max_length=20)
+    # Set when the change is to one seller's part of the order (multivendor.SellerOrder)
+    seller = models.ForeignKey('multivendor.Seller', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Empty for the event that creates the order
+    from_status = models.CharField(max_length=20, choices=ORDER_STATUS, blank=True, default='')
+    to_status = models.CharField(max_length=20, choices=ORDER_STATUS)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # checkout, seller, admin, backfill ...
+    source = models.CharField(max_length=20, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = AppendOnlyQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # An order's history, oldest first
+            models.Index(fields=['order', 'id'], name='statusevent_order_idx'),
+            # Delivery-time and throughput analytics per target status
+            models.Index(fields=['to_status', 'created_at'], name='statusevent_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.order_number}: {self.from_status or '-'} -> {self.to_status}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("OrderStatusEvent rows cannot be updated")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("OrderStatusEvent rows cannot be deleted")
+
+
+class EventCheckpoint(models.Model):
+    """How far a named consumer has read the OrderStatusEvent log"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
 
 
 class ProductReview(models.Model):
@@ -226,7 +484,8 @@ class ProductReview(models.Model):
     
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)  # Verify purchase
+    # Verify purchase; cleared when the order is archived
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
     rating = models.IntegerField(choices=RATING_CHOICES)
     review = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -234,6 +493,9 @@ class ProductReview(models.Model):
     class Meta:
         unique_together = ('product', 'user', 'order')  # One review per product per order
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.title} ({self.rating} stars)"
@@ -252,20 +514,15 @@ class ProductQuestion(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='question_product_created_idx'),
+            # Seller inbox: only the (small) unanswered set is indexed
+            models.Index(
+                fields=['product', '-created_at'],
+                condition=models.Q(is_answered=False),
+                name='question_unanswered_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Q: {self.question[:50]} - {self.product.title}"
-
-class ProductQuestion(models.Model):
-    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='questions')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_questions')
-    question = models.TextField()
-    answer = models.TextField(blank=True, null=True)
-    answered_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='answered_questions')
-    is_answered = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-    answered_at = models.DateTimeField(blank=True, null=True)
-    class Meta:
-        ordering = ['-created_at']
-    def __str__(self):
-        return f"Q: {self.question[:50]} - {self.product.title}"
\ No newline at end of file
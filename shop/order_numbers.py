@@ -0,0 +1,152 @@
+# shop/order_numbers.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+import os
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .partitions import is_partitioned
+
+
+PREFIX = 'ORD'
+# Crockford base32: digits before letters, so equal-length numbers sort by time.
+# No I, L, O or U, which are easy to misread or mistype.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+EPOCH_MS = int(datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp() * 1000)
+TIME_BITS, NODE_BITS, SEQUENCE_BITS = 41, 10, 12
+# 63 bits -> 13 characters, ORD + 13 = 16 fits Order.order_number (max 20);
+# legacy ORD + 10 random characters never has that length, so they cannot collide
+WIDTH = 13
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# Orders are saved moments after their number is drawn; the slack covers clock skew
+LOOKUP_SLACK = timedelta(days=1)
+
+
+def encode(value, width=WIDTH):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class OrderNumberGenerator:
+    """Snowflake-style ids: milliseconds since EPOCH_MS, node, per-ms sequence
+
+    The node is ORDER_NUMBER_NODE when set (give each worker its own), else
+    random per process; forked workers pick a new one. A collision between
+    two processes on the same node, millisecond and sequence is still
+    possible, which is why create_order retries on IntegrityError.
+    """
+    def __init__(self, node=None):
+        self.lock = threading.Lock()
+        self.fixed_node = node
+        self.reset()
+
+    def reset(self):
+        self.node = (self.fixed_node if self.fixed_node is not None else secrets.randbits(NODE_BITS)) % (1 << NODE_BITS)
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_value(self):
+        with self.lock:
+            now = time.time_ns() // 1_000_000 - EPOCH_MS
+            # Never step back if the wall clock does
+            now = max(now, self.last_ms)
+            if now == self.last_ms:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # 4096 numbers this millisecond already: borrow the next one
+                    now += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node << SEQUENCE_BITS) | self.sequence
+
+    def __call__(self):
+        return PREFIX + encode(self.next_value())
+
+
+def _node_from_settings():
+    node = getattr(settings, 'ORDER_NUMBER_NODE', None)
+    return int(node) if node not in (None, '') else None
+
+
+generator = OrderNumberGenerator(_node_from_settings())
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=generator.reset)
+
+
+def legacy_order_number():
+    """The original scheme: ORD + 10 random characters"""
+    return f"{PREFIX}{get_random_string(10).upper()}"
+
+
+def new_order_number():
+    if getattr(settings, 'ORDER_NUMBER_SCHEME', 'time') == 'random':
+        return legacy_order_number()
+    return generator()
+
+
+def created_at_of(order_number):
+    """When a time-ordered number was issued, or None for legacy numbers"""
+    body = order_number[len(PREFIX):]
+    if not order_number.startswith(PREFIX) or len(body) != WIDTH or not all(c in ALPHABET for c in body):
+        return None
+    ms = (decode(body) >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+def lookup(order_number):
+    """Order filter kwargs; bounded by issue time so PostgreSQL scans one or two partitions"""
+    issued = created_at_of(order_number)
+    if issued is None:
+        return {'order_number': order_number}
+    return {'order_number': order_number, 'created_at__range': (issued - LOOKUP_SLACK, issued + LOOKUP_SLACK)}
+
+
+_partitioned = None
+
+
+def _orders_partitioned():
+    global _partitioned
+    if _partitioned is None:
+        _partitioned = is_partitioned(connection)
+    return _partitioned
+
+
+def create_order(create, attempts=3):
+    """Call create(order_number, created_at) in a savepoint, retrying on IntegrityError
+
+    created_at is the number's issue time, so a duplicate number also
+    duplicates created_at and trips the order number's unique constraint
+    even where that is (order_number, created_at) (see shop.partitions).
+    Legacy numbers carry no issue time and are refused there.
+    """
+    for attempt in range(attempts):
+        number = new_order_number()
+        created_at = created_at_of(number)
+        if created_at is None and _orders_partitioned():
+            raise ImproperlyConfigured(
+                "ORDER_NUMBER_SCHEME = 'random' cannot be used with a partitioned shop_order: "
+                'only time-ordered numbers are unique there.'
+            )
+        try:
+            with transaction.atomic():
+                return create(number, created_at or timezone.now())
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
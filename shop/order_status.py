@@ -0,0 +1,248 @@
+# shop/order_status.py
+"""Order status state machine and the append-only OrderStatusEvent log
+
+Every status change goes through transition() / bulk_transition() /
+transition_seller_order(), which check TRANSITIONS, update the status only
+if it still holds the expected value and append one OrderStatusEvent per
+row in the same transaction. Consumers (dashboards, rollups,
+notifications) read the log incrementally with process_events() instead of
+rescanning orders.
+
+An Order is split into one multivendor.SellerOrder per seller at checkout.
+Changing an Order moves its seller orders along where they can follow;
+changing a seller order rolls the parent up to the status of the slowest
+seller that has not cancelled.
+"""
+from collections import deque
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from multivendor.models import SellerOrder
+from .models import EventCheckpoint, Order, OrderItem, OrderStatusEvent
+
+
+TRANSITIONS = {
+    'PENDING': {'PROCESSING', 'SHIPPED', 'CANCELLED'},
+    'PROCESSING': {'SHIPPED', 'CANCELLED'},
+    'SHIPPED': {'DELIVERED'},
+    'DELIVERED': set(),
+    'CANCELLED': set(),
+}
+PROGRESS = ['PENDING', 'PROCESSING', 'SHIPPED', 'DELIVERED']
+# Older spellings still posted by clients (multivendor called SHIPPED "on the way")
+ALIASES = {'ON_THE_WAY': 'SHIPPED'}
+# Events committed out of id order become visible late; consumers stay this far behind
+SETTLE = timedelta(seconds=5)
+
+
+class InvalidTransition(ValueError):
+    def __init__(self, order, status):
+        self.order, self.status = order, status
+        super().__init__(f"Order #{order.order_number} cannot go from {order.status} to {status}")
+
+
+def normalize(status):
+    return ALIASES.get(status, status)
+
+
+def allowed(current, status):
+    return normalize(status) in TRANSITIONS.get(current, set())
+
+
+def sources_of(status):
+    return [current for current in TRANSITIONS if allowed(current, status)]
+
+
+def path(current, target):
+    """Shortest list of steps from `current` to `target`; empty if unreachable"""
+    previous = {current: None}
+    queue = deque([current])
+    while queue:
+        status = queue.popleft()
+        if status == target:
+            steps = []
+            while status != current:
+                steps.append(status)
+                status = previous[status]
+            return steps[::-1]
+        for following in PROGRESS + ['CANCELLED']:
+            if following in TRANSITIONS.get(status, ()) and following not in previous:
+                previous[following] = status
+                queue.append(following)
+    return []
+
+
+def rollup(statuses):
+    """Parent order status for its seller orders' statuses"""
+    active = [status for status in statuses if status != 'CANCELLED']
+    if not active:
+        return 'CANCELLED' if statuses else None
+    slowest = min(active, key=PROGRESS.index)
+    if slowest == 'PENDING' and any(status != 'PENDING' for status in active):
+        return 'PROCESSING'
+    return slowest
+
+
+def record_created(order, actor=None, source='checkout'):
+    """Split a new order into seller orders and log their first events
+
+    Call once the order's items exist. Items of products without a seller
+    stay on the parent order only. The events are stamped now rather than
+    with the order's created_at, which may be in the past (admin), so
+    process_events() can tell when they have settled.
+    """
+    return record_created_many([order], actor, source)
+
+
+def record_created_many(orders, actor=None, source='checkout'):
+    """record_created() for several orders, in one query and two bulk inserts"""
+    now = timezone.now()
+    by_id = {order.id: order for order in orders}
+    shares = (
+        OrderItem.objects.filter(order_id__in=by_id, product__seller__isnull=False).order_by('order_id')
+        .values('order_id', 'product__seller').annotate(subtotal=Sum('subtotal'), item_count=Sum('quantity'))
+    )
+    seller_orders = SellerOrder.objects.bulk_create([
+        SellerOrder(
+            order=order, seller_id=share['product__seller'], user_id=order.user_id,
+            order_number=order.order_number, subtotal=share['subtotal'], item_count=share['item_count'],
+            status=order.status, created_at=order.created_at,
+        )
+        for share in shares
+        for order in [by_id[share['order_id']]]
+    ])
+    sellers = {}
+    for seller_order in seller_orders:
+        sellers.setdefault(seller_order.order_id, []).append(seller_order.seller_id)
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(
+            order=order, order_number=order.order_number, seller_id=seller_id, from_status='',
+            to_status=order.status, actor=actor, source=source, created_at=now,
+        )
+        for order in orders
+        for seller_id in [None] + sellers.get(order.id, [])
+    ])
+    return seller_orders
+
+
+def _cascade(order_ids, status, actor, source, now):
+    """Move the seller orders of `order_ids` that can follow their parent to `status`"""
+    rows = list(
+        SellerOrder.objects.filter(order_id__in=order_ids, status__in=sources_of(status)).order_by()
+        .select_for_update().values_list('pk', 'order_id', 'order_number', 'seller_id', 'status')
+    )
+    if not rows:
+        return
+    SellerOrder.objects.filter(pk__in=[row[0] for row in rows]).update(status=status, updated_at=now)
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(
+            order_id=order_id, order_number=number, seller_id=seller_id, from_status=current,
+            to_status=status, actor=actor, source=source, created_at=now,
+        )
+        for _, order_id, number, seller_id, current in rows
+    ])
+
+
+def _move(model, obj, status, actor, source, now, **event):
+    """Conditional UPDATE of one row plus its event; raises InvalidTransition"""
+    updated = model.objects.filter(pk=obj.pk, status=obj.status).update(status=status, updated_at=now)
+    if not updated:
+        obj.refresh_from_db(fields=['status'])
+        raise InvalidTransition(obj, status)
+    OrderStatusEvent.objects.create(
+        order_number=obj.order_number, from_status=obj.status, to_status=status,
+        actor=actor, source=source, created_at=now, **event,
+    )
+    obj.status, obj.updated_at = status, now
+
+
+def transition(order, status, actor=None, source=''):
+    """Move one order (and its seller orders) to `status`; raises InvalidTransition
+
+    The UPDATE is conditional on the status this process last saw, so two
+    concurrent changes cannot both succeed from the same state.
+    """
+    status = normalize(status)
+    if not allowed(order.status, status):
+        raise InvalidTransition(order, status)
+    now = timezone.now()
+    with transaction.atomic():
+        _move(Order, order, status, actor, source, now, order=order)
+        _cascade([order.pk], status, actor, source, now)
+
+
+def transition_seller_order(seller_order, status, actor=None, source='seller'):
+    """Move one seller's part of an order, then roll the parent order up"""
+    status = normalize(status)
+    if not allowed(seller_order.status, status):
+        raise InvalidTransition(seller_order, status)
+    now = timezone.now()
+    with transaction.atomic():
+        _move(
+            SellerOrder, seller_order, status, actor, source, now,
+            order_id=seller_order.order_id, seller_id=seller_order.seller_id,
+        )
+        order = Order.objects.select_for_update().filter(pk=seller_order.order_id).first()
+        if order is None:
+            # Archived: the seller order lives on alone
+            return
+        statuses = SellerOrder.objects.filter(order_id=order.pk).values_list('status', flat=True)
+        for step in path(order.status, rollup(list(statuses))):
+            _move(Order, order, step, actor, 'rollup', now, order=order)
+
+
+def bulk_transition(queryset, status, actor=None, source='', batch_size=1000):
+    """transition() for every order in `queryset` that may move to `status`
+
+    Orders whose current status does not allow it are left alone. Runs one
+    UPDATE and one bulk INSERT per batch (plus the same for seller orders);
+    returns the number of orders moved.
+    """
+    status = normalize(status)
+    moved = 0
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(status__in=sources_of(status)).order_by()
+            .select_for_update().values_list('pk', 'order_number', 'status')
+        )
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            ids = [pk for pk, _, _ in batch]
+            now = timezone.now()
+            Order.objects.filter(pk__in=ids).update(status=status, updated_at=now)
+            OrderStatusEvent.objects.bulk_create([
+                OrderStatusEvent(
+                    order_id=pk, order_number=number, from_status=current, to_status=status,
+                    actor=actor, source=source, created_at=now,
+                )
+                for pk, number, current in batch
+            ])
+            _cascade(ids, status, actor, source, now)
+            moved += len(batch)
+    return moved
+
+
+def process_events(name, handler, batch_size=500, settle=SETTLE):
+    """Feed events after checkpoint `name` to handler(events); returns how many
+
+    The checkpoint row is locked while the batch is handled and advanced in
+    the same transaction, so an exception in handler() leaves it unchanged
+    and two workers never process the same batch. A batch ends before the
+    first event younger than `settle`: an id drawn earlier may still be
+    uncommitted, and ids need not follow created_at, so nothing past it is
+    read either.
+    """
+    with transaction.atomic():
+        checkpoint, _ = EventCheckpoint.objects.select_for_update().get_or_create(name=name)
+        cutoff = timezone.now() - settle
+        events = list(OrderStatusEvent.objects.filter(id__gt=checkpoint.position).order_by('id')[:batch_size])
+        settled = next((i for i, event in enumerate(events) if event.created_at > cutoff), len(events))
+        events = events[:settled]
+        if events:
+            handler(events)
+            checkpoint.position = events[-1].id
+            checkpoint.save(update_fields=['position', 'updated_at'])
+    return len(events)
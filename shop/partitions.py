@@ -0,0 +1,214 @@
+# shop/partitions.py
+"""Monthly range partitions of shop_order by created_at (PostgreSQL only)
+
+Other backends (SQLite) keep a plain table and rely on order_created_idx;
+callers check is_partitioned() before using the helpers below.
+
+PostgreSQL requires the partition key in every unique constraint of a
+partitioned table, so partitioning replaces UNIQUE (order_number) with
+UNIQUE (order_number, created_at). That is as strict for time-ordered
+numbers, whose created_at order_numbers.create_order derives from the
+number, and is why it refuses legacy random numbers on a partitioned table.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+
+PARENT = 'shop_order'
+DEFAULT_PARTITION = 'shop_order_default'
+# (name, definition) of the order number's unique constraint, plain and partitioned
+ORDER_NUMBER_UNIQUE = (f'{PARENT}_order_number_key', 'UNIQUE (order_number)')
+PARTITIONED_ORDER_NUMBER_UNIQUE = ('order_number_created_uniq', 'UNIQUE (order_number, created_at)')
+
+
+def month_start(value):
+    """First day of the (UTC) month containing a date or datetime"""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_p{month:%Y_%m}'
+
+
+def bound(month):
+    # Partition bounds are DDL and cannot be passed as query parameters
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [PARENT],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(connection):
+    """Monthly partitions as {month: table name}, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s) AND c.relname <> %s ORDER BY c.relname
+            """,
+            [PARENT, DEFAULT_PARTITION],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {date(int(name[-7:-3]), int(name[-2:]), 1): name for name in names}
+
+
+def ensure_partition(connection, month):
+    """Create the partition for `month`; returns False if it already exists
+
+    Rows that landed in the default partition because their month was
+    missing are moved into the new partition.
+    """
+    name = partition_name(month)
+    qn = connection.ops.quote_name
+    start, end = bound(month), bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f'SELECT 1 FROM {qn(DEFAULT_PARTITION)} WHERE created_at >= {start} AND created_at < {end} LIMIT 1'
+        )
+        stranded = cursor.fetchone() is not None
+        if stranded:
+            cursor.execute(f'ALTER TABLE {qn(PARENT)} DETACH PARTITION {qn(DEFAULT_PARTITION)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(name)} PARTITION OF {qn(PARENT)} FOR VALUES FROM ({start}) TO ({end})'
+        )
+        if stranded:
+            where = f'created_at >= {start} AND created_at < {end}'
+            cursor.execute(f'INSERT INTO {qn(name)} SELECT * FROM {qn(DEFAULT_PARTITION)} WHERE {where}')
+            cursor.execute(f'DELETE FROM {qn(DEFAULT_PARTITION)} WHERE {where}')
+            cursor.execute(f'ALTER TABLE {qn(PARENT)} ATTACH PARTITION {qn(DEFAULT_PARTITION)} DEFAULT')
+    return True
+
+
+def ensure_partitions(connection, months_ahead=3, since=None):
+    """Partitions from `since` (default: this month) to `months_ahead` months out"""
+    current = month_start(timezone.now())
+    month = month_start(since) if since else current
+    created = []
+    while month <= add_months(current, months_ahead):
+        if ensure_partition(connection, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def drop_empty_partitions(connection, before):
+    """Drop monthly partitions that end before `before` and hold no rows"""
+    qn = connection.ops.quote_name
+    dropped = []
+    for month, name in partitions(connection).items():
+        if add_months(month, 1) > month_start(before):
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {qn(name)} LIMIT 1')
+            if cursor.fetchone() is None:
+                cursor.execute(f'DROP TABLE {qn(name)}')
+                dropped.append(name)
+    return dropped
+
+
+def _table_definition(cursor, table):
+    """Index DDL and constraint definitions other than the primary key"""
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x
+        WHERE x.indrelid = to_regclass(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = x.indexrelid)
+        """,
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype <> 'p'
+        """,
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _replace_constraint(constraints, old, new):
+    """`constraints` with the one defined as old's definition swapped for `new`"""
+    return [new if definition == old[1] else (name, definition) for name, definition in constraints]
+
+
+def _restore_definition(cursor, table, indexes, constraints, quote_name):
+    for ddl in indexes:
+        # Definitions read from a partitioned parent are `ON ONLY`, which would skip the rows
+        cursor.execute(ddl.replace(' ON ONLY ', ' ON ', 1))
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE {quote_name(table)} ADD CONSTRAINT {quote_name(name)} {definition}')
+
+
+def partition_orders(connection, months_ahead=3):
+    """Rebuild shop_order as a table partitioned by created_at month
+
+    Runs inside the migration transaction and holds an exclusive lock on
+    shop_order while rows are copied.
+    """
+    qn = connection.ops.quote_name
+    old = f'{PARENT}_unpartitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(PARENT)} IN ACCESS EXCLUSIVE MODE')
+        indexes, constraints = _table_definition(cursor, PARENT)
+        constraints = _replace_constraint(constraints, ORDER_NUMBER_UNIQUE, PARTITIONED_ORDER_NUMBER_UNIQUE)
+        cursor.execute(f'SELECT MIN(created_at), MAX(id) FROM {qn(PARENT)}')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(PARENT)} RENAME TO {qn(old)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(PARENT)} (LIKE {qn(old)} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'CREATE TABLE {qn(DEFAULT_PARTITION)} PARTITION OF {qn(PARENT)} DEFAULT')
+    ensure_partitions(connection, months_ahead, since=oldest)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(PARENT)} SELECT * FROM {qn(old)}')
+        # Frees the index, constraint and identity sequence names for reuse
+        cursor.execute(f'DROP TABLE {qn(old)}')
+
+        # Identity columns cannot be declared on the partitioned parent here; an owned sequence can
+        sequence = f'{PARENT}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(PARENT)}.id')
+        cursor.execute('SELECT setval(%s, %s, false)', [sequence, (max_id or 0) + 1])
+        cursor.execute(f"ALTER TABLE {qn(PARENT)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {qn(PARENT)} ADD PRIMARY KEY (id, created_at)')
+        _restore_definition(cursor, PARENT, indexes, constraints, qn)
+
+
+def unpartition_orders(connection):
+    """Reverse of partition_orders: a plain shop_order with an identity id"""
+    qn = connection.ops.quote_name
+    old = f'{PARENT}_partitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(PARENT)} IN ACCESS EXCLUSIVE MODE')
+        indexes, constraints = _table_definition(cursor, PARENT)
+        constraints = _replace_constraint(constraints, PARTITIONED_ORDER_NUMBER_UNIQUE, ORDER_NUMBER_UNIQUE)
+        cursor.execute(f'ALTER TABLE {qn(PARENT)} RENAME TO {qn(old)}')
+        cursor.execute(f'CREATE TABLE {qn(PARENT)} (LIKE {qn(old)})')
+        cursor.execute(f'INSERT INTO {qn(PARENT)} SELECT * FROM {qn(old)}')
+        cursor.execute(f'DROP TABLE {qn(old)} CASCADE')
+        cursor.execute(f'ALTER TABLE {qn(PARENT)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {qn(PARENT)}",
+            [PARENT],
+        )
+        cursor.execute(f'ALTER TABLE {qn(PARENT)} ADD PRIMARY KEY (id)')
+        _restore_definition(cursor, PARENT, indexes, constraints, qn)
@@ -0,0 +1,238 @@
+# shop/prerender.py
+"""Pre-rendered HTML for pages that are the same for every anonymous visitor
+
+`manage.py prerender_pages` renders each of pages() as an anonymous
+visitor and writes it gzipped to PRERENDER_ROOT. SnapshotMiddleware serves
+those files to GET/HEAD requests that carry no session or messages cookie
+(so no login and no guest cart) and no query string, with an ETag.
+
+Freshness is tracked with one marker file: every catalog change
+(shop.signals) stamps it with a new mtime, and again once it commits, and a
+snapshot is written with the mtime the marker had when rendering started. A
+snapshot whose mtime differs from the marker's is stale and the request goes
+to the view. Writers only stamp the marker; `prerender_pages --watch`
+re-renders stale snapshots every PRERENDER_WATCH_SECONDS, so a burst of
+changes costs one render of each page and no writer waits for one.
+Nothing happens until prerender_pages has been run once.
+
+Snapshots and the marker are files on this host. A write on another host
+does not stamp them; the watcher notices it from the catalog clock
+(shop.catalog_version) and re-renders, so until then, up to
+PRERENDER_WATCH_SECONDS, this host serves the old pages. Run the watcher on
+every host, or point PRERENDER_ROOT at storage all hosts share and run it
+on one.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import resolve, reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from . import catalog_version
+
+logger = logging.getLogger(__name__)
+
+MARKER = '.changed'
+
+
+def pages():
+    """Paths that get a snapshot"""
+    from .views import CATEGORY_SLUGS
+
+    return [
+        reverse('home'), reverse('about'), reverse('contact'), reverse('testimonial'),
+        *(reverse('shop-items', args=[slug]) for slug in CATEGORY_SLUGS),
+    ]
+
+
+def snapshot_path(path):
+    return os.path.join(settings.PRERENDER_ROOT, (path.strip('/') or 'index') + '.html.gz')
+
+
+def _marker():
+    return os.path.join(settings.PRERENDER_ROOT, MARKER)
+
+
+def generation():
+    """The marker's mtime in ns, or None before the first prerender"""
+    try:
+        return os.stat(_marker()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def mark_stale():
+    """Stamp the marker so every snapshot reads as stale; returns the new generation"""
+    now = time.time_ns()
+    with open(_marker(), 'a'):
+        pass
+    os.utime(_marker(), ns=(now, now))
+    return now
+
+
+def render(path):
+    """HTML of `path` as an anonymous visitor without a session sees it"""
+    request = WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.input': BytesIO(),
+        'wsgi.url_scheme': 'http',
+    })
+    request.user = AnonymousUser()
+    match = resolve(path)
+    # Read from the primary, not a replica that may lag behind the change
+    with transaction.atomic():
+        response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        raise ValueError(f'{path} answered {response.status_code}')
+    return response.content
+
+
+def write(path, html, stamp):
+    target = snapshot_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(html, compresslevel=9, mtime=0))
+        os.utime(tmp, ns=(stamp, stamp))
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def prerender(paths=None):
+    """Render and write snapshots; returns the paths written
+
+    A page that fails to render is logged and keeps its stale snapshot,
+    so its requests keep going to the view.
+    """
+    os.makedirs(settings.PRERENDER_ROOT, exist_ok=True)
+    stamp = generation() or mark_stale()
+    written = []
+    for path in paths or pages():
+        try:
+            write(path, render(path), stamp)
+        except Exception:
+            logger.exception('Could not pre-render %s', path)
+        else:
+            written.append(path)
+    return written
+
+
+def stale():
+    """Whether any snapshot is older than the marker; False before the first prerender"""
+    stamp = generation()
+    if stamp is None:
+        return False
+    try:
+        return any(os.stat(snapshot_path(path)).st_mtime_ns != stamp for path in pages())
+    except FileNotFoundError:
+        return True
+
+
+def sync(version):
+    """One step of watch(): re-render stale snapshots; returns the catalog version they follow
+
+    `version` is the one the last step returned. A clock that has moved past
+    it without stamping the marker was moved by a write on another host.
+    """
+    current = catalog_version.current()[0]
+    if current != version and generation() is not None:
+        mark_stale()
+    if stale():
+        prerender()
+    return current
+
+
+def watch(seconds, version=None, stop=None):
+    """Call sync() every `seconds` until `stop` is set (prerender_pages --watch)"""
+    stop = stop or threading.Event()
+    while not stop.wait(seconds):
+        try:
+            version = sync(version)
+        except Exception:
+            logger.exception('Snapshot refresh failed')
+        finally:
+            connection.close()
+
+
+def catalog_changed():
+    """Hook for catalog writes: mark snapshots stale now and once the write commits
+
+    The second stamp outdates a snapshot rendered from before the commit.
+    """
+    if generation() is None:
+        return
+    mark_stale()
+    transaction.on_commit(mark_stale)
+
+
+class SnapshotMiddleware:
+    """Answer anonymous GETs of pre-rendered pages from PRERENDER_ROOT
+
+    Must come after CsrfViewMiddleware, which sets the CSRF cookie the
+    snapshot's forms and scripts rely on.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = None
+        # path: (mtime_ns, gzipped bytes, etag)
+        self.loaded = {}
+
+    def __call__(self, request):
+        snapshot = self.lookup(request)
+        if snapshot is None:
+            return self.get_response(request)
+        body, etag = snapshot
+        get_token(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                response = HttpResponse(body, content_type='text/html; charset=utf-8')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(gzip.decompress(body), content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+        return response
+
+    def lookup(self, request):
+        if request.method not in ('GET', 'HEAD') or request.META.get('QUERY_STRING'):
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+            return None
+        if self.paths is None:
+            self.paths = set(pages())
+        if request.path not in self.paths:
+            return None
+        stamp = generation()
+        try:
+            mtime = os.stat(snapshot_path(request.path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != stamp:
+            return None
+        cached = self.loaded.get(request.path)
+        if cached is None or cached[0] != mtime:
+            with open(snapshot_path(request.path), 'rb') as f:
+                body = f.read()
+            etag = f'W/"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+            cached = self.loaded[request.path] = (mtime, body, etag)
+        return cached[1], cached[2]
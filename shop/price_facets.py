@@ -0,0 +1,123 @@
+# shop/price_facets.py
+"""Product counts per price band, for the shop sidebar
+
+compute() reads every product's category and price, and every product-tag
+link, in three queries and bins them with NumPy: searchsorted puts each
+price in one of BANDS, and a single bincount over (scope, band) pairs counts
+the whole catalog, each category, each tag and each category and tag pair at
+once. The result is cached under the catalog clock's version, like the
+product cards (shop.cards), so it is recomputed once per catalog change and
+a shop page reads it with one cache get instead of aggregate queries.
+"""
+import numpy as np
+
+from django.core.cache import cache
+
+from .filters import CENT
+from .models import Product, Tag
+
+
+# Lower edge of each band; the last one is open-ended
+BANDS = (0, 50, 100, 200, 500, 1000, 2000)
+# Bump when BANDS or the cached layout changes
+FACETS_VERSION = 1
+TIMEOUT = 24 * 60 * 60
+# Longest a crashed recompute keeps others from retrying
+LOCK_TIMEOUT = 60
+
+
+def _counts(scopes, bands, n_scopes):
+    """Band counts per scope, from parallel arrays of scope and band indexes"""
+    flat = np.bincount(scopes * len(BANDS) + bands, minlength=n_scopes * len(BANDS))
+    return flat.reshape(n_scopes, len(BANDS))
+
+
+def compute():
+    """{'all': counts, 'category': {code: counts}, 'tag': {name: counts},
+    'category_tag': {(code, name): counts}}, counts being one int per band"""
+    rows = list(Product.objects.order_by('id').values_list('id', 'category', 'discounted_price'))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    prices = np.array([row[2] for row in rows], dtype=np.float64)
+    bands = np.clip(np.searchsorted(np.array(BANDS, dtype=np.float64), prices, side='right') - 1, 0, None)
+    codes, category = np.unique(np.array([row[1] for row in rows], dtype=str), return_inverse=True)
+
+    names = dict(Tag.objects.values_list('id', 'name'))
+    links = list(Product.tags.through.objects.values_list('product_id', 'tag_id'))
+    tag_ids = np.array(sorted(names), dtype=np.int64)
+    # Row of each link's product, and index of its tag in tag_ids
+    row = np.searchsorted(ids, np.array([link[0] for link in links], dtype=np.int64))
+    tag = np.searchsorted(tag_ids, np.array([link[1] for link in links], dtype=np.int64))
+
+    by_category = _counts(category, bands, len(codes))
+    by_tag = _counts(tag, bands[row], len(tag_ids))
+    by_pair = _counts(category[row] * len(tag_ids) + tag, bands[row], len(codes) * len(tag_ids))
+    return {
+        'all': np.bincount(bands, minlength=len(BANDS)).tolist(),
+        'category': {str(code): counts.tolist() for code, counts in zip(codes, by_category)},
+        'tag': {names[int(pk)]: counts.tolist() for pk, counts in zip(tag_ids, by_tag) if counts.any()},
+        'category_tag': {
+            (str(codes[i // len(tag_ids)]), names[int(tag_ids[i % len(tag_ids)])]): counts.tolist()
+            for i, counts in enumerate(by_pair) if counts.any()
+        },
+    }
+
+
+def get(version):
+    """compute() for prices version `version`, from the cache when it can
+
+    While another request recomputes it, the last computed counts.
+    """
+    key = f'price-facets:{FACETS_VERSION}:{version}'
+    latest = f'price-facets:{FACETS_VERSION}:latest'
+    facets = cache.get(key)
+    if facets is not None:
+        return facets
+    locked = cache.add(f'{key}:lock', True, LOCK_TIMEOUT)
+    if not locked:
+        facets = cache.get(latest)
+        if facets is not None:
+            return facets
+    try:
+        facets = compute()
+        cache.set_many({key: facets, latest: facets}, TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(f'{key}:lock')
+    return facets
+
+
+def scope_counts(facets, category=None, tags=(), search=None, seller=None):
+    """Band counts for products in `category` carrying the tag in `tags`, or None
+
+    Several tags match products carrying any of them, which the
+    precomputed counts cannot tell apart from products carrying both. A
+    search or seller filter narrows the listing past what they count.
+    """
+    if len(tags) > 1 or search or seller:
+        return None
+    empty = [0] * len(BANDS)
+    if not tags:
+        return facets['category'].get(category, empty) if category else facets['all']
+    # Tags are matched case-insensitively, as in shop.filters
+    tag = {name.lower(): name for name in facets['tag']}.get(tags[0].lower())
+    if tag is None:
+        return empty
+    if category:
+        return facets['category_tag'].get((category, tag), empty)
+    return facets['tag'][tag]
+
+
+def bands(counts):
+    """[{'min': ..., 'max': ... or None, 'count': ...}] for counts from scope_counts()
+
+    A band's max is the cent below the next edge; max_price takes in that
+    whole cent (shop.filters), so the link matches the band's count.
+    """
+    return [
+        {
+            'min': low,
+            'max': round(BANDS[i + 1] - CENT, 2) if i + 1 < len(BANDS) else None,
+            'count': count,
+        }
+        for i, (low, count) in enumerate(zip(BANDS, counts))
+    ]
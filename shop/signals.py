@@ -0,0 +1,148 @@
+# shop/signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import Signal, receiver
+import logging
+
+from . import autocomplete, catalog_version, prerender
+from .cart import SessionCart
+from .db_routers import pin_to_primary
+from multivendor.models import Seller
+from .models import Cart, CartItem, Product, Tag, ProductReview, ProductQuestion
+
+logger = logging.getLogger(__name__)
+
+# Sent once after a bulk catalog write that bypasses model signals (e.g. a
+# price campaign's bulk_update), with `product_ids` and `names=False` when no
+# title changed or `prices=False` when no price did (see catalog_version.tick);
+# cache invalidation for such writes hangs off this instead of off thousands
+# of post_save calls
+catalog_changed = Signal()
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    """Merge the guest session cart into the user's Cart on login"""
+    if request is None or not hasattr(request, 'session'):
+        return
+    session_cart = SessionCart(request)
+    quantities = session_cart.quantities()
+    if not quantities:
+        return
+
+    try:
+        cart, created = Cart.objects.get_or_create(user=user)
+        existing = {}
+        if not created:
+            existing = dict(
+                cart.items.filter(product_id__in=quantities).values_list('product_id', 'quantity')
+            )
+        # Products deleted while sitting in the guest cart would violate the FK
+        valid_ids = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_id=pk, quantity=existing.get(pk, 0) + qty)
+                for pk, qty in quantities.items() if pk in valid_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        session_cart.clear()
+    except Exception as e:
+        logger.error(f"Error merging session cart: {str(e)}")
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_save, sender=ProductQuestion)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=ProductReview)
+@receiver(post_delete, sender=ProductQuestion)
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(catalog_changed)
+def pin_catalog_writer(sender, **kwargs):
+    """A user who just changed catalog data reads it back from the primary"""
+    pin_to_primary()
+
+
+# The clock moves before snapshots re-render, so they pick up new card keys
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_save, sender=ProductQuestion)
+@receiver(post_delete, sender=ProductReview)
+@receiver(post_delete, sender=ProductQuestion)
+def product_changed(sender, instance, **kwargs):
+    """A product, or a review or question shown with it"""
+    if sender is Product:
+        catalog_version.tick([instance.pk], names=True, prices=True)
+    else:
+        catalog_version.tick([instance.product_id])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog_version.tick(names=True, prices=True)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def product_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        catalog_version.tick([instance.pk], prices=True)
+    elif action == 'pre_clear':
+        # pk_set is not given for a clear; these are the products losing the tag
+        catalog_version.tick(Product.objects.filter(tags=instance), prices=True)
+    else:
+        catalog_version.tick(pk_set, prices=True)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    """A renamed or deleted tag changes every product carrying it"""
+    catalog_version.tick(Product.objects.filter(tags=instance), names=True, prices=True)
+
+
+@receiver(post_save, sender=Seller)
+@receiver(post_delete, sender=Seller)
+def seller_changed(sender, instance, created=False, **kwargs):
+    """The API shows the seller's shop name with each product; autocomplete suggests it"""
+    catalog_version.tick(None if created else Product.objects.filter(seller=instance), names=True)
+
+
+@receiver(catalog_changed)
+def bulk_catalog_change(sender, product_ids=(), names=True, prices=True, **kwargs):
+    catalog_version.tick(product_ids, names=names, prices=prices)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Seller)
+def index_suggestion(sender, instance, **kwargs):
+    autocomplete.suggestions.saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Seller)
+def unindex_suggestion(sender, instance, **kwargs):
+    autocomplete.suggestions.deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=ProductReview)
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(catalog_changed)
+def refresh_snapshots(sender, **kwargs):
+    """Home and category pages show product cards"""
+    prerender.catalog_changed()
@@ -0,0 +1,122 @@
+# shop/slow_queries.py
+from logging.handlers import WatchedFileHandler
+import hashlib
+import json
+import linecache
+import logging
+import os
+import re
+import sys
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+
+logger = logging.getLogger('shop.slow_queries')
+
+# Application code whose frames are reported as the call site
+APP_DIRS = tuple(
+    os.path.join(str(settings.BASE_DIR), app) + os.sep for app in ('shop', 'multivendor')
+)
+# Instrumentation frames are never the interesting call site
+SKIP_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(str(settings.BASE_DIR), 'shop', 'middleware.py'),
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """SQL with literals and placeholders replaced by `?` and IN lists collapsed"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """Short stable id for a normalized statement"""
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()[:16]
+
+
+def call_site():
+    """Innermost frame in shop/ or multivendor/ that led to the query"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(APP_DIRS) and filename not in SKIP_FILES:
+            return {
+                'file': os.path.relpath(filename, settings.BASE_DIR),
+                'line': frame.f_lineno,
+                'function': frame.f_code.co_name,
+                'code': linecache.getline(filename, frame.f_lineno).strip(),
+            }
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLogger:
+    """Database execute wrapper that logs statements slower than a threshold"""
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.log(sql, duration, many, context)
+
+    def log(self, sql, duration, many, context):
+        try:
+            logger.warning(json.dumps({
+                'ts': timezone.now().isoformat(),
+                'duration_ms': round(duration * 1000, 3),
+                'fingerprint': fingerprint(sql),
+                'sql': normalize_sql(sql),
+                'many': many,
+                'database': context['connection'].alias,
+                'call_site': call_site(),
+            }))
+        except Exception:
+            # Never let diagnostics break the query that was being run
+            pass
+
+
+_wrapper = None
+
+
+def attach(sender, connection, **kwargs):
+    """connection_created receiver: add the wrapper to each new connection"""
+    if _wrapper is not None and _wrapper not in connection.execute_wrappers:
+        # Inserted first: execute_wrapper() context managers pop from the end
+        connection.execute_wrappers.insert(0, _wrapper)
+
+
+def install():
+    """Enable the slow query log if SLOW_QUERY_LOG_ENABLED is set"""
+    global _wrapper
+    if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False) or _wrapper is not None:
+        return
+    path = settings.SLOW_QUERY_LOG_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Not RotatingFileHandler: gunicorn workers would each rotate the shared
+    # file under the others. This one reopens it after external rotation
+    handler = WatchedFileHandler(path, delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+
+    _wrapper = SlowQueryLogger(getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100))
+    connection_created.connect(attach, dispatch_uid='shop.slow_queries')
@@ -0,0 +1,24 @@
+# shop/templatetags/product_cards.py
+from django import template
+from django.utils.safestring import mark_safe
+
+from .. import cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_card(product, variant='card'):
+    """{% product_card product %}: one cached card
+
+    Works like an inclusion tag of the card template, but the HTML comes
+    from the cache when the product has not changed.
+    """
+    return mark_safe(cards.render_many([product], variant)[0])
+
+
+@register.simple_tag
+def product_cards(products, variant='card'):
+    """{% product_cards products as cards %}: every card of a list with one cache lookup"""
+    return [mark_safe(card) for card in cards.render_many(products, variant)]
@@ -1,3 +1,1854 @@
-from django.test import TestCase
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+import difflib
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import Http404, QueryDict
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from multivendor.models import Seller, SellerOrder
+from .models import (
+    CatalogClock, Product, Tag, Cart, CartItem, Order, OrderItem, ProductReview, ProductQuestion, ArchivedOrder,
+    EventCheckpoint, OrderStatusEvent, StockReservation, PriceCampaign, CampaignPrice,
+)
+from . import (
+    api, autocomplete, campaigns, cards, catalog_version, db_routers, fuzzy, price_facets, inventory, middleware,
+    order_numbers, order_status, partitions, prerender, slow_queries,
+)
+from .signals import catalog_changed
+from .archive import archive_orders
+from .cart import SessionCart
+from .checks import check_static_compression
+from .filters import CENT, filter_products
+from .media import ContentHashedStorage, serve_media
+from .middleware import registry
+from .order_numbers import OrderNumberGenerator
+
+
+class HotQueryIndexTests(TestCase):
+    """EXPLAIN the hot query shapes and fail on a sequential scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pw12345xx')
+        seller_user = User.objects.create_user('seller', password='pw12345xx')
+        cls.seller = Seller.objects.create(user=seller_user, shop_name='Green Farm')
+        products = Product.objects.bulk_create([
+            Product(
+                seller=cls.seller if i % 4 == 0 else None,
+                title=f'Product {i}',
+                regular_price=100,
+                discounted_price=80 + i % 20,
+                descriptions='Fresh from the farm',
+                category=['F', 'V', 'DF', 'M', 'FH', 'B'][i % 6],
+                product_image='product_image/test.jpg',
+            )
+            for i in range(300)
+        ])
+        cls.product = products[0]
+        orders = Order.objects.bulk_create([
+            Order(
+                user=cls.user,
+                order_number=f'ORD{i:010d}',
+                first_name='A', last_name='B', email='a@example.com', phone='01700000000',
+                address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+                payment_method='COD', subtotal=100, total=100,
+                status=['PENDING', 'DELIVERED'][i % 2],
+            )
+            for i in range(200)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=orders[i], product=products[i % 50], quantity=1, price=80, subtotal=80)
+            for i in range(200)
+        ])
+        ProductReview.objects.bulk_create([
+            ProductReview(product=products[i % 50], user=cls.user, order=orders[i], rating=5, review='Very fresh indeed')
+            for i in range(200)
+        ])
+        ProductQuestion.objects.bulk_create([
+            ProductQuestion(product=products[i % 50], user=cls.user, question='Is it organic?', is_answered=i % 3 == 0)
+            for i in range(200)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def hot_queries(self):
+        return {
+            'product_by_category': Product.objects.filter(category='F'),
+            'product_by_seller': Product.objects.filter(seller=self.seller),
+            'orders_by_user_status': Order.objects.filter(user=self.user, status='PENDING'),
+            'orderitem_purchase_check': OrderItem.objects.filter(
+                product=self.product, order__user=self.user, order__status='DELIVERED'
+            ),
+            'reviews_by_product': ProductReview.objects.filter(product=self.product),
+            'questions_by_product': ProductQuestion.objects.filter(product=self.product),
+            'unanswered_seller_questions': ProductQuestion.objects.filter(
+                product__seller=self.seller, is_answered=False
+            ),
+        }
+
+    def seq_scans(self, plan):
+        """Return the plan lines that read a whole table"""
+        if connection.vendor == 'postgresql':
+            return [line for line in plan.splitlines() if 'Seq Scan' in line]
+        # SQLite: "SCAN table" without an index is a full table scan
+        return [
+            line for line in plan.splitlines()
+            if ' SCAN ' in f' {line} ' and 'INDEX' not in line
+        ]
+
+    def test_hot_queries_use_indexes(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would otherwise always be seq-scanned
+                cursor.execute('SET enable_seqscan = off')
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertEqual(self.seq_scans(plan), [], f'{name} falls back to a sequential scan:\n{plan}')
+
+
+# ============================================================
+# QUERY BUDGETS
+# ============================================================
+
+def seed_catalog(scale):
+    """Seller, buyer and `scale` products, cart lines, orders, reviews and questions"""
+    buyer = User.objects.create_user(f'buyer{scale}', email=f'buyer{scale}@example.com', password='pw12345xx')
+    seller_user = User.objects.create_user(f'seller{scale}', password='pw12345xx')
+    seller = Seller.objects.create(user=seller_user, shop_name=f'Farm {scale}')
+    products = Product.objects.bulk_create([
+        Product(
+            seller=seller,
+            title=f'Product {scale}-{i}',
+            regular_price=100,
+            discounted_price=80,
+            descriptions='Fresh from the farm',
+            category=['F', 'V', 'DF', 'M', 'FH', 'B'][i % 6],
+            product_image='product_image/test.jpg',
+        )
+        for i in range(scale)
+    ])
+    Tag.objects.get_or_create(name='organic')[0].product_set.add(*products)
+    cart = Cart.objects.create(user=buyer)
+    cart_items = CartItem.objects.bulk_create([
+        CartItem(cart=cart, product=product, quantity=2) for product in products
+    ])
+    orders = Order.objects.bulk_create([
+        Order(
+            user=buyer,
+            order_number=f'ORD{scale:03d}{i:07d}',
+            first_name='A', last_name='B', email='a@example.com', phone='01700000000',
+            address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+            payment_method='COD', subtotal=80, total=80, status='DELIVERED',
+        )
+        for i in range(scale)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, quantity=1, price=80, subtotal=80)
+        for order, product in zip(orders, products)
+    ])
+    SellerOrder.objects.bulk_create([
+        SellerOrder(
+            order=order, seller=seller, user=buyer, order_number=order.order_number,
+            subtotal=80, item_count=1, status=order.status, created_at=order.created_at,
+        )
+        for order in orders
+    ])
+    ProductReview.objects.bulk_create([
+        ProductReview(product=products[0], user=buyer, order=order, rating=4, review='Very fresh indeed')
+        for order in orders
+    ])
+    questions = ProductQuestion.objects.bulk_create([
+        ProductQuestion(product=products[0], user=buyer, question='Is it organic?', is_answered=i % 2 == 1)
+        for i in range(scale)
+    ])
+    return {
+        'buyer': buyer,
+        'seller': seller_user,
+        'product': products[0],
+        'cart_item': cart_items[0],
+        'order': orders[0],
+        'question': questions[0],
+    }
+
+
+def fingerprint(sql):
+    """SQL with literals stripped, so queries differing only by ids compare equal"""
+    sql = re.sub(r"'[^']*'", "'?'", sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\(\?(, \?)+\)', '(...)', sql)
+
+
+class QueryBudgetMixin:
+    """Render every URL of `urlconf` at growing data sizes and check query counts
+
+    Subclasses declare `budgets` ({url name: max queries}) and
+    `requests_for(data)` returning {url name: (method, path, payload, user)}.
+    A view fails if it exceeds its budget or if its query count grows with
+    the amount of data (an N+1).
+    """
+    SCALES = (1, 10, 100)
+    urlconf = None
+    budgets = {}
+
+    def requests_for(self, data):
+        raise NotImplementedError
+
+    def capture(self, method, path, payload, user):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx, redirect_stdout(io.StringIO()):
+            response = getattr(client, method)(path, payload or {}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertLess(response.status_code, 500, f'{method.upper()} {path}')
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def describe(self, name, scale, baseline, queries, budget):
+        header = (
+            f'{name}: {len(queries)} queries at scale {scale} '
+            f'(budget {budget}, {len(baseline)} at scale {self.SCALES[0]})'
+        )
+        if scale == self.SCALES[0]:
+            lines = [f'  {i}. {fingerprint(q)}' for i, q in enumerate(queries, 1)]
+        else:
+            lines = difflib.unified_diff(
+                [fingerprint(q) for q in baseline],
+                [fingerprint(q) for q in queries],
+                fromfile=f'{name} @ {self.SCALES[0]}',
+                tofile=f'{name} @ {scale}',
+                lineterm='',
+            )
+        return '\n'.join([header, *lines])
+
+    def test_every_url_has_a_budget(self):
+        names = {p.name for p in import_module(self.urlconf).urlpatterns if getattr(p, 'name', None)}
+        self.assertEqual(names - set(self.budgets), set(), 'URLs without a query budget')
+
+    def test_query_budgets(self):
+        captured = {}
+        for scale in self.SCALES:
+            with transaction.atomic():
+                requests = self.requests_for(seed_catalog(scale))
+                captured[scale] = {
+                    name: self.capture(*request) for name, request in requests.items()
+                }
+                transaction.set_rollback(True)
+
+        failures = []
+        baseline = captured[self.SCALES[0]]
+        for name, budget in self.budgets.items():
+            scale = max(self.SCALES, key=lambda s: len(captured[s][name]))
+            queries = captured[scale][name]
+            if len(queries) > budget or len(queries) != len(baseline[name]):
+                failures.append(self.describe(name, scale, baseline[name], queries, budget))
+        if failures:
+            self.fail('\n\n'.join(failures))
+
+
+class ShopQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = 'shop.urls'
+    budgets = {
+        'home': 6,
+        'about': 3,
+        'shop': 4,
+        'shop-items': 7,
+        'cart': 6,
+        'chackout': 14,
+        'order_confirmation': 5,
+        'order_detail': 5,
+        'product_detail': 21,
+        'contact': 3,
+        'testimonial': 3,
+        'profile': 10,
+        '404-page': 3,
+        'registration': 0,
+        'login': 0,
+        'logout': 1,
+        'passwordchange': 3,
+        'passwordchangedone': 3,
+        'password_reset': 0,
+        'password_reset_done': 0,
+        'password_reset_confirm': 1,
+        'password_reset_complete': 0,
+        'add_to_cart': 5,
+        'ajax_add_to_cart': 7,
+        'update_cart_item': 6,
+        'remove_from_cart': 5,
+        'metrics': 1,
+        'api_products': 4,
+        'api_product': 3,
+        'api_tags': 2,
+        'api_autocomplete': 0,
+    }
+
+    def requests_for(self, data):
+        # Budgets assume warm product cards and price facets; a cold list costs a
+        # fixed two more queries (ProductCardCacheTests), cold facets three.
+        # Scales reuse catalog versions, so nothing cached may carry over
+        cache.clear()
+        price_facets.get(catalog_version.prices())
+        for variant in cards.TEMPLATES:
+            cards.render_many(Product.objects.all(), variant)
+        autocomplete.suggestions.rebuild()
+        buyer, product = data['buyer'], data['product']
+        order_number = data['order'].order_number
+        return {
+            'home': ('get', reverse('home'), None, None),
+            'about': ('get', reverse('about'), None, buyer),
+            'shop': ('get', reverse('shop'), {'status': 'organic'}, None),
+            'shop-items': ('get', reverse('shop-items', args=['Fruits']), None, buyer),
+            'cart': ('get', reverse('cart'), None, buyer),
+            'chackout': ('get', reverse('chackout'), None, buyer),
+            'order_confirmation': ('get', reverse('order_confirmation', args=[order_number]), None, buyer),
+            'order_detail': ('get', reverse('order_detail', args=[order_number]), None, buyer),
+            'product_detail': ('get', reverse('product_detail', args=[product.pk]), None, buyer),
+            'contact': ('get', reverse('contact'), None, buyer),
+            'testimonial': ('get', reverse('testimonial'), None, buyer),
+            'profile': ('get', reverse('profile'), None, buyer),
+            '404-page': ('get', reverse('404-page'), None, buyer),
+            'registration': ('get', reverse('registration'), None, None),
+            'login': ('get', reverse('login'), None, None),
+            'logout': ('post', reverse('logout'), None, buyer),
+            'passwordchange': ('get', reverse('passwordchange'), None, buyer),
+            'passwordchangedone': ('get', reverse('passwordchangedone'), None, buyer),
+            'password_reset': ('get', reverse('password_reset'), None, None),
+            'password_reset_done': ('get', reverse('password_reset_done'), None, None),
+            'password_reset_confirm': ('get', reverse('password_reset_confirm', args=[
+                urlsafe_base64_encode(force_bytes(buyer.pk)), default_token_generator.make_token(buyer),
+            ]), None, None),
+            'password_reset_complete': ('get', reverse('password_reset_complete'), None, None),
+            'add_to_cart': ('post', reverse('add_to_cart', args=[product.pk]), {'quantity': 1}, buyer),
+            'ajax_add_to_cart': ('post', reverse('ajax_add_to_cart'), {'product_id': product.pk}, buyer),
+            'update_cart_item': ('post', reverse('update_cart_item'), {
+                'item_id': data['cart_item'].pk, 'action': 'increase',
+            }, buyer),
+            'remove_from_cart': ('post', reverse('remove_from_cart'), {'item_id': data['cart_item'].pk}, buyer),
+            'metrics': ('get', reverse('metrics'), None, buyer),
+            'api_products': ('get', reverse('api_products'), {'fields': 'id,title,rating,tags,seller'}, None),
+            'api_product': ('get', reverse('api_product', args=[product.pk]), None, None),
+            'api_tags': ('get', reverse('api_tags'), None, None),
+            'api_autocomplete': ('get', reverse('api_autocomplete'), {'q': 'pro'}, None),
+        }
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pw12345xx')
+        cls.mango, cls.okra = Product.objects.bulk_create([
+            Product(
+                title=title, regular_price=100, discounted_price=price, descriptions='Fresh',
+                category='F', product_image='product_image/test.jpg',
+            )
+            for title, price in (('Mango', 80), ('Okra', 30))
+        ])
+
+    def ajax(self, name, **data):
+        return self.client.post(reverse(name), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def quantities(self):
+        return SessionCart(self.client.get(reverse('about')).wsgi_request).quantities()
+
+    def test_add_update_remove_without_cart_rows(self):
+        self.assertEqual(self.ajax('ajax_add_to_cart', product_id=self.mango.pk, quantity=2).json()['cart_total'], 160)
+        self.client.post(reverse('add_to_cart', args=[self.okra.pk]), {'quantity': 1})
+        self.assertEqual(self.quantities(), {self.mango.pk: 2, self.okra.pk: 1})
+
+        response = self.ajax('update_cart_item', item_id=self.mango.pk, action='increase').json()
+        self.assertEqual((response['new_quantity'], response['subtotal'], response['cart_total']), (3, 240, 270))
+        for _ in range(4):
+            self.ajax('update_cart_item', item_id=self.okra.pk, action='decrease')
+        self.assertEqual(self.quantities()[self.okra.pk], 1)
+        self.assertEqual(self.ajax('update_cart_item', item_id=0, action='increase').status_code, 404)
+
+        self.assertEqual(self.ajax('remove_from_cart', item_id=self.okra.pk).json()['cart_total'], 240)
+        self.assertEqual(self.quantities(), {self.mango.pk: 3})
+        self.assertEqual(self.client.get(reverse('about')).context['cart_item_count'], 3)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_quantities_below_one_add_one(self):
+        self.ajax('ajax_add_to_cart', product_id=self.mango.pk, quantity=0)
+        self.client.post(reverse('add_to_cart', args=[self.mango.pk]), {'quantity': -5})
+        self.assertEqual(self.quantities(), {self.mango.pk: 2})
+
+    def test_login_merges_into_existing_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.mango, quantity=1)
+        self.ajax('ajax_add_to_cart', product_id=self.mango.pk, quantity=2)
+        self.ajax('ajax_add_to_cart', product_id=self.okra.pk, quantity=1)
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'pw12345xx'})
+        self.assertEqual(
+            dict(cart.items.values_list('product_id', 'quantity')), {self.mango.pk: 3, self.okra.pk: 1},
+        )
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(self.client.get(reverse('about')).context['cart_item_count'], 4)
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def config(self, url, **env):
+        from Farm2Fork.settings import database_config
+
+        with mock.patch.dict(os.environ, env):
+            return database_config(url)
+
+    def test_postgres_pool(self):
+        config = self.config('postgres://u:p@db:5432/shop', DB_POOL='1', DB_POOL_MIN_SIZE='3', DB_POOL_MAX_SIZE='7')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 3, 'max_size': 7, 'timeout': 10.0})
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_postgres_persistent_connections(self):
+        config = self.config('postgres://u:p@db:5432/shop', DB_POOL='0', DB_CONN_MAX_AGE='30')
+        self.assertEqual(config['CONN_MAX_AGE'], 30)
+        self.assertNotIn('pool', config.get('OPTIONS', {}))
+
+    def test_sqlite_profile(self):
+        options = self.config('sqlite:////tmp/shop.sqlite3')['OPTIONS']
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'temp_store=MEMORY'):
+            self.assertIn(f'PRAGMA {pragma};', options['init_command'])
+
+
+class LoadToolingTests(TestCase):
+    def test_seed_load_data(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media), redirect_stdout(io.StringIO()):
+            options = {'sellers': 2, 'products': 30, 'users': 10, 'orders': 40, 'questions': 5, 'stdout': io.StringIO()}
+            call_command('seed_load_data', **options)
+            with self.assertRaises(CommandError):
+                call_command('seed_load_data', **options)
+            clock = CatalogClock.objects.get()
+            with mock.patch.object(catalog_version, 'tick', wraps=catalog_version.tick) as tick:
+                call_command('seed_load_data', clear=True, **options)
+        # Last after seeding, whose bulk inserts send no signals
+        tick.assert_called_with(names=True, prices=True)
+        moved = CatalogClock.objects.get()
+        self.assertGreater(moved.names_version, clock.names_version)
+        self.assertGreater(moved.prices_version, clock.prices_version)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(User.objects.filter(username__startswith='load_').count(), 12)
+        order = Order.objects.prefetch_related('items').first()
+        self.assertEqual(order.subtotal, sum(item.subtotal for item in order.items.all()))
+        self.assertTrue(os.listdir(os.path.join(media, 'product_image', 'placeholder')))
+
+        # Seeded orders are split per seller and logged as at checkout
+        self.assertEqual(
+            OrderStatusEvent.objects.filter(seller__isnull=True).count(), Order.objects.count(),
+        )
+        share = SellerOrder.objects.select_related('order').first()
+        self.assertEqual(share.status, share.order.status)
+        self.assertEqual(share.subtotal, sum(
+            item.subtotal for item in share.order.items.filter(product__seller=share.seller_id)
+        ))
+        self.client.force_login(share.seller.user)
+        response = self.client.get(reverse('multivendor:seller_orders'))
+        self.assertEqual(
+            len(response.context['orders']), SellerOrder.objects.filter(seller=share.seller_id).count(),
+        )
+        self.assertContains(response, share.order_number)
+
+    def test_loadtest_report(self):
+        from shop.management.commands.loadtest import Stats, percentile
+
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
+        self.assertIsNone(percentile([], 50))
+        stats = Stats()
+        for ms in range(1, 101):
+            stats.record('home', ms / 1000, ok=ms != 100)
+        report = stats.report(elapsed=10)
+        self.assertEqual((report['requests'], report['errors'], report['rps']), (100, 1, 10.0))
+        self.assertEqual(report['endpoints']['home']['p95_ms'], 95.0)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('about'))
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user('staff', password='pw12345xx', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('farm2fork_request_duration_seconds_count{view="home"} 1', body)
+        self.assertIn('farm2fork_db_queries_total{view="home"}', body)
+
+    def test_cache_reads_counted_once(self):
+        middleware.install_hooks()
+        cache.set('metrics-a', 1)
+        self.addCleanup(cache.delete, 'metrics-a')
+        metrics = middleware.RequestMetrics()
+        token = middleware._current.set(metrics)
+        self.addCleanup(middleware._current.reset, token)
+        self.assertEqual(cache.get_many(['metrics-a', 'metrics-b', 'metrics-c']), {'metrics-a': 1})
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (1, 2))
+        self.assertIsNone(cache.get('metrics-b'))
+        self.assertEqual(cache.get('metrics-a'), 1)
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (2, 3))
+
+
+class SlowQueryLogTests(TestCase):
+    def run_query(self, threshold_ms):
+        with self.assertLogs('shop.slow_queries', 'WARNING') as logs:
+            with connection.execute_wrapper(slow_queries.SlowQueryLogger(threshold_ms)):
+                list(Product.objects.filter(title='Bitroot', discounted_price__gt=10))
+            # assertLogs() fails on no records at all
+            slow_queries.logger.warning('end')
+        return [json.loads(record.getMessage()) for record in logs.records[:-1]]
+
+    def test_threshold(self):
+        self.assertEqual(self.run_query(threshold_ms=60_000), [])
+        entries = self.run_query(threshold_ms=0)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['database'], 'default')
+        self.assertNotIn('Bitroot', entries[0]['sql'])
+        self.assertEqual(entries[0]['fingerprint'], slow_queries.fingerprint(entries[0]['sql']))
+
+    def test_call_site(self):
+        site = self.run_query(threshold_ms=0)[0]['call_site']
+        self.assertEqual((site['file'], site['function']), (os.path.join('shop', 'tests.py'), 'run_query'))
+        self.assertIn('Product.objects.filter', site['code'])
+
+    def test_summary_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'slow.jsonl')
+        site = {'file': 'shop/views.py', 'line': 10, 'function': 'shop', 'code': ''}
+        rows = [('a', 300, site), ('b', 50, None), ('a', 100, site), ('b', 60, None)]
+        for name, lines in ((path + '.1', rows[:2]), (path, rows[2:])):
+            with open(name, 'w') as f:
+                for fingerprint, ms, call_site in lines:
+                    f.write(json.dumps({'fingerprint': fingerprint, 'duration_ms': ms, 'sql': fingerprint, 'call_site': call_site}) + '\n')
+                f.write('not json\n')
+        out = io.StringIO()
+        call_command('slow_queries', file=path, json=True, stdout=out)
+        summary = json.loads(out.getvalue())
+        self.assertEqual([row['fingerprint'] for row in summary], ['a', 'b'])
+        self.assertEqual((summary[0]['count'], summary[0]['total_ms'], summary[0]['max_ms']), (2, 400.0, 300.0))
+        self.assertEqual(summary[0]['call_sites'], [['shop/views.py:10 in shop', 2]])
+        with self.assertRaises(CommandError):
+            call_command('slow_queries', file=os.path.join(directory, 'missing.jsonl'))
+
+
+class CatalogReplicaRouterTests(SimpleTestCase):
+    """Routing decisions only; no queries are run"""
+
+    def setUp(self):
+        token = db_routers._state.set(db_routers.PinState())
+        self.addCleanup(db_routers._state.reset, token)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+    def test_catalog_reads_round_robin_across_replicas(self):
+        used = {Product.objects.all().db for _ in range(4)}
+        self.assertEqual(used, {'replica_0', 'replica_1'})
+        self.assertIn(ProductReview.objects.all().db, used)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_non_catalog_models_stay_on_primary(self):
+        self.assertEqual(Order.objects.all().db, 'default')
+        self.assertEqual(Cart.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_pinned_after_own_write(self):
+        db_routers.pin_to_primary()
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        self.assertEqual(Product.objects.all().db, 'default')
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'set DATABASE_REPLICA_URLS to run against a replica')
+class CatalogReplicaIntegrationTests(TransactionTestCase):
+    """Run with e.g. DATABASE_URL=sqlite:///primary.sqlite3 DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3"""
+    databases = '__all__'
+
+    def test_reads_use_replica_except_in_atomic_and_after_writes(self):
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        Tag.objects.create(name='fresh')
+        with CaptureQueriesContext(replica) as on_replica:
+            response = self.client.get(reverse('shop'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(on_replica.captured_queries)
+        self.assertNotIn(db_routers.PIN_COOKIE, response.cookies)
+
+        with transaction.atomic():
+            self.assertEqual(Tag.objects.all().db, 'default')
+
+        user = User.objects.create_user('writer', password='pw12345xx')
+        product = Product.objects.create(
+            title='Bitroot', regular_price=50, discounted_price=45, descriptions='Fresh',
+            category='V', product_image='product_image/Bitroot.png',
+        )
+        order = Order.objects.create(
+            user=user, order_number='ORDREPLICA1', first_name='A', last_name='B', email='a@example.com',
+            phone='01700000000', address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+            payment_method='COD', subtotal=45, total=45, status='DELIVERED',
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=45, subtotal=45)
+        self.client.force_login(user)
+        response = self.client.post(reverse('product_detail', args=[product.pk]), {
+            'rating': 5, 'review': 'Very fresh beetroot, thanks!',
+        })
+        self.assertEqual(response.cookies[db_routers.PIN_COOKIE].value, '1')
+        with CaptureQueriesContext(replica) as on_replica:
+            self.client.get(reverse('product_detail', args=[product.pk]))
+        self.assertEqual(on_replica.captured_queries, [])
+
+
+@skipUnless(
+    os.path.exists(os.path.join(settings.STATIC_ROOT, 'staticfiles.json')),
+    'run `manage.py collectstatic` first',
+)
+class StaticAssetTests(SimpleTestCase):
+    def test_hashed_assets_are_immutable_and_precompressed(self):
+        url = staticfiles_storage.url('css/style.css')
+        self.assertRegex(url, r'/static/css/style\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=315360000', response['Cache-Control'])
+
+    def test_startup_check_reports_savings(self):
+        messages = check_static_compression(None)
+        self.assertEqual([m.id for m in messages], ['shop.I001'])
+        self.assertIn('KiB saved', messages[0].msg)
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root, MEDIA_ACCEL=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.root, 'product_image'))
+        with open(os.path.join(self.root, 'product_image', 'beet.png'), 'wb') as f:
+            f.write(b'0123456789')
+
+    def test_validators_and_conditional_get(self):
+        response = self.client.get('/media/product_image/beet.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertFalse(etag.startswith('W/'))
+
+        response = self.client.get('/media/product_image/beet.png', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/media/product_image/beet.png', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get('/media/product_image/beet.png', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        response = self.client.get('/media/product_image/beet.png', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get('/media/product_image/beet.png', HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # A stale If-Range gets the whole, current file
+        response = self.client.get('/media/product_image/beet.png', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_hashed_uploads_are_immutable_and_deduplicated(self):
+        storage = ContentHashedStorage(location=self.root)
+        name = storage.save('product_image/carrot.png', ContentFile(b'carrot'))
+        self.assertRegex(name, r'^product_image/carrot\.[0-9a-f]{12}\.png$')
+        self.assertEqual(storage.save('product_image/carrot.png', ContentFile(b'carrot')), name)
+        self.assertNotEqual(storage.save('product_image/carrot.png', ContentFile(b'other')), name)
+        response = self.client.get('/media/' + name)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_offload_to_proxy(self):
+        with self.settings(MEDIA_ACCEL='x-accel-redirect'):
+            response = self.client.get('/media/product_image/beet.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/product_image/beet.png')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            response = self.client.get('/media/product_image/beet.png')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'product_image', 'beet.png'))
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/product_image/none.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/product_image').status_code, 404)
+        with self.assertRaises(Http404):
+            serve_media(RequestFactory().get('/media/'), '../manage.py')
+        self.assertEqual(self.client.post('/media/product_image/beet.png').status_code, 405)
+
+
+class OrderNumberTests(TestCase):
+    def test_numbers_sort_by_issue_time(self):
+        generator = OrderNumberGenerator(node=7)
+        numbers = [generator() for _ in range(10000)]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(all(len(n) == 16 and n.startswith('ORD') for n in numbers))
+        self.assertFalse(set(''.join(n[3:] for n in numbers)) & set('ILOU'))
+        issued = order_numbers.created_at_of(numbers[-1])
+        self.assertLess(abs((timezone.now() - issued).total_seconds()), 5)
+
+    def test_legacy_numbers_are_distinguishable(self):
+        legacy = order_numbers.legacy_order_number()
+        self.assertEqual(len(legacy), 13)
+        self.assertIsNone(order_numbers.created_at_of(legacy))
+        with self.settings(ORDER_NUMBER_SCHEME='random'):
+            self.assertEqual(len(order_numbers.new_order_number()), 13)
+
+    def test_collision_retries_with_a_fresh_number(self):
+        user = User.objects.create_user('buyer', password='pw12345xx')
+
+        def create(number, created_at):
+            return Order.objects.create(
+                user=user, order_number=number, created_at=created_at, first_name='A', last_name='B',
+                email='a@example.com', phone='01700000000', address='Road 1', city='Dhaka',
+                country='Bangladesh', postcode='1207', payment_method='COD', subtotal=45, total=45,
+            )
+
+        taken = order_numbers.create_order(create).order_number
+        self.assertEqual(Order.objects.get(order_number=taken).created_at, order_numbers.created_at_of(taken))
+        fresh = order_numbers.generator()
+        issued = iter([taken, fresh])
+        with mock.patch.object(order_numbers, 'new_order_number', lambda: next(issued)):
+            with transaction.atomic():
+                order = order_numbers.create_order(create)
+        self.assertEqual(order.order_number, fresh)
+
+        with mock.patch.object(order_numbers, 'new_order_number', lambda: taken):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                order_numbers.create_order(create)
+
+    @skipIf(connection.vendor == 'postgresql', 'shop_order is partitioned there; see OrderPartitionTests')
+    def test_legacy_collision_retries(self):
+        user = User.objects.create_user('buyer', password='pw12345xx')
+
+        def create(number, created_at):
+            return Order.objects.create(
+                user=user, order_number=number, created_at=created_at, first_name='A', last_name='B',
+                email='a@example.com', phone='01700000000', address='Road 1', city='Dhaka',
+                country='Bangladesh', postcode='1207', payment_method='COD', subtotal=45, total=45,
+            )
+
+        with self.settings(ORDER_NUMBER_SCHEME='random'):
+            taken = order_numbers.create_order(create).order_number
+            issued = iter([taken, 'ORDFRESHLEGAC'])
+            with mock.patch.object(order_numbers, 'new_order_number', lambda: next(issued)):
+                self.assertEqual(order_numbers.create_order(create).order_number, 'ORDFRESHLEGAC')
+        self.assertEqual(Order.objects.filter(order_number=taken).count(), 1)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw12345xx')
+        self.product = Product.objects.create(
+            title='Bitroot', regular_price=50, discounted_price=45, descriptions='Fresh',
+            category='V', product_image='product_image/Bitroot.png',
+        )
+        old = timezone.now() - timedelta(days=500)
+        self.orders = {}
+        for number, status in (('ORDOLDDONE01', 'DELIVERED'), ('ORDOLDOPEN01', 'PENDING')):
+            order = Order.objects.create(
+                user=self.user, order_number=number, first_name='A', last_name='B', email='a@example.com',
+                phone='01700000000', address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+                payment_method='COD', subtotal=90, total=90, status=status,
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=old)
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price=45, subtotal=90)
+            self.orders[number] = order
+        self.review = ProductReview.objects.create(
+            product=self.product, user=self.user, order=self.orders['ORDOLDDONE01'], rating=5, review='Great',
+        )
+        self.client.force_login(self.user)
+
+    def archive(self, to):
+        before = timezone.now() - timedelta(days=30)
+        return sum(archive_orders(before, batch_size=1, to=to))
+
+    def assert_archived_detail(self):
+        self.assertEqual(list(Order.objects.values_list('order_number', flat=True)), ['ORDOLDOPEN01'])
+        self.assertFalse(OrderItem.objects.filter(order__order_number='ORDOLDDONE01').exists())
+        self.review.refresh_from_db()
+        self.assertIsNone(self.review.order_id)
+
+        response = self.client.get(reverse('order_detail', args=['ORDOLDDONE01']))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Bitroot')
+        self.assertEqual(response.context['order'].get_status_display(), 'Delivered')
+        self.assertEqual(response.context['order_items'][0].subtotal, Decimal('90.00'))
+
+    def test_archive_to_table(self):
+        self.assertEqual(self.archive('table'), 1)
+        self.assertIsNotNone(ArchivedOrder.objects.get(order_number='ORDOLDDONE01').data)
+        self.assert_archived_detail()
+
+    def test_archive_to_jsonl(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(ORDER_ARCHIVE_DIR=directory):
+            self.assertEqual(self.archive('jsonl'), 1)
+            archived = ArchivedOrder.objects.get(order_number='ORDOLDDONE01')
+            self.assertIsNone(archived.data)
+            self.assertTrue(os.path.exists(os.path.join(directory, archived.archive_file)))
+            self.assert_archived_detail()
+
+    def test_failed_batch_writes_no_archive_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        ArchivedOrder.objects.create(
+            order_number='ORDOLDDONE01', user=self.user, status='DELIVERED', total=90, created_at=timezone.now(),
+        )
+        with self.settings(ORDER_ARCHIVE_DIR=directory):
+            with self.assertRaises(IntegrityError):
+                self.archive('jsonl')
+        self.assertEqual(os.listdir(directory), [])
+        self.assertTrue(Order.objects.filter(order_number='ORDOLDDONE01').exists())
+
+    def test_other_users_cannot_see_archived_orders(self):
+        self.archive('table')
+        self.client.force_login(User.objects.create_user('other', password='pw12345xx'))
+        response = self.client.get(reverse('order_detail', args=['ORDOLDDONE01']))
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'order partitioning is PostgreSQL only')
+class OrderPartitionTests(TestCase):
+    def test_orders_are_routed_to_monthly_partitions(self):
+        self.assertTrue(partitions.is_partitioned(connection))
+        user = User.objects.create_user('buyer', password='pw12345xx')
+        order = order_numbers.create_order(lambda number, created_at: Order.objects.create(
+            user=user, order_number=number, created_at=created_at, first_name='A', last_name='B', email='a@example.com',
+            phone='01700000000', address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+            payment_method='COD', subtotal=45, total=45,
+        ))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM shop_order WHERE id = %s', [order.id])
+            self.assertEqual(cursor.fetchone()[0], partitions.partition_name(partitions.month_start(order.created_at)))
+        plan = Order.objects.filter(**order_numbers.lookup(order.order_number)).explain()
+        self.assertEqual(len(set(re.findall(r' on (shop_order_p\d{4}_\d{2}) ', plan))), 1, plan)
+
+        # A row for a month without a partition waits in the default one until it is created
+        future = datetime(2040, 1, 15, tzinfo=dt_timezone.utc)
+        Order.objects.filter(pk=order.pk).update(created_at=future)
+        self.assertTrue(partitions.ensure_partition(connection, date(2040, 1, 1)))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM shop_order WHERE id = %s', [order.id])
+            self.assertEqual(cursor.fetchone()[0], 'shop_order_p2040_01')
+
+    def test_order_number_unique_with_created_at(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = 'shop_order'::regclass AND contype = 'u'"
+            )
+            self.assertEqual([row[0] for row in cursor.fetchall()], ['UNIQUE (order_number, created_at)'])
+        create = mock.Mock()
+        with self.settings(ORDER_NUMBER_SCHEME='random'), self.assertRaises(ImproperlyConfigured):
+            order_numbers.create_order(create)
+        create.assert_not_called()
+
+
+class OrderAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'pw12345xx')
+        buyers = [User.objects.create_user(f'buyer{i}', password='pw12345xx') for i in range(3)]
+        Order.objects.bulk_create([
+            Order(
+                user=buyers[i % 3], order_number=f'ORDADM{i:04d}', first_name='A', last_name='B',
+                email='a@example.com', phone='01700000000', address='Road 1', city='Dhaka',
+                country='Bangladesh', postcode='1207', payment_method='COD', subtotal=80, total=80,
+            )
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+        self.url = reverse('admin:shop_order_changelist')
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        # Warm up per-user state (the cart context processor creates a cart once)
+        self.client.get(self.url)
+        counts = []
+        for batch in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.context['cl'].show_full_result_count)
+            counts.append(len(queries))
+            orders = list(Order.objects.all()[:10])
+            for i, order in enumerate(orders):
+                order.pk, order.order_number = None, f'ORDMORE{batch}{i:02d}'
+            Order.objects.bulk_create(orders)
+        self.assertEqual(response.context['cl'].result_count, 40)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(sum('COUNT(' in q['sql'] for q in queries), 1)
+
+    def test_search_by_number_prefix_and_exact_username(self):
+        response = self.client.get(self.url, {'q': 'ORDADM001'})
+        self.assertEqual(response.context['cl'].result_count, 10)
+        response = self.client.get(self.url, {'q': 'buyer1'})
+        self.assertEqual(response.context['cl'].result_count, 10)
+        response = self.client.get(self.url, {'q': 'buyer'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_bulk_status_action_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {
+                'action': 'mark_shipped', 'select_across': '1', 'index': '0',
+                '_selected_action': list(Order.objects.values_list('pk', flat=True)[:1]),
+            })
+        self.assertEqual(response.status_code, 302)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shop_order"')]
+        self.assertEqual(len(updates), 1, updates)
+        self.assertEqual(Order.objects.filter(status='SHIPPED').count(), 30)
+        events = OrderStatusEvent.objects.filter(source='admin', actor=self.admin_user)
+        self.assertEqual(events.filter(from_status='PENDING', to_status='SHIPPED').count(), 30)
+
+    def test_bulk_status_action_skips_invalid_transitions(self):
+        response = self.client.post(self.url, {
+            'action': 'mark_delivered', 'select_across': '1', 'index': '0',
+            '_selected_action': list(Order.objects.values_list('pk', flat=True)[:1]),
+        }, follow=True)
+        self.assertContains(response, 'None of the selected orders can move to delivered.')
+        self.assertFalse(Order.objects.filter(status='DELIVERED').exists())
+        self.assertFalse(OrderStatusEvent.objects.exists())
+
+    def test_change_form_validates_and_logs_status(self):
+        order = Order.objects.get(order_number='ORDADM0000')
+        url = reverse('admin:shop_order_change', args=[order.pk])
+        data = {
+            field: getattr(order, field) for field in (
+                'user', 'first_name', 'last_name', 'email', 'phone', 'address', 'city', 'country',
+                'postcode', 'shipping_method', 'shipping_cost', 'payment_method', 'subtotal', 'total',
+            )
+        }
+        data.update({
+            'user': order.user_id, 'status': 'DELIVERED',
+            'items-TOTAL_FORMS': 0, 'items-INITIAL_FORMS': 0,
+        })
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'An order cannot go from Pending to Delivered.')
+
+        data['status'] = 'PROCESSING'
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'PROCESSING')
+        self.assertEqual(
+            list(order.status_events.values_list('from_status', 'to_status', 'source')),
+            [('PENDING', 'PROCESSING', 'admin')],
+        )
+
+    def test_estimated_count_past_the_exact_limit(self):
+        with mock.patch('shop.admin.estimated_count', return_value=2_000_000):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 2_000_000)
+
+
+class OrderStatusEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('eventbuyer', password='pw12345xx')
+
+    def make_order(self, number='ORDEVT0001', status='PENDING'):
+        order = Order.objects.create(
+            user=self.buyer, order_number=number, first_name='A', last_name='B',
+            email='a@example.com', phone='01700000000', address='Road 1', city='Dhaka',
+            country='Bangladesh', postcode='1207', payment_method='COD', subtotal=80, total=80, status=status,
+        )
+        order_status.record_created(order, actor=self.buyer)
+        return order
+
+    def test_transitions_follow_the_state_machine(self):
+        order = self.make_order()
+        order_status.transition(order, 'ON_THE_WAY', source='seller')
+        order_status.transition(order, 'DELIVERED', source='seller')
+        with self.assertRaises(order_status.InvalidTransition):
+            order_status.transition(order, 'CANCELLED')
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'DELIVERED')
+        self.assertEqual(
+            list(order.status_events.values_list('from_status', 'to_status')),
+            [('', 'PENDING'), ('PENDING', 'SHIPPED'), ('SHIPPED', 'DELIVERED')],
+        )
+
+    def test_stale_status_cannot_transition_twice(self):
+        order = self.make_order()
+        stale = Order.objects.get(pk=order.pk)
+        order_status.transition(order, 'CANCELLED')
+        with self.assertRaises(order_status.InvalidTransition):
+            order_status.transition(stale, 'SHIPPED')
+        self.assertEqual(stale.status, 'CANCELLED')
+        self.assertEqual(order.status_events.count(), 2)
+
+    def test_events_are_append_only(self):
+        event = self.make_order().status_events.get()
+        event.source = 'edited'
+        with self.assertRaises(TypeError):
+            event.save()
+        with self.assertRaises(TypeError):
+            event.delete()
+        with self.assertRaises(TypeError):
+            OrderStatusEvent.objects.update(source='edited')
+        with self.assertRaises(TypeError):
+            OrderStatusEvent.objects.all().delete()
+
+    def test_events_outlive_archived_orders(self):
+        order = self.make_order()
+        order_status.transition(order, 'CANCELLED')
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=400))
+        list(archive_orders(timezone.now() - timedelta(days=180)))
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(OrderStatusEvent.objects.filter(order_number=order.order_number).count(), 2)
+
+    def test_process_events_resumes_from_checkpoint(self):
+        seen = []
+        first = self.make_order('ORDEVT0001')
+        self.assertEqual(order_status.process_events('rollup', seen.extend, settle=timedelta(0)), 1)
+        order_status.transition(first, 'PROCESSING')
+        self.make_order('ORDEVT0002')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(order_status.process_events('rollup', seen.extend, settle=timedelta(0)), 2)
+        self.assertEqual([e.to_status for e in seen], ['PENDING', 'PROCESSING', 'PENDING'])
+        self.assertEqual(order_status.process_events('rollup', seen.extend, settle=timedelta(0)), 0)
+        self.assertEqual(EventCheckpoint.objects.get(name='rollup').position, seen[-1].id)
+        self.assertFalse(any('shop_order"' in q['sql'] for q in queries))
+
+    def test_failed_handler_keeps_checkpoint(self):
+        self.make_order()
+
+        def fail(events):
+            raise RuntimeError('notification service down')
+
+        with self.assertRaises(RuntimeError):
+            order_status.process_events('mailer', fail, settle=timedelta(0))
+        self.assertEqual(order_status.process_events('mailer', lambda events: None, settle=timedelta(0)), 1)
+
+    def test_unsettled_events_wait(self):
+        self.make_order()
+        self.assertEqual(order_status.process_events('rollup', lambda events: None), 0)
+
+    def test_unsettled_event_holds_back_later_ids(self):
+        order = self.make_order('ORDEVT0001')
+        # A later id stamped in the past must not carry the checkpoint over the first
+        OrderStatusEvent.objects.create(
+            order=order, order_number='ORDEVT0002', to_status='PENDING', created_at=timezone.now() - timedelta(days=1),
+        )
+        seen = []
+        self.assertEqual(order_status.process_events('rollup', seen.extend), 0)
+        self.assertEqual(EventCheckpoint.objects.get(name='rollup').position, 0)
+        with mock.patch.object(timezone, 'now', return_value=timezone.now() + order_status.SETTLE):
+            self.assertEqual(order_status.process_events('rollup', seen.extend), 2)
+        self.assertEqual([e.order_number for e in seen], ['ORDEVT0001', 'ORDEVT0002'])
+
+
+class InventoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('stockbuyer', password='pw12345xx')
+        cls.mango, cls.rice, cls.salt = Product.objects.bulk_create([
+            Product(
+                title=title, regular_price=100, discounted_price=80, descriptions='Fresh', category='F',
+                product_image='product_image/test.jpg', stock=stock,
+            )
+            for title, stock in (('Mango', 5), ('Rice', 2), ('Salt', None))
+        ])
+
+    def stock(self):
+        return dict(Product.objects.values_list('title', 'stock'))
+
+    def test_all_lines_in_one_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            inventory.take({self.mango.pk: 3, self.rice.pk: 2, self.salt.pk: 7})
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.stock(), {'Mango': 2, 'Rice': 0, 'Salt': None})
+
+    def test_short_line_rolls_back_every_line(self):
+        with self.assertRaises(inventory.OutOfStock) as raised:
+            inventory.take({self.mango.pk: 1, self.rice.pk: 3})
+        self.assertEqual([(p.title, left) for p, left in raised.exception.shortages], [('Rice', 2)])
+        self.assertEqual(self.stock(), {'Mango': 5, 'Rice': 2, 'Salt': None})
+
+    def test_reservation_holds_stock_until_commit(self):
+        inventory.reserve(self.buyer, {self.mango.pk: 2})
+        self.assertEqual(self.stock()['Mango'], 3)
+        with CaptureQueriesContext(connection) as queries:
+            inventory.reserve(self.buyer, {self.mango.pk: 2})
+        # Same lines again: the reservation is only extended
+        self.assertEqual([q['sql'].split()[0] for q in queries if 'SAVEPOINT' not in q['sql']], ['UPDATE', 'SELECT'])
+        # The cart grew after the checkout page was opened: only the difference is taken
+        inventory.commit(self.buyer, {self.mango.pk: 3, self.rice.pk: 1})
+        self.assertEqual(self.stock(), {'Mango': 2, 'Rice': 1, 'Salt': None})
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_concurrent_reserve_retries_as_update(self):
+        # Another tab's reserve() commits while this one finds nothing held
+        inventory.reserve(self.buyer, {self.mango.pk: 2})
+        # The first attempt does not see those rows yet, the retry does
+        extend = inventory._extend
+        calls = iter([lambda user, expires_at: 0])
+        with mock.patch.object(inventory, '_extend', lambda *args: next(calls, extend)(*args)):
+            inventory.reserve(self.buyer, {self.mango.pk: 2})
+        self.assertEqual(self.stock()['Mango'], 3)
+        self.assertEqual(list(StockReservation.objects.values_list('quantity', flat=True)), [2])
+
+    def test_stock_is_not_written_by_save(self):
+        stale = Product.objects.get(pk=self.mango.pk)
+        inventory.take({self.mango.pk: 4})
+        stale.title = 'Mango (Himsagar)'
+        stale.save()
+        self.assertEqual(self.stock()['Mango (Himsagar)'], 1)
+        inventory.restock({self.mango.pk: 10, self.salt.pk: 3})
+        self.assertEqual(self.stock(), {'Mango (Himsagar)': 11, 'Rice': 2, 'Salt': 3})
+
+    def test_admin_restock(self):
+        admin_user = User.objects.create_superuser('stockadmin', 'a@example.com', 'pw12345xx')
+        self.client.force_login(admin_user)
+        url = reverse('admin:shop_product_change', args=[self.rice.pk])
+        form = self.client.get(url).context['adminform'].form
+        self.assertNotIn('stock', form.fields)
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'tags'}
+        data.update(restock=5, product_image='')
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stock()['Rice'], 7)
+
+    def test_sweeper_releases_only_expired_reservations(self):
+        other = User.objects.create_user('otherbuyer', password='pw12345xx')
+        inventory.reserve(self.buyer, {self.mango.pk: 2, self.rice.pk: 1})
+        inventory.reserve(other, {self.mango.pk: 1}, minutes=60)
+        later = timezone.now() + timedelta(minutes=30)
+        self.assertEqual(inventory.release_expired(batch_size=1, now=later), 2)
+        self.assertEqual(self.stock(), {'Mango': 4, 'Rice': 2, 'Salt': None})
+        self.assertEqual(list(StockReservation.objects.values_list('user__username', flat=True)), ['otherbuyer'])
+
+    def test_checkout_refuses_to_oversell(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.rice, quantity=2)
+        self.client.force_login(self.buyer)
+        with redirect_stdout(io.StringIO()):
+            self.client.get(reverse('chackout'))
+            Product.objects.filter(pk=self.rice.pk).update(stock=0)
+            StockReservation.objects.filter(user=self.buyer).delete()
+            response = self.client.post(reverse('chackout'), {
+                'first_name': 'A', 'last_name': 'B', 'email': 'a@example.com', 'phone': '01700000000',
+                'address': 'Road 1', 'city': 'Dhaka', 'country': 'Bangladesh', 'postcode': '1207',
+                'payment_method': 'COD',
+            })
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(cart.items.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent checkouts need row locks (PostgreSQL)')
+class StockConcurrencyTests(TransactionTestCase):
+    def test_hot_product_is_never_oversold(self):
+        out = io.StringIO()
+        call_command('bench_stock', checkouts=60, workers=20, stock=15, strategies=['conditional', 'reserve'], stdout=out)
+        results = json.loads(out.getvalue())['strategies']
+        for name, result in results.items():
+            self.assertEqual((result['sold'], result['final_stock'], result['errors']), (15, 0, 0), name)
+
+
+class PriceCampaignTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organic = Tag.objects.create(name='organic')
+        cls.products = Product.objects.bulk_create([
+            Product(
+                title=f'Fruit {i}', regular_price=price, discounted_price=price, descriptions='Fresh',
+                category='F', product_image='product_image/test.jpg',
+            )
+            for i, price in enumerate([50, 100, 200, 600, 1000])
+        ])
+        # Already on sale below any campaign price: must not go up
+        Product.objects.filter(pk=cls.products[4].pk).update(discounted_price=500)
+        cls.bread = Product.objects.create(
+            title='Bread', regular_price=100, discounted_price=100, descriptions='Baked', category='B',
+            product_image='product_image/test.jpg',
+        )
+        cls.bread.tags.add(cls.organic)
+
+    def prices(self):
+        return dict(Product.objects.values_list('title', 'discounted_price'))
+
+    def test_tiered_prices_are_vectorised(self):
+        campaign = PriceCampaign(kind='TIERED', tiers=[[100, 10], [500, 20]])
+        regular = np.array([50.0, 100.0, 499.99, 500.0, 1000.0])
+        np.testing.assert_allclose(campaigns.sale_prices(campaign, regular), [50, 90, 449.99, 400, 800])
+        fixed = PriceCampaign(kind='FIXED', value=Decimal('75'))
+        np.testing.assert_allclose(campaigns.sale_prices(fixed, regular), [0, 25, 424.99, 425, 925])
+
+    def test_apply_in_chunks_with_one_invalidation(self):
+        campaign = PriceCampaign.objects.create(name='Fruit week', kind='PERCENT', value=Decimal('40'), category='F')
+        received = []
+        catalog_changed.connect(lambda sender, product_ids, **kwargs: received.append(product_ids), weak=False, dispatch_uid='t')
+        self.addCleanup(catalog_changed.disconnect, dispatch_uid='t')
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(campaigns.apply(campaign, chunk_size=2), 4)
+        prices = self.prices()
+        self.assertEqual([prices[f'Fruit {i}'] for i in range(5)], [30, 60, 120, 360, 500])
+        self.assertEqual(prices['Bread'], 100)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 2)
+        if connection.features.has_select_for_update:
+            self.assertTrue(any(q['sql'].endswith('FOR UPDATE OF "shop_product"') for q in queries))
+        self.assertEqual(len(received), 1)
+        self.assertEqual(sorted(received[0]), sorted(p.pk for p in self.products[:4]))
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.product_count), ('ACTIVE', 4))
+
+        with self.assertRaises(campaigns.CampaignError):
+            campaigns.apply(campaign)
+
+    def test_rollback_keeps_later_price_changes(self):
+        campaign = PriceCampaign.objects.create(name='Organic', kind='FIXED', value=Decimal('30'), tag=self.organic)
+        campaigns.apply(campaign)
+        self.assertEqual(self.prices()['Bread'], 70)
+        other = PriceCampaign.objects.create(name='All fruit', kind='PERCENT', value=Decimal('10'), category='F')
+        campaigns.apply(other)
+        Product.objects.filter(title='Fruit 1').update(discounted_price=55)
+
+        self.assertEqual(campaigns.rollback(other), 3)
+        self.assertEqual(campaigns.rollback(campaign), 1)
+        prices = self.prices()
+        self.assertEqual([prices[f'Fruit {i}'] for i in range(5)], [50, 55, 200, 600, 500])
+        self.assertEqual(prices['Bread'], 100)
+        self.assertEqual(CampaignPrice.objects.filter(campaign=other).count(), 4)
+
+    def test_overlapping_campaigns_leave_held_products_alone(self):
+        organic = PriceCampaign.objects.create(name='Organic', kind='PERCENT', value=Decimal('20'), tag=self.organic)
+        campaigns.apply(organic)
+        everything = PriceCampaign.objects.create(name='Everything', kind='PERCENT', value=Decimal('50'))
+        # Bread is held by the organic campaign; the four fruit that can drop are repriced
+        self.assertEqual(campaigns.apply(everything), 4)
+        self.assertEqual(self.prices()['Bread'], 80)
+        self.assertFalse(CampaignPrice.objects.filter(campaign=everything, product=self.bread).exists())
+
+        campaigns.rollback(organic)
+        campaigns.rollback(everything)
+        prices = self.prices()
+        self.assertEqual([prices[f'Fruit {i}'] for i in range(5)], [50, 100, 200, 600, 500])
+        self.assertEqual(prices['Bread'], 100)
+
+    def test_scheduled_campaigns_start_and_end(self):
+        now = timezone.now()
+        running = PriceCampaign.objects.create(
+            name='Weekend', kind='PERCENT', value=Decimal('50'), category='B',
+            starts_at=now - timedelta(minutes=1), ends_at=now + timedelta(days=2),
+        )
+        later = PriceCampaign.objects.create(
+            name='Next month', kind='PERCENT', value=Decimal('50'), starts_at=now + timedelta(days=30),
+        )
+        self.assertEqual(campaigns.run_due(now), (1, 0))
+        self.assertEqual(self.prices()['Bread'], 50)
+        self.assertEqual(campaigns.run_due(now + timedelta(days=3)), (0, 1))
+        self.assertEqual(self.prices()['Bread'], 100)
+        running.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((running.status, later.status), ('ENDED', 'SCHEDULED'))
+
+
+class ProductCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pw12345xx')
+        cls.products = Product.objects.bulk_create([
+            Product(
+                title=f'Apple {i}', regular_price=100, discounted_price=90, descriptions='Crisp',
+                category='F', product_image='product_image/test.jpg',
+            )
+            for i in range(5)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        template = Template(
+            '{% load product_cards %}{% product_cards products as cards %}{% for card in cards %}{{ card }}{% endfor %}'
+        )
+        return template.render(Context({'products': Product.objects.order_by('id')}))
+
+    def test_list_uses_one_cache_lookup_and_no_queries_when_warm(self):
+        with CaptureQueriesContext(connection) as cold:
+            first = self.render()
+        # The product list, then ratings and tags for all misses at once
+        self.assertEqual(len(cold), 3)
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self.render(), first)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(len(warm), 1)
+        self.assertEqual(first.count('fruite-item'), 5)
+
+    def test_key_follows_product_tags_and_reviews(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.render()
+        key = cards.key(product)
+
+        Product.objects.filter(pk=product.pk).update(discounted_price=75)
+        product.refresh_from_db()
+        self.assertNotEqual(cards.key(product), key)
+        self.assertIn('75.0৳', self.render())
+
+        tag = Tag.objects.create(name='organic')
+        product.tags.add(tag)
+        self.assertIn('>organic</span>', self.render())
+        tag.name = 'seasonal'
+        tag.save()
+        self.assertIn('>seasonal</span>', self.render())
+        tag.delete()
+        self.assertNotIn('seasonal', self.render())
+
+        order = Order.objects.create(
+            user=self.user, order_number='ORDCARD1', first_name='A', last_name='B', email='a@example.com',
+            phone='01700000000', address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+            payment_method='COD', subtotal=75, total=75, status='DELIVERED',
+        )
+        self.assertNotIn('(1)</span>', self.render())
+        ProductReview.objects.create(product=product, user=self.user, order=order, rating=4, review='Lovely')
+        self.assertIn('(1)</span>', self.render())
+
+    def test_pages_render_cards(self):
+        Tag.objects.create(name='organic').product_set.add(*self.products)
+        for path in (reverse('home'), reverse('shop'), reverse('product_detail', args=[self.products[0].pk])):
+            response = self.client.get(path)
+            self.assertContains(response, 'Apple 4')
+            self.assertContains(response, f'data-product-id="{self.products[1].pk}"')
+
+
+class PrerenderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            title='Golden apple', regular_price=100, discounted_price=90, descriptions='Crisp',
+            category='F', product_image='product_image/test.jpg',
+        )
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings_override = override_settings(PRERENDER_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_snapshots_served_to_anonymous_visitors_only(self):
+        call_command('prerender_pages', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(os.path.join(settings.PRERENDER_ROOT, 'shop', 'Fruits.html.gz')))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Golden apple', gzip.decompress(response.content))
+        self.assertIn('csrftoken', response.cookies)
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertContains(self.client.get(reverse('shop-items', args=['Fruits'])), 'Golden apple')
+
+        self.assertNotIn('Content-Encoding', self.client.get(reverse('home'), {'page': 2}))
+        self.client.force_login(User.objects.create_user('buyer', password='pw12345xx'))
+        response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertContains(response, 'Golden apple')
+
+    def served(self):
+        """Home page HTML if it came from the snapshot, else None"""
+        response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip')
+        return gzip.decompress(response.content) if response.has_header('Content-Encoding') else None
+
+    def test_catalog_change_falls_through_until_the_watcher_rerenders(self):
+        prerender.prerender()
+        version = catalog_version.current()[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Green apple'
+            self.product.save()
+        # The writer only marks the snapshots stale
+        self.assertTrue(prerender.stale())
+        self.assertIsNone(self.served())
+        self.assertContains(self.client.get(reverse('home')), 'Green apple')
+
+        version = prerender.sync(version)
+        self.assertFalse(prerender.stale())
+        self.assertIn(b'Green apple', self.served())
+        with self.assertNumQueries(1):
+            self.assertEqual(prerender.sync(version), version)
+
+    def test_watcher_follows_other_hosts_writes(self):
+        prerender.prerender()
+        version = catalog_version.current()[0]
+        # Another host's write moves the clock but not this host's marker
+        Product.objects.filter(pk=self.product.pk).update(title='Red apple')
+        catalog_version.tick([self.product.pk])
+        self.assertIn(b'Golden apple', self.served())
+
+        prerender.sync(version)
+        self.assertIn(b'Red apple', self.served())
+
+    def test_watch_until_stopped(self):
+        prerender.prerender()
+        stop = mock.Mock(wait=mock.Mock(side_effect=[False, True]))
+        with mock.patch.object(prerender, 'sync', return_value=7) as sync, \
+                mock.patch.object(prerender, 'connection') as worker_connection:
+            prerender.watch(1, 5, stop)
+        sync.assert_called_once_with(5)
+        worker_connection.close.assert_called_once_with()
+
+
+class CatalogVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pw12345xx')
+        cls.apple, cls.pear = Product.objects.bulk_create([
+            Product(
+                title=title, regular_price=100, discounted_price=90, descriptions='Crisp',
+                category='F', product_image='product_image/test.jpg',
+            )
+            for title in ('Apple', 'Pear')
+        ])
+
+    def versions(self):
+        return dict(Product.objects.values_list('title', 'version'))
+
+    def test_signals_move_the_clock_and_stamp_products(self):
+        start = catalog_version.current()[0]
+        self.apple.descriptions = 'Very crisp'
+        self.apple.save()
+        self.assertEqual(self.versions(), {'Apple': start + 1, 'Pear': 0})
+
+        tag = Tag.objects.create(name='organic')
+        tag.product_set.add(self.apple, self.pear)
+        tag.name = 'seasonal'
+        tag.save()
+        self.assertEqual(self.versions(), {'Apple': start + 4, 'Pear': start + 4})
+
+        ProductQuestion.objects.create(product=self.pear, user=self.user, question='Is it sweet?')
+        catalog_changed.send(sender=PriceCampaign, product_ids=[self.apple.pk])
+        self.assertEqual(self.versions(), {'Apple': start + 6, 'Pear': start + 5})
+        self.assertEqual(catalog_version.current()[0], start + 6)
+
+    def test_repeat_anonymous_visits_get_304_without_the_view(self):
+        # A first visit comes without cookies and gets the shared cookieless ETag
+        self.client.get(reverse('home'))
+        for path in (reverse('home'), reverse('shop'), reverse('product_detail', args=[self.apple.pk])):
+            response = self.client.get(path)
+            etag = response['ETag']
+            self.assertTrue(etag.startswith('W/"'))
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        etag = self.client.get(reverse('home'))['ETag']
+        Product.objects.get(pk=self.pear.pk).save()
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified_for_cookieless_clients_only(self):
+        CatalogClock.objects.update_or_create(pk=1, defaults={'changed_at': timezone.now() - timedelta(hours=1)})
+        response = Client().get(reverse('shop'))
+        self.assertIn('Last-Modified', response)
+        since = response['Last-Modified']
+        self.assertEqual(Client().get(reverse('shop'), HTTP_IF_MODIFIED_SINCE=since).status_code, 304)
+
+        self.client.cookies['csrftoken'] = 'x' * 32
+        self.assertNotIn('Last-Modified', self.client.get(reverse('shop')))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('shop'))
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_cookieless_revalidation(self):
+        response = Client().get(reverse('shop'))
+        self.assertEqual(Client().get(reverse('shop'))['ETag'], response['ETag'])
+        with self.assertNumQueries(1):
+            again = Client().get(
+                reverse('shop'), HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+            )
+        self.assertEqual(again.status_code, 304)
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller_user = User.objects.create_user('seller', password='pw12345xx')
+        cls.seller = Seller.objects.create(user=seller_user, shop_name='Green Farm')
+        cls.products = Product.objects.bulk_create([
+            Product(
+                title=f'Item {i}', regular_price=100, discounted_price=price, descriptions='Fresh',
+                category='F' if i % 2 else 'V', product_image='product_image/test.jpg', seller=cls.seller,
+            )
+            for i, price in enumerate([30, 10, 20, 10, 50, 40, 10])
+        ])
+        Tag.objects.create(name='organic').product_set.add(*cls.products[:3])
+        buyer = User.objects.create_user('buyer', password='pw12345xx')
+        ProductReview.objects.create(product=cls.products[0], user=buyer, rating=4, review='Good')
+        ProductReview.objects.create(product=cls.products[0], user=buyer, rating=5, review='Great')
+
+    def get(self, path=None, **params):
+        return self.client.get(path or reverse('api_products'), params)
+
+    def test_sparse_fields_from_values_rows(self):
+        with mock.patch.object(Product, '__init__', side_effect=AssertionError('model instantiated')):
+            response = self.get(fields='id,title,rating,review_count,tags,seller,category_name', category='Vegetable')
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results'][-1]
+        self.assertEqual(first, {
+            'id': self.products[0].pk, 'title': 'Item 0', 'rating': 4.5, 'review_count': 2,
+            'tags': ['organic'], 'seller': 'Green Farm', 'category_name': 'Vegetable',
+        })
+        self.assertEqual(self.get(fields='id,secret').status_code, 400)
+        self.assertEqual(set(self.get(path=reverse('api_product', args=[self.products[1].pk])).json()),
+                         {'id', 'title', 'regular_price', 'discounted_price', 'category', 'image', 'rating', 'review_count'})
+        self.assertEqual(self.get(path=reverse('api_product', args=[0])).status_code, 404)
+
+    def test_shop_filters(self):
+        titles = lambda response: [item['title'] for item in response.json()['results']]
+        self.assertEqual(titles(self.get(fields='title', status='organic', price=25)), ['Item 2', 'Item 1'])
+        self.assertEqual(titles(self.get(fields='title', search='item 5', category='F')), ['Item 5'])
+
+    def test_cursor_pages_cover_every_product_once(self):
+        for sort, expected in (
+            ('newest', [p.pk for p in reversed(self.products)]),
+            ('price', [p.pk for p in sorted(self.products, key=lambda p: (p.discounted_price, p.pk))]),
+            ('-price', [p.pk for p in sorted(self.products, key=lambda p: (-p.discounted_price, -p.pk))]),
+        ):
+            seen, response = [], self.get(fields='id', sort=sort, limit=2)
+            while True:
+                body = response.json()
+                seen += [item['id'] for item in body['results']]
+                if not body['next']:
+                    break
+                response = self.client.get(body['next'])
+            self.assertEqual(seen, expected, sort)
+
+    def test_tampered_cursor_is_a_bad_request(self):
+        for sort, values in (
+            ('newest', [None, 'abc']), ('newest', [5, 5]), ('price', ['x', 5]), ('-price', [10, True]),
+            ('price', [10]), ('newest', {'id': 5}),
+        ):
+            response = self.get(fields='id', sort=sort, cursor=api._encode_cursor(values))
+            self.assertEqual(response.status_code, 400, (sort, values))
+        self.assertEqual(self.get(sort='price', cursor='not base64!').status_code, 400)
+        self.assertEqual(self.get(fields='id', sort='price', cursor=api._encode_cursor([10.0, 0])).status_code, 200)
+
+    def test_gzip_and_etag(self):
+        response = self.client.get(reverse('api_products'), {'limit': 5}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 5)
+        with self.assertNumQueries(1):
+            again = self.client.get(reverse('api_products'), {'limit': 5}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        detail = reverse('api_product', args=[self.products[3].pk])
+        etag = self.client.get(detail)['ETag']
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.seller.shop_name = 'Greener Farm'
+        self.seller.save()
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller_user = User.objects.create_user('seller', password='pw12345xx')
+        cls.seller = Seller.objects.create(user=seller_user, shop_name='Bogura Farms')
+        cls.gourd, cls.beet, cls.bread = Product.objects.bulk_create([
+            Product(
+                title=title, regular_price=100, discounted_price=90, descriptions='Fresh',
+                category='V', product_image='product_image/test.jpg', seller=cls.seller,
+            )
+            for title in ('Bottle_gourd_Leep', 'Bitroot', 'Brown Bread')
+        ])
+        Tag.objects.create(name='bulk').product_set.add(cls.bread)
+        order = Order.objects.create(
+            user=seller_user, order_number='ORDSUGGEST1', first_name='A', last_name='B', email='a@example.com',
+            phone='01700000000', address='Road 1', city='Dhaka', country='Bangladesh', postcode='1207',
+            payment_method='COD', subtotal=270, total=270,
+        )
+        OrderItem.objects.create(order=order, product=cls.beet, quantity=3, price=90, subtotal=270)
+
+    def setUp(self):
+        autocomplete.suggestions.rebuild()
+
+    def suggest(self, q, **params):
+        response = self.client.get(reverse('api_autocomplete'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['kind'], item['name']) for item in response.json()['results']]
+
+    def test_word_prefixes_ranked_by_units_sold(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('b'), [
+                ('product', 'Bitroot'), ('seller', 'Bogura Farms'),
+                ('product', 'Bottle_gourd_Leep'), ('product', 'Brown Bread'), ('tag', 'bulk'),
+            ])
+        self.assertEqual(self.suggest('GOURD  le'), [('product', 'Bottle_gourd_Leep')])
+        self.assertEqual(self.suggest('bread'), [('product', 'Brown Bread')])
+        self.assertEqual(self.suggest('b', limit=2), [('product', 'Bitroot'), ('seller', 'Bogura Farms')])
+        self.assertEqual(self.suggest(' '), [])
+        response = self.client.get(reverse('api_autocomplete'), {'q': 'bul'})
+        self.assertEqual(response.json()['results'][0]['url'], f"{reverse('shop')}?status=bulk")
+
+    def test_signals_update_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beet.title = 'Beetroot'
+            self.beet.save()
+            Tag.objects.create(name='beans')
+            self.bread.delete()
+            self.assertNotIn(('product', 'Beetroot'), self.suggest('be'))
+        self.assertEqual(self.suggest('be'), [('product', 'Beetroot'), ('tag', 'beans')])
+        self.assertEqual(self.suggest('bread'), [])
+
+    def test_sync_follows_names_only(self):
+        names = catalog_version.names()
+        ProductReview.objects.create(product=self.beet, user=self.seller.user, rating=5, review='Sweet')
+        version = catalog_version.current()[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            campaigns.apply(PriceCampaign.objects.create(name='Beet week', kind='PERCENT', value=Decimal('50')))
+        self.assertEqual(catalog_version.current()[0], version + 1)
+        self.assertEqual(catalog_version.names(), names)
+        self.seller.shop_name = 'Bogura Fresh'
+        self.seller.save()
+        self.assertEqual(catalog_version.names(), names + 1)
+
+    def test_sync_thread_starts_in_each_serving_process(self):
+        suggestions = autocomplete.Suggestions()
+        with mock.patch.object(autocomplete.threading, 'Thread') as thread, \
+                mock.patch.object(autocomplete.os, 'getpid', return_value=100) as getpid:
+            suggestions.lookup('b')
+            thread.assert_not_called()
+            suggestions.start()
+            thread.assert_not_called()
+            suggestions.lookup('b')
+            suggestions.lookup('bi')
+            self.assertEqual(thread.call_count, 1)
+            # A worker forked from the master that called start()
+            getpid.return_value = 101
+            suggestions.lookup('b')
+            self.assertEqual(thread.call_count, 2)
+
+    def test_broad_prefixes_match_a_full_scan(self):
+        """Precomputed best entries stay equal to a scan through updates"""
+        rng = np.random.default_rng(7)
+        words = ['potato', 'pot', 'pumpkin', 'papaya', 'pea', 'apple']
+        entries = [
+            (('product', pk), f'{words[rng.integers(len(words))]} {words[rng.integers(len(words))]}', int(rng.integers(50)))
+            for pk in range(2000)
+        ]
+        index = autocomplete.PrefixIndex(entries)
+        self.assertIn('p', index.top)
+        for pk in range(0, 2000, 7):
+            index.put(('product', pk), f'{words[rng.integers(len(words))]} {pk}')
+        for pk in range(1, 2000, 5):
+            index.remove(('product', pk))
+        for prefix in ('p', 'po', 'pot', 'potato p', 'pu', 'a', 'apple 1'):
+            lo, hi = index._range(prefix)
+            expected = index._best(lo, hi)
+            self.assertEqual([entry[:2] for entry in index.lookup(prefix)], expected, prefix)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'pg_trgm is PostgreSQL only')
+class TrigramThresholdTests(TransactionTestCase):
+    def test_threshold_stays_with_the_search(self):
+        if not fuzzy.trigram_enabled('default'):
+            self.skipTest('pg_trgm is not installed')
+        Product.objects.create(
+            title='Bitroot 1kg', regular_price=100, discounted_price=90, descriptions='Fresh',
+            category='V', product_image='product_image/test.jpg',
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('pg_trgm.word_similarity_threshold')")
+            before = cursor.fetchone()[0]
+            self.assertTrue(fuzzy.search('bitrot'))
+            cursor.execute("SELECT current_setting('pg_trgm.word_similarity_threshold')")
+            self.assertEqual(cursor.fetchone()[0], before)
+
+
+class FuzzySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.beet, cls.gourd, cls.bread = Product.objects.bulk_create([
+            Product(
+                title=title, regular_price=100, discounted_price=90, descriptions='Fresh',
+                category='V', product_image='product_image/test.jpg',
+            )
+            for title in ('Bitroot 1kg', 'Bottle_gourd_Leep', 'Brown Bread')
+        ])
+
+    def setUp(self):
+        patcher = mock.patch.object(fuzzy, 'index', fuzzy.TrigramIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def titles(self, query):
+        ids = [pk for pk, _ in fuzzy.search(query)]
+        return [Product.objects.get(pk=pk).title for pk in ids]
+
+    def test_near_spellings_rank_first(self):
+        self.assertEqual(self.titles('bitrot')[0], 'Bitroot 1kg')
+        self.assertEqual(self.titles('botle gourd')[0], 'Bottle_gourd_Leep')
+        self.assertEqual(self.titles('brwn bred')[0], 'Brown Bread')
+        self.assertEqual(self.titles('zzzz'), [])
+
+    def test_did_you_mean(self):
+        self.assertEqual(fuzzy.did_you_mean('bitrot 1kg', ['Bitroot 1kg']), 'Bitroot 1kg')
+        self.assertIsNone(fuzzy.did_you_mean('bitroot', ['Bitroot 1kg']))
+        self.assertIsNone(fuzzy.did_you_mean('zzzz', ['Bitroot 1kg']))
+
+    def test_shop_falls_back_to_fuzzy_matches(self):
+        response = self.client.get(reverse('shop'), {'search': 'Bitrot'})
+        self.assertEqual(response.context['did_you_mean'], 'Bitroot')
+        self.assertEqual([p.pk for p in response.context['products']][:1], [self.beet.pk])
+        self.assertContains(response, 'Did you mean')
+        exact = self.client.get(reverse('shop'), {'search': 'Bitroot'})
+        self.assertIsNone(exact.context['did_you_mean'])
+
+    def test_filters_apply_before_the_limit(self):
+        juice = Product.objects.create(
+            title='Bitroot juice', regular_price=100, discounted_price=90, descriptions='Fresh',
+            category='B', product_image='product_image/test.jpg',
+        )
+        self.assertEqual([pk for pk, _ in fuzzy.search('bitrot', limit=1)], [self.beet.pk])
+        drinks = Product.objects.filter(category='B')
+        with mock.patch.object(fuzzy, 'FILTER_CHUNK', 1):
+            self.assertEqual([pk for pk, _ in fuzzy.search('bitrot', limit=1, products=drinks)], [juice.pk])
+        ranked, _ = fuzzy.search_products(drinks, 'bitrot', limit=1)
+        self.assertEqual(list(ranked), [juice])
+
+    def test_follows_catalog_changes(self):
+        self.assertEqual(self.titles('bitrot')[0], 'Bitroot 1kg')
+        self.beet.title = 'Beetroot 1kg'
+        self.beet.save()
+        self.bread.delete()
+        self.assertEqual(self.titles('betroot')[0], 'Beetroot 1kg')
+        self.assertNotIn('Brown Bread', self.titles('brwn bred'))
+
+
+class PriceFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        prices = {'F': [10, 49.99, 50, 120, 2500], 'V': [99.99, 100, 480, 950]}
+        cls.products = Product.objects.bulk_create([
+            Product(
+                title=f'{category} {price}', regular_price=price, discounted_price=price, descriptions='Fresh',
+                category=category, product_image='product_image/test.jpg',
+            )
+            for category, category_prices in prices.items() for price in category_prices
+        ])
+        organic = Tag.objects.create(name='Organic')
+        organic.product_set.add(*[p for p in cls.products if p.discounted_price < 100])
+        Tag.objects.create(name='unused')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_match_queries(self):
+        facets = price_facets.compute()
+        for category, tags in ((None, []), ('F', []), ('V', []), (None, ['organic']), ('F', ['organic'])):
+            products = Product.objects.all()
+            if category:
+                products = products.filter(category=category)
+            if tags:
+                products = products.filter(tags__name__iexact=tags[0])
+            expected = [
+                products.filter(discounted_price__gte=band['min'], **(
+                    {'discounted_price__lt': round(band['max'] + CENT, 2)} if band['max'] is not None else {}
+                )).count()
+                for band in price_facets.bands([0] * len(price_facets.BANDS))
+            ]
+            self.assertEqual(price_facets.scope_counts(facets, category, tags), expected, (category, tags))
+        self.assertEqual(price_facets.scope_counts(facets, 'M'), [0] * len(price_facets.BANDS))
+        self.assertEqual(price_facets.scope_counts(facets, None, ['unused']), [0] * len(price_facets.BANDS))
+        self.assertIsNone(price_facets.scope_counts(facets, None, ['organic', 'fresh']))
+        self.assertIsNone(price_facets.scope_counts(facets, 'F', search='apple'))
+        self.assertIsNone(price_facets.scope_counts(facets, seller='3'))
+
+    def test_sub_cent_price_counted_where_its_link_finds_it(self):
+        Product.objects.create(
+            title='F 49.995', regular_price=49.995, discounted_price=49.995, descriptions='Fresh',
+            category='F', product_image='product_image/test.jpg',
+        )
+        first = price_facets.bands(price_facets.scope_counts(price_facets.compute(), 'F'))[0]
+        self.assertEqual(first['count'], 3)
+        params = QueryDict(mutable=True)
+        params.update({'min_price': first['min'], 'max_price': first['max']})
+        self.assertEqual(filter_products(Product.objects.filter(category='F'), params).count(), 3)
+
+    def test_cached_per_prices_version(self):
+        version = catalog_version.prices()
+        price_facets.get(version)
+        with self.assertNumQueries(0):
+            self.assertEqual(price_facets.get(version)['category']['V'], [0, 1, 1, 1, 1, 0, 0])
+        # Reviews move the catalog clock but not the prices
+        ProductReview.objects.create(
+            product=self.products[0], user=User.objects.create_user('critic', password='x'), rating=4, review='Good',
+        )
+        self.assertEqual(catalog_version.prices(), version)
+        product = self.products[-1]
+        product.discounted_price = 10
+        product.save()
+        self.assertEqual(price_facets.get(catalog_version.prices())['category']['V'], [1, 1, 1, 1, 0, 0, 0])
+
+    def test_recompute_in_progress_serves_last_counts(self):
+        version = catalog_version.prices()
+        counts = price_facets.get(version)
+        cache.add(f'price-facets:{price_facets.FACETS_VERSION}:{version + 1}:lock', True)
+        with self.assertNumQueries(0):
+            self.assertEqual(price_facets.get(version + 1), counts)
+
+    def test_shop_range_filter_and_sidebar(self):
+        response = self.client.get(reverse('shop-items', args=['Fruits']), {'min_price': 49.99, 'max_price': '120'})
+        self.assertEqual(sorted(p.discounted_price for p in response.context['products']), [49.99, 50, 120])
+        bands = response.context['price_bands']
+        self.assertEqual([band['count'] for band in bands], [2, 1, 1, 0, 0, 0, 1])
+        self.assertEqual(bands[1]['query'], 'min_price=50&max_price=99.99')
+        self.assertEqual(bands[-1]['max'], None)
+        self.assertEqual({c['name']: c['count'] for c in response.context['categories']}['Vegetables'], 4)
+        # Searches, including the fuzzy fallback, narrow past what the bands count
+        for search in ('F 1', 'F 12O'):
+            response = self.client.get(reverse('shop-items', args=['Fruits']), {'search': search})
+            self.assertTrue(response.context['products'])
+            self.assertEqual(response.context['price_bands'], [])
+        ignored = self.client.get(reverse('shop'), {'min_price': 'nan', 'max_price': 'cheap'})
+        self.assertEqual(ignored.context['products'].paginator.count, len(self.products))
@@ -1,7 +1,5 @@
 from django.urls import path
-from shop import views
-from django.conf import settings
-from django.conf.urls.static import static
+from shop import api, views
 from django.contrib.auth import views as auth_view
 from .forms import LoginForm, PassChangeForm, MyPasswordResetForm, MySetPasswordForm
 
@@ -21,6 +19,13 @@ urlpatterns = [
     path('testimonial/', views.testimonial, name='testimonial'),
     path('profile/', views.profile, name='profile'),
     path('404-page/', views.E_page, name='404-page'),
+    path('metrics/', views.metrics, name='metrics'),
+
+    # Read-only JSON catalog API (shop.api)
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/<int:pk>/', api.product, name='api_product'),
+    path('api/tags/', api.tags, name='api_tags'),
+    path('api/autocomplete/', api.autocomplete, name='api_autocomplete'),
 
     # Authentication URLs
     path('Registration/', views.userregistration.as_view(), name='registration'),
@@ -43,6 +48,3 @@ urlpatterns = [
     path('update-cart-item/', views.update_cart_item, name='update_cart_item'),
     path('remove-from-cart/', views.remove_from_cart, name='remove_from_cart'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -2,11 +2,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.utils.crypto import get_random_string
 from django.db import transaction
-from django.db.models import Q, Count, Sum, Avg
+from django.db.models import Count, Sum, Avg, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views import View
 from django.contrib.auth.views import LoginView
 from django.utils.decorators import method_decorator
@@ -14,7 +15,15 @@ from django.core.exceptions import ValidationError
 import logging
 from django.core.paginator import Paginator
 from django.utils import timezone
-from .models import Product, UserProfile, Cart, CartItem, Order, OrderItem, Tag, ProductReview, ProductQuestion
+from .models import Product, UserProfile, Cart, CartItem, Order, OrderItem, Tag, ProductReview, ProductQuestion, ArchivedOrder
+from .archive import restore
+from .cart import SessionCart
+from . import catalog_version, fuzzy, inventory, price_facets
+from .catalog_version import conditional
+from .filters import filter_products
+from .middleware import registry
+from .order_numbers import create_order, lookup as order_lookup
+from .order_status import record_created
 from .forms import (
     UserRegForm, 
     LoginForm, 
@@ -43,6 +52,7 @@ def get_cart(request):
 
 #home and product view
 
+@method_decorator(conditional, name='get')
 class ProductView(View):
     """Home page view displaying products by category"""
     def get(self, request):
@@ -69,46 +79,59 @@ class ProductView(View):
     
 
 
+# Category landing pages: shop/<slug>/
+CATEGORY_SLUGS = {
+    'Dryfruits': 'DF',
+    'Fish': 'FH',
+    'Fruits': 'F',
+    'Vegetable': 'V',
+    'meat': 'M',
+}
+
+
+def _price_bands(request, facets, category):
+    """Sidebar price bands with counts and the query string that selects each"""
+    counts = price_facets.scope_counts(
+        facets, category, request.GET.getlist('status'), request.GET.get('search'), request.GET.get('seller'),
+    )
+    if counts is None:
+        return []
+    params = request.GET.copy()
+    for name in ('page', 'price', 'min_price', 'max_price'):
+        params.pop(name, None)
+    bands = price_facets.bands(counts)
+    for band in bands:
+        query = params.copy()
+        query['min_price'] = band['min']
+        if band['max'] is not None:
+            query['max_price'] = band['max']
+        band['query'] = query.urlencode()
+        band['active'] = request.GET.get('min_price') == str(band['min'])
+    return bands
+
+
+@conditional
 def shop(request, data=None):
     """Shop page with filtering, searching, and pagination"""
     try:
         products = Product.objects.all()
 
         # Category filter from URL slug
-        if data:
-            category_map = {
-                'Dryfruits': 'DF',
-                'Fish': 'FH',
-                'Fruits': 'F',
-                'Vegetable': 'V',
-                'meat': 'M',
-            }
-            cat_code = category_map.get(data)
-            if cat_code:
-                products = products.filter(category=cat_code)
-
-        # Price filter
-        price = request.GET.get('price')
-        if price:
-            try:
-                products = products.filter(discounted_price__lte=int(price))
-            except (ValueError, TypeError):
-                pass
-
-        # Status (tags) filter
-        status_list = request.GET.getlist('status')
-        if status_list:
-            q = Q()
-            for status in status_list:
-                q |= Q(tags__name__iexact=status)
-            products = products.filter(q).distinct()
-
-        # Search filter
-        search = request.GET.get('search')
-        if search:
-            products = products.filter(
-                Q(title__icontains=search) | Q(descriptions__icontains=search)
-            )
+        cat_code = CATEGORY_SLUGS.get(data) if data else None
+        if cat_code:
+            products = products.filter(category=cat_code)
+
+        # Price, status (tags) and search filters
+        unsearched = products
+        products = filter_products(products, request.GET)
+
+        # Nothing contains the search as typed: rank close spellings instead
+        search = request.GET.get('search', '').strip()
+        did_you_mean = None
+        if search and not products.exists():
+            params = request.GET.copy()
+            del params['search']
+            products, did_you_mean = fuzzy.search_products(filter_products(unsearched, params), search)
 
         # Sorting
         sort = request.GET.get('sort')
@@ -124,13 +147,15 @@ def shop(request, data=None):
             tag_count=Count('tags')
         ).filter(tag_count__gt=0).order_by('-tag_count')[:3]
 
-        # Category list with counts
+        # Category and price band counts, precomputed per prices version
+        facets = price_facets.get(catalog_version.prices_for(request))
+        totals = {code: sum(counts) for code, counts in facets['category'].items()}
         categories = [
-            {'name': 'Dryfruits', 'count': Product.objects.filter(category='DF').count(), 'url': 'Dryfruits'},
-            {'name': 'Fishs', 'count': Product.objects.filter(category='FH').count(), 'url': 'Fish'},
-            {'name': 'Fruits', 'count': Product.objects.filter(category='F').count(), 'url': 'Fruits'},
-            {'name': 'Vegetables', 'count': Product.objects.filter(category='V').count(), 'url': 'Vegetable'},
-            {'name': 'Meats', 'count': Product.objects.filter(category='M').count(), 'url': 'meat'},
+            {'name': 'Dryfruits', 'count': totals.get('DF', 0), 'url': 'Dryfruits'},
+            {'name': 'Fishs', 'count': totals.get('FH', 0), 'url': 'Fish'},
+            {'name': 'Fruits', 'count': totals.get('F', 0), 'url': 'Fruits'},
+            {'name': 'Vegetables', 'count': totals.get('V', 0), 'url': 'Vegetable'},
+            {'name': 'Meats', 'count': totals.get('M', 0), 'url': 'meat'},
         ]
 
         # Pagination
@@ -142,6 +167,8 @@ def shop(request, data=None):
             'products': products,
             'featured_products': featured_products,
             'categories': categories,
+            'price_bands': _price_bands(request, facets, cat_code),
+            'did_you_mean': did_you_mean,
         }
         return render(request, 'shop/shop.html', context)
     
@@ -153,6 +180,7 @@ def shop(request, data=None):
 
 
 
+@method_decorator(conditional, name='get')
 class ProductDetails(View):
     """Product detail page with reviews and public Q&A"""
     def get(self, request, pk):
@@ -312,17 +340,17 @@ class ProductDetails(View):
 # CART VIEWS
 # ============================================================
 
-@login_required
 def cart(request):
-    """Display user's shopping cart"""
+    """Display user's shopping cart (session cart for guests)"""
     try:
         user_cart = get_cart(request)
         if user_cart:
-            cart_items = user_cart.items.all()
+            cart_items = user_cart.items.select_related('product')
             total = user_cart.total()
         else:
-            cart_items = []
-            total = 0
+            session_cart = SessionCart(request)
+            cart_items = session_cart.items()
+            total = session_cart.total(cart_items)
         
         context = {
             'cart_items': cart_items,
@@ -398,20 +426,19 @@ def chackout(request):
                 shipping_cost = shipping_costs.get(shipping_method, 0.00)
                 total = float(subtotal) + shipping_cost
                 
-                # Generate order number
-                order_number = f"ORD{get_random_string(10).upper()}"
-                
                 print(f"\n Order Calculation:")
                 print(f"  Subtotal: ${subtotal}")
                 print(f"  Shipping: ${shipping_cost}")
                 print(f"  Total: ${total}")
-                print(f"  Order Number: {order_number}")
                 
-                # Create Order
+                # Create Order (a fresh time-ordered number is drawn if one collides)
                 with transaction.atomic():
-                    order = Order.objects.create(
+                    # Stock first: the reservation made on GET, or a conditional decrement
+                    inventory.commit(request.user, {item.product_id: item.quantity for item in cart_items})
+                    order = create_order(lambda order_number, created_at: Order.objects.create(
                         user=request.user,
                         order_number=order_number,
+                        created_at=created_at,
                         first_name=first_name,
                         last_name=last_name,
                         company_name=company_name,
@@ -428,9 +455,10 @@ def chackout(request):
                         total=total,
                         notes=notes,
                         status='PENDING'
-                    )
+                    ))
+                    order_number = order.order_number
                     
-                    print(f" Order created: {order.id}")
+                    print(f" Order created: {order.id} ({order_number})")
                     
                     # Create Order Items
                     for item in cart_items:
@@ -443,6 +471,9 @@ def chackout(request):
                         )
                         print(f"  - Added: {order_item}")
                     
+                    # One SellerOrder per seller, plus the first status events
+                    record_created(order, actor=request.user)
+                    
                     # Clear cart
                     cart_items.delete()
                     print(" Cart cleared")
@@ -454,13 +485,22 @@ def chackout(request):
                 messages.success(request, f"Order placed successfully! Order Number: {order_number}")
                 return redirect('order_confirmation', order_number=order_number)
             
+            except inventory.OutOfStock as e:
+                messages.error(request, str(e))
+                return redirect('cart')
             except Exception as e:
                 print(f"\n ERROR creating order: {str(e)}")
                 import traceback
                 traceback.print_exc()
                 messages.error(request, f"Error: {str(e)}")
         
-        # GET request - display form
+        # GET request - display form, holding the cart's stock while the form is filled in
+        if request.method == 'GET' and cart_items:
+            try:
+                inventory.reserve(request.user, {item.product_id: item.quantity for item in cart_items})
+            except inventory.OutOfStock as e:
+                messages.error(request, str(e))
+                return redirect('cart')
         context = {
             'cart_items': cart_items,
             'subtotal': subtotal,
@@ -485,8 +525,8 @@ def chackout(request):
 def order_confirmation(request, order_number):
     """Order confirmation page"""
     try:
-        order = get_object_or_404(Order, order_number=order_number, user=request.user)
-        order_items = order.items.all()
+        order = get_object_or_404(Order, **order_lookup(order_number), user=request.user)
+        order_items = order.items.select_related('product')
         
         context = {
             'order': order,
@@ -502,10 +542,14 @@ def order_confirmation(request, order_number):
 
 @login_required
 def order_detail(request, order_number):
-    """Order detail page"""
+    """Order detail page (falls back to the archive for old closed orders)"""
     try:
-        order = get_object_or_404(Order, order_number=order_number, user=request.user)
-        order_items = order.items.all()
+        order = Order.objects.filter(**order_lookup(order_number), user=request.user).first()
+        if order is not None:
+            order_items = order.items.select_related('product')
+        else:
+            archived = get_object_or_404(ArchivedOrder, order_number=order_number, user=request.user)
+            order, order_items = restore(archived)
         
         context = {
             'order': order,
@@ -596,9 +640,16 @@ def profile(request):
                 messages.error(request, "An error occurred while updating your profile.")
                 return redirect('profile')
         
+        # Correlated count rather than annotate(Count('items')): grouping by the
+        # order id alone is invalid on PostgreSQL, whose partitioned shop_order
+        # has the primary key (id, created_at)
+        item_counts = (
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+            .values('order').annotate(n=Count('pk')).values('n')
+        )
         context = {
             'user_profile': user_profile,
-            'orders': orders[:5],
+            'orders': orders.annotate(item_count=Coalesce(Subquery(item_counts), 0))[:5],
             'total_orders': total_orders,
             'pending_orders': pending_orders,
             'completed_orders': completed_orders,
@@ -671,13 +722,21 @@ def add_to_cart(request):
     """Add product to cart via AJAX"""
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         try:
-            if not request.user.is_authenticated:
-                return JsonResponse({'success': False, 'redirect': '/account/Login/'})
-            
             product_id = request.POST.get('product_id')
-            quantity = int(request.POST.get('quantity', 1))
+            quantity = max(1, int(request.POST.get('quantity', 1)))
             
             product = get_object_or_404(Product, id=product_id)
+
+            # Guests: session only, no cart table writes
+            if not request.user.is_authenticated:
+                session_cart = SessionCart(request)
+                session_cart.add(product.id, quantity)
+                return JsonResponse({
+                    'success': True,
+                    'total_items': len(session_cart),
+                    'cart_total': session_cart.total()
+                })
+
             cart = get_cart(request)
             
             cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
@@ -702,11 +761,23 @@ def update_cart_item(request):
     """Update cart item quantity via AJAX"""
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         try:
-            if not request.user.is_authenticated:
-                return JsonResponse({'success': False, 'redirect': '/account/Login/'})
-            
             item_id = request.POST.get('item_id')
             action = request.POST.get('action')
+
+            # Guest cart lines are keyed by product id
+            if not request.user.is_authenticated:
+                session_cart = SessionCart(request)
+                new_quantity = session_cart.update(int(item_id), action)
+                if new_quantity is None:
+                    return JsonResponse({'success': False}, status=404)
+                items = session_cart.items()
+                subtotal = next((i.subtotal() for i in items if i.id == int(item_id)), 0)
+                return JsonResponse({
+                    'success': True,
+                    'new_quantity': new_quantity,
+                    'subtotal': subtotal,
+                    'cart_total': session_cart.total(items)
+                })
             
             item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
             
@@ -735,10 +806,16 @@ def remove_from_cart(request):
     """Remove item from cart via AJAX"""
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         try:
-            if not request.user.is_authenticated:
-                return JsonResponse({'success': False, 'redirect': '/account/Login/'})
-            
             item_id = request.POST.get('item_id')
+
+            if not request.user.is_authenticated:
+                session_cart = SessionCart(request)
+                session_cart.remove(int(item_id))
+                return JsonResponse({
+                    'success': True,
+                    'cart_total': session_cart.total()
+                })
+
             item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
             cart = item.cart
             item.delete()
@@ -753,12 +830,15 @@ def remove_from_cart(request):
             return JsonResponse({'success': False, 'error': 'An error occurred'}, status=500)
     
     return JsonResponse({'success': False}, status=400)
-@login_required
 def add_to_cart_view(request, pk):
     """Standard POST add to cart (not AJAX)"""
     product = get_object_or_404(Product, pk=pk)
+    quantity = max(1, int(request.POST.get('quantity', 1)))
+    if not request.user.is_authenticated:
+        SessionCart(request).add(product.id, quantity)
+        messages.success(request, f"{product.title} added to cart!")
+        return redirect('product_detail', pk=pk)
     cart, created = Cart.objects.get_or_create(user=request.user)
-    quantity = int(request.POST.get('quantity', 1))
     cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
     if not created:
         cart_item.quantity += quantity
@@ -767,3 +847,9 @@ def add_to_cart_view(request, pk):
     return redirect('product_detail', pk=pk)
 def about(request):
     return render(request, 'shop/about.html')
+
+
+@staff_member_required
+def metrics(request):
+    """Per-view request metrics of this process in Prometheus text format"""
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')